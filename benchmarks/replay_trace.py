@@ -0,0 +1,383 @@
+"""Replay a recorded watcher event trace against SyncManager.
+
+Traces are recorded by setting `event_trace` in the sync settings to a file
+path. The replay re-creates the traced files in a scratch directory and feeds
+the events to SyncManager's watcher handlers on the original timeline, while
+sync workers talk to an in-memory fake transport with a fixed round-trip time
+and bandwidth. It reports how many directory rescans, local scans, sync
+cycles and uploads the trace caused, and the latency from the first event for
+a file to the end of its upload.
+
+    python benchmarks/replay_trace.py events.trace.gz --rtt-ms 40 --speed 4
+"""
+import argparse
+import io
+import math
+import os
+import sys
+import tarfile
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PySide6.QtCore import QCoreApplication, QFileSystemWatcher, QTimer  # noqa: E402
+from core.sync.event_trace import (  # noqa: E402
+    read_trace, TRACE_DIRECTORY, TRACE_FILE, TRACE_NEW_FILE
+)
+from core.sync.path_table import FLAG_PENDING, FLAG_REMOTE, FLAG_SENT  # noqa: E402
+from core.ssh.remote_session import RemoteRequest  # noqa: E402
+from core.sync.sync_manager import SyncManager, SyncWorker  # noqa: E402
+
+DRAIN_CHECK_MS = 100  # How often to check for outstanding uploads after the last event
+
+
+class ReplayStats:
+    """Counters shared between the GUI thread and sync workers"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = {'rescans': 0, 'local_scans': 0, 'syncs': 0, 'uploads': 0, 'bytes': 0}
+        self.pending_since = {}  # Relative path -> monotonic time of its first event
+        self.latencies = []
+
+    def count(self, name, amount=1):
+        with self._lock:
+            self.counts[name] += amount
+
+    def mark_pending(self, rel_path):
+        with self._lock:
+            self.pending_since.setdefault(rel_path, time.monotonic())
+
+    def uploaded(self, rel_path, size):
+        with self._lock:
+            self.counts['uploads'] += 1
+            self.counts['bytes'] += size
+            started = self.pending_since.pop(rel_path, None)
+            if started is not None:
+                self.latencies.append(time.monotonic() - started)
+
+    def outstanding(self):
+        with self._lock:
+            return len(self.pending_since)
+
+
+class FakeRemote:
+    """In-memory remote tree with simulated round trips and bandwidth"""
+
+    def __init__(self, rtt, bandwidth):
+        self.rtt = rtt
+        self.bandwidth = bandwidth
+        self.files = {}
+        self._lock = threading.Lock()
+
+    def round_trip(self, count=1):
+        time.sleep(self.rtt * count)
+
+    def store(self, rel_path, size):
+        time.sleep(self.rtt + size / self.bandwidth)
+        with self._lock:
+            self.files[rel_path] = (size, time.time())
+
+    def store_bundle(self, sizes, wire_bytes):
+        """Store a tar bundle: two round trips for the whole stream"""
+        time.sleep(2 * self.rtt + wire_bytes / self.bandwidth)
+        now = time.time()
+        with self._lock:
+            for rel_path, size in sizes:
+                self.files[rel_path] = (size, now)
+
+    def listing(self):
+        with self._lock:
+            return list(self.files.items())
+
+
+class FakeSession:
+    """Remote session stand-in; pipelined metadata calls succeed"""
+
+    def call(self, command, timeout=None):
+        request = RemoteRequest(0, command, timeout)
+        request.status = 0
+        request.done = True
+        return request
+
+    def run_many(self, commands):
+        return [self.call(command) for command in commands]
+
+
+class FakeChannel:
+    """Channel that unpacks the tar stream sent by send_tar into the FakeRemote"""
+
+    def __init__(self, remote):
+        self.remote = remote
+        self.data = bytearray()
+
+    def exec_command(self, command):
+        pass
+
+    def sendall(self, data):
+        self.data += data
+
+    def shutdown_write(self):
+        with tarfile.open(fileobj=io.BytesIO(bytes(self.data))) as tar:
+            sizes = [(member.name, member.size) for member in tar.getmembers()]
+        self.remote.store_bundle(sizes, len(self.data))
+
+    def makefile_stderr(self, mode='rb'):
+        return io.BytesIO()
+
+    def recv_exit_status(self):
+        return 0
+
+    def close(self):
+        pass
+
+
+class FakeTransport:
+    def __init__(self, remote):
+        self.remote = remote
+
+    def open_session(self, timeout=None):
+        return FakeChannel(self.remote)
+
+
+class FakeSSHClient:
+    """Just enough of SSHClient for SyncWorker.sync_now"""
+
+    def __init__(self, remote):
+        self.remote = remote
+
+    def ensure_connected(self):
+        pass
+
+    def clear_stat_cache(self):
+        pass
+
+    def session_call(self, operation):
+        self.remote.round_trip()
+        return operation(FakeSession())
+
+    def run(self, operation):
+        return operation(self)
+
+    def get_transport(self):
+        return FakeTransport(self.remote)
+
+
+class ReplayWorker(SyncWorker):
+    """SyncWorker whose transport is a FakeRemote"""
+    remote = None
+    stats = None
+
+    def __init__(self, config, path_table=None):
+        super().__init__(config, path_table)
+        self.ssh_client = FakeSSHClient(self.remote)
+
+    def sync_now(self):
+        self.stats.count('syncs')
+        return super().sync_now()
+
+    def _scan_local_files(self, path):
+        self.stats.count('local_scans')
+        super()._scan_local_files(path)
+
+    def _mark_sent(self, file_id):
+        # Bundled uploads; single uploads are counted in _upload_file
+        super()._mark_sent(file_id)
+        self.stats.uploaded(self.path_table.path(file_id), self.path_table.sizes[file_id])
+
+    def fetch_remote_filelist(self):
+        # find + scp of the listing + rm of the listing
+        self.remote.round_trip(3)
+        for rel_path, (size, mtime) in self.remote.listing():
+            self.path_table.add_remote(rel_path, size, mtime)
+
+    def _upload_file(self, file_id, local_path, remote_base, verify):
+        table = self.path_table
+        rel_path = table.path(file_id)
+        try:
+            size = (local_path / rel_path).stat().st_size
+        except OSError:
+            return None
+        self.remote.store(rel_path, size)
+        table.set_flag(file_id, FLAG_SENT | FLAG_REMOTE)
+        table.clear_flag(FLAG_PENDING, (file_id,))
+        self.stats.uploaded(rel_path, size)
+        return None
+
+
+class ReplayManager(SyncManager):
+    """SyncManager that counts directory rescans and uses ReplayWorker"""
+    worker_class = ReplayWorker
+    stats = None
+
+    def _on_directory_changed(self, path):
+        self.stats.count('rescans')
+        super()._on_directory_changed(path)
+
+
+class ReplayConfig:
+    """ConfigManager stand-in pointing at the scratch directory"""
+
+    def __init__(self, local_path, auto_sync):
+        self.ssh = {'hostname': 'replay', 'username': 'replay', 'remote_path': '/replay',
+                    'ssh_key': '', 'password': ''}
+        self.sync = {'auto_sync': auto_sync, 'sync_interval': 300, 'local_path': local_path,
+                     'journal': False, 'streaming_compare': False}
+        self.transport = {}
+
+    def get_ssh_settings(self):
+        return self.ssh
+
+    def get_sync_settings(self):
+        return self.sync
+
+    def get_transport_settings(self):
+        return self.transport
+
+    def get_targets(self):
+        return []
+
+
+def build_steps(events):
+    """Attach files found by each directory rescan to the event that caused it.
+
+    The recorder logs new files after the directory event that revealed
+    them, but on replay they must exist before the rescan runs.
+    """
+    steps = []
+    for event in events:
+        if event.kind == TRACE_NEW_FILE and steps and steps[-1][0].kind == TRACE_DIRECTORY:
+            steps[-1][1].append(event)
+        else:
+            steps.append((event, []))
+    return steps
+
+
+def write_file(path, size):
+    """Create or modify a file so it has the traced size and a new mtime"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'ab') as f:
+        f.truncate(max(size, 0))
+    os.utime(path)
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a sorted list"""
+    if not values:
+        return 0.0
+    rank = math.ceil(pct / 100.0 * len(values))
+    return values[max(0, min(len(values), rank) - 1)]
+
+
+def replay(trace_path, rtt, bandwidth, speed, auto_sync, drain_timeout):
+    app = QCoreApplication.instance() or QCoreApplication(sys.argv)
+    steps = build_steps(read_trace(trace_path))
+    stats = ReplayStats()
+    ReplayWorker.remote = FakeRemote(rtt, bandwidth)
+    ReplayWorker.stats = stats
+    ReplayManager.stats = stats
+
+    scratch = tempfile.TemporaryDirectory(prefix='gosync-replay-')
+    local_base = Path(scratch.name)
+    manager = ReplayManager(ReplayConfig(str(local_base), auto_sync))
+    if auto_sync:
+        manager.start_sync()
+        # Only replayed events may drive the handlers
+        manager.watcher.directoryChanged.disconnect()
+        manager.watcher.fileChanged.disconnect()
+    else:
+        manager.watcher = QFileSystemWatcher()
+
+    kinds = {TRACE_DIRECTORY: 0, TRACE_FILE: 0, TRACE_NEW_FILE: 0}
+    state = {'index': 0, 'start': time.monotonic(), 'drain_start': None}
+
+    def _apply(event, found):
+        kinds[event.kind] = kinds.get(event.kind, 0) + 1
+        path = local_base / event.rel_path
+        if event.kind == TRACE_DIRECTORY:
+            path.mkdir(parents=True, exist_ok=True)
+            for new_file in found:
+                kinds[TRACE_NEW_FILE] += 1
+                write_file(local_base / new_file.rel_path, new_file.size)
+                stats.mark_pending(new_file.rel_path)
+            manager._on_directory_changed(str(path))
+        elif event.kind == TRACE_FILE:
+            if event.size >= 0:
+                write_file(path, event.size)
+                stats.mark_pending(event.rel_path)
+            elif path.exists():
+                path.unlink()
+            manager._on_file_changed(str(path))
+        elif event.kind == TRACE_NEW_FILE:
+            write_file(path, event.size)
+            stats.mark_pending(event.rel_path)
+
+    def _dispatch():
+        elapsed = (time.monotonic() - state['start']) * speed if speed else float('inf')
+        while state['index'] < len(steps) and steps[state['index']][0].time <= elapsed:
+            event, found = steps[state['index']]
+            state['index'] += 1
+            _apply(event, found)
+        if state['index'] < len(steps):
+            delay = (steps[state['index']][0].time - elapsed) / speed
+            QTimer.singleShot(max(0, int(delay * 1000)), _dispatch)
+        else:
+            state['drain_start'] = time.monotonic()
+            QTimer.singleShot(DRAIN_CHECK_MS, _drain)
+
+    def _drain():
+        waited = time.monotonic() - state['drain_start']
+        if stats.outstanding() and waited < drain_timeout:
+            # Files still pending with no worker: let the manager pick them up
+            if not (manager.sync_worker and manager.sync_worker.isRunning()):
+                manager._sync_pending_files()
+            QTimer.singleShot(DRAIN_CHECK_MS, _drain)
+            return
+        manager.stop_sync()
+        if manager.sync_worker:
+            manager.sync_worker.wait()
+        app.quit()
+
+    started = time.monotonic()
+    QTimer.singleShot(0, _dispatch)
+    app.exec()
+    wall = time.monotonic() - started
+    scratch.cleanup()
+    return stats, kinds, wall
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('trace', help='trace file recorded with sync.event_trace')
+    parser.add_argument('--rtt-ms', type=float, default=20.0, help='simulated round-trip time')
+    parser.add_argument('--bandwidth-mb', type=float, default=50.0, help='simulated MiB/s')
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help='timeline speed-up factor, 0 replays as fast as possible')
+    parser.add_argument('--no-auto', action='store_true',
+                        help='do not run the continuous worker; events start one-off syncs')
+    parser.add_argument('--drain-timeout', type=float, default=60.0,
+                        help='seconds to wait for outstanding uploads after the last event')
+    args = parser.parse_args()
+
+    stats, kinds, wall = replay(args.trace, args.rtt_ms / 1000.0, args.bandwidth_mb * 1024 * 1024,
+                                args.speed, not args.no_auto, args.drain_timeout)
+    latencies = sorted(stats.latencies)
+    counts = stats.counts
+    print(f"events           {sum(kinds.values())} "
+          f"(dir {kinds[TRACE_DIRECTORY]}, file {kinds[TRACE_FILE]}, new {kinds[TRACE_NEW_FILE]})")
+    print(f"wall time        {wall:.2f}s")
+    print(f"dir rescans      {counts['rescans']}")
+    print(f"local scans      {counts['local_scans']}")
+    print(f"sync cycles      {counts['syncs']}")
+    print(f"uploads          {counts['uploads']} ({counts['bytes'] / (1024 * 1024):.1f} MiB)")
+    print(f"not uploaded     {stats.outstanding()}")
+    print("latency (ms)     " + "  ".join(
+        f"p{pct} {percentile(latencies, pct) * 1000:.0f}" for pct in (50, 90, 99)
+    ) + f"  max {(latencies[-1] if latencies else 0) * 1000:.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -6,6 +6,7 @@ from pathlib import Path
 from cryptography.fernet import Fernet
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
 import logging
 
 logger = logging.getLogger('GOSync')
@@ -102,8 +103,36 @@ class ConfigManager:
             "sync": {
                 "auto_sync": False,
                 "sync_interval": 300,  # 5 minutes
-                "local_path": self.sync_folder
-            }
+                "local_path": self.sync_folder,
+                "verify_integrity": False,  # Checksum uploads, verified in bulk
+                "remote_watch": False,  # Stream remote changes and download them immediately
+                "transfer_concurrency": 8,  # Parallel manual uploads/downloads, one channel each
+                "encrypt_files": False,  # Encrypt file contents before they leave this machine
+                "snapshots": False,  # Keep hard-linked point-in-time copies of the remote tree
+                "snapshot_keep": 30,  # Snapshots retained; 0 keeps all
+                "snapshot_interval": 3600,  # Minimum seconds between snapshots of one remote
+                "event_trace": "",  # File to record watcher events to for offline replay
+                "bundle_uploads": True,  # Send small files together in one tar stream
+                "upload_channels": 4,  # Upper bound on parallel upload channels
+                "journal": True,  # Persist pending uploads so restarts resume instead of rescanning
+                "tree_digests": True,  # Compare directory digests instead of full remote listings
+                "compress_listings": True,  # Gzip remote listings on the wire
+                "streaming_compare": True,  # Upload while both trees are still being listed
+                "connection_broker": True,  # Share this instance's SSH connections with CLI runs
+                "profile_seconds": 30,  # Length of an on-demand profile of the sync threads
+                "profile_rate": 100  # Stack samples per second while profiling
+            },
+            "transport": {
+                "ciphers": [],  # Empty means built-in throughput-first order
+                "macs": [],
+                "kex": [],
+                "compression": False,
+                "hosts": {}  # Per-host probe results
+            },
+            # Additional remotes that receive the same files as the `ssh` block, as
+            # {"name", "hostname", "username", "remote_path", "ssh_key", "password"};
+            # fields left empty are taken from the `ssh` block
+            "targets": []
         }
         
         try:
@@ -116,12 +145,19 @@ class ConfigManager:
                         ssh = config['ssh']
                         ssh['password'] = self._decrypt(ssh.get('password', ''))
                         ssh['ssh_key'] = self._decrypt(ssh.get('ssh_key', ''))
+                    for target in config.get('targets', []):
+                        target['password'] = self._decrypt(target.get('password', ''))
+                        target['ssh_key'] = self._decrypt(target.get('ssh_key', ''))
                     
                     # Update with any missing default values
                     if 'ssh' not in config:
                         config['ssh'] = default_config['ssh']
                     if 'sync' not in config:
                         config['sync'] = default_config['sync']
+                    if 'transport' not in config:
+                        config['transport'] = default_config['transport']
+                    if 'targets' not in config:
+                        config['targets'] = default_config['targets']
                     
                     return config
                     
@@ -136,13 +172,18 @@ class ConfigManager:
             # Create a copy of config to encrypt sensitive data
             config_to_save = {
                 "ssh": dict(self.config['ssh']),
-                "sync": dict(self.config['sync'])
+                "sync": dict(self.config['sync']),
+                "transport": dict(self.config.get('transport', {})),
+                "targets": [dict(target) for target in self.config.get('targets', [])]
             }
             
             # Encrypt sensitive data
             ssh = config_to_save['ssh']
             ssh['password'] = self._encrypt(ssh.get('password', ''))
             ssh['ssh_key'] = self._encrypt(ssh.get('ssh_key', ''))
+            for target in config_to_save['targets']:
+                target['password'] = self._encrypt(target.get('password', ''))
+                target['ssh_key'] = self._encrypt(target.get('ssh_key', ''))
             
             # Save with restricted permissions
             with open(self.config_file, 'w', encoding='utf-8') as f:
@@ -170,6 +211,33 @@ class ConfigManager:
         self.config['sync'] = settings
         self.save_config()
     
+    def get_transport_settings(self):
+        """Get SSH transport tuning settings"""
+        return self.config.setdefault('transport', {})
+    
+    def save_transport_settings(self, settings):
+        """Save SSH transport tuning settings"""
+        self.config['transport'] = settings
+        self.save_config()
+    
+    def get_targets(self):
+        """Get the additional sync targets"""
+        return self.config.setdefault('targets', [])
+    
+    def save_targets(self, targets):
+        """Save the additional sync targets"""
+        self.config['targets'] = targets
+        self.save_config()
+    
+    def get_file_key(self):
+        """Derive the 256-bit file content key from the local key file"""
+        return HKDF(
+            algorithm=hashes.SHA256(),
+            length=32,
+            salt=None,
+            info=b'GOSync file contents',
+        ).derive(self.key)
+    
     def get_sync_folder(self):
         """Get the sync folder path"""
         return self.sync_folder 
\ No newline at end of file
@@ -0,0 +1,224 @@
+import asyncio
+import logging
+from PySide6.QtCore import QObject, Signal
+from core.ipc.framing import FRAME_DATA, FRAME_EOF, FRAME_HEADER, FRAME_STDERR
+from core.ssh.async_engine import TransferEngine
+from core.sync.targets import load_targets
+
+logger = logging.getLogger('GOSync')
+
+HIGH_WATER = 1024 * 1024  # Bytes in flight per direction before the sender waits
+LOW_WATER = 256 * 1024
+
+
+class _Relay(QObject):
+    """Relays one client connection to a command channel on a held connection.
+
+    The channel is driven by the engine loop; frames cross to the GUI thread
+    through queued signals. Each direction stops reading once HIGH_WATER
+    bytes are in flight, so a slow side slows the other down instead of
+    growing a buffer.
+    """
+    opened = Signal()
+    output = Signal(bytes, bytes)  # Frame kind, payload
+    consumed = Signal(int)  # Stdin bytes written to the channel
+    finished = Signal(int, str)  # Exit status, error message
+    done = Signal()  # Reply sent; emitted on the GUI thread
+
+    def __init__(self, engine, connection, command):
+        super().__init__()
+        self.engine = engine
+        self.connection = connection
+        self.command = command
+        self._future = None
+        self._opened = False
+        self._stdin_queued = 0  # GUI thread
+        self._unsent = 0  # Loop thread
+        self._stdin = None
+        self._drained = None
+        self.opened.connect(self._on_opened)
+        self.output.connect(connection.send)
+        self.consumed.connect(self._on_consumed)
+        self.finished.connect(self._on_finished)
+        connection.on_frame = self._on_frame
+        connection.closed.connect(self.cancel)
+        connection.socket.bytesWritten.connect(self._on_written)
+
+    def start(self):
+        self._future = self.engine.submit(self._pump())
+
+    def cancel(self):
+        """Close the channel, e.g. because the client went away"""
+        if self._future is not None:
+            self._future.cancel()
+
+    # Loop thread
+
+    def _ensure_state(self):
+        if self._stdin is None:
+            # Created on the engine loop, which Python 3.8 binds them to
+            self._stdin = asyncio.Queue()
+            self._drained = asyncio.Event()
+            self._drained.set()
+
+    def _push(self, kind, payload):
+        self._ensure_state()
+        self._stdin.put_nowait((kind, payload))
+
+    def _written(self, count):
+        self._ensure_state()
+        self._unsent = max(0, self._unsent - count)
+        if self._unsent <= LOW_WATER:
+            self._drained.set()
+
+    def _emit(self, kind, payload):
+        self._unsent += FRAME_HEADER.size + len(payload)
+        self.output.emit(kind, payload)
+
+    async def _send(self, kind, payload):
+        self._emit(kind, payload)
+        if self._unsent > HIGH_WATER:
+            self._drained.clear()
+            await self._drained.wait()
+
+    async def _feed(self, channel):
+        while True:
+            kind, payload = await self._stdin.get()
+            if kind == FRAME_EOF:
+                channel.shutdown_write()
+                return
+            await channel.sendall(payload)
+            self.consumed.emit(len(payload))
+
+    async def _pump(self):
+        self._ensure_state()
+        status, error = -1, ''
+        try:
+            async with self.engine.channel(self.command) as channel:
+                channel.stderr_sink = lambda data: self._emit(FRAME_STDERR, data)
+                self.opened.emit()
+                feeder = asyncio.ensure_future(self._feed(channel))
+                try:
+                    while True:
+                        data = await channel.recv()
+                        if not data:
+                            break
+                        await self._send(FRAME_DATA, data)
+                    self._emit(FRAME_EOF, b'')
+                    status = await channel.exit_status()
+                finally:
+                    feeder.cancel()
+                    await asyncio.gather(feeder, return_exceptions=True)
+        except asyncio.CancelledError:
+            error = "Cancelled"
+        except Exception as e:
+            error = str(e)
+        self.finished.emit(status, error)
+
+    # GUI thread
+
+    def _on_frame(self, kind, payload):
+        if kind not in (FRAME_DATA, FRAME_EOF):
+            return
+        self._stdin_queued += len(payload)
+        if self._stdin_queued > HIGH_WATER:
+            self.connection.pause()
+        self.engine.call_soon(self._push, kind, payload)
+
+    def _on_consumed(self, count):
+        self._stdin_queued -= count
+        if self._stdin_queued <= LOW_WATER:
+            self.connection.resume()
+
+    def _on_written(self, count):
+        self.engine.call_soon(self._written, count)
+
+    def _on_opened(self):
+        self._opened = True
+        self.connection.send_json({'ok': True})
+
+    def _on_finished(self, status, error):
+        if error and error != "Cancelled":
+            logger.error(f"Brokered command failed: {error}")
+        if self._opened:
+            self.connection.send_json({'exit_status': status, 'error': error})
+        else:
+            self.connection.send_json({'ok': False, 'error': error})
+        self.connection.close()
+        self.done.emit()
+
+
+class ConnectionBroker(QObject):
+    """Holds SSH connections to the configured hosts for other local processes.
+
+    ControlMaster-style: command-line invocations and other GOSync processes
+    ask the running instance to open a channel on its already authenticated
+    connection instead of doing their own handshake. Only hosts in this
+    user's configuration are served, and clients never send credentials.
+    """
+
+    def __init__(self, config):
+        super().__init__()
+        self.config = config
+        self.engines = {}  # (hostname, username) -> TransferEngine
+        self._relays = set()
+
+    def register(self, server):
+        """Serve broker requests on a ControlServer"""
+        server.register('attach', self.handle_attach)
+        server.register('exec', self.handle_exec)
+        server.register('hosts', self.handle_hosts)
+
+    def _remotes(self):
+        """Configs of the primary remote and every enabled target"""
+        yield self.config
+        for target in load_targets(self.config):
+            yield target.config
+
+    def engine_for(self, hostname, username):
+        """Engine holding the connection to a configured host, created on first use"""
+        key = ((hostname or '').lower(), username or '')
+        engine = self.engines.get(key)
+        if engine is not None:
+            return engine
+        for remote_config in self._remotes():
+            ssh_settings = remote_config.get_ssh_settings()
+            if (ssh_settings.get('hostname', '').lower(), ssh_settings.get('username', '')) == key:
+                engine = TransferEngine(remote_config)
+                self.engines[key] = engine
+                return engine
+        raise LookupError(f"{username}@{hostname} is not a configured host")
+
+    def handle_attach(self, connection, message):
+        """Confirm that a host is served before a client relies on the broker"""
+        self.engine_for(message.get('hostname'), message.get('username'))
+        return {}
+
+    def handle_exec(self, connection, message):
+        """Run a command on a held connection and relay its channel to the client"""
+        command = message.get('command')
+        if not isinstance(command, str) or not command:
+            raise ValueError("No command given")
+        engine = self.engine_for(message.get('hostname'), message.get('username'))
+        relay = _Relay(engine, connection, command)
+        self._relays.add(relay)
+        # Held until its queued signals have been delivered
+        relay.done.connect(lambda: self._relays.discard(relay))
+        relay.start()
+        return None
+
+    def handle_hosts(self, connection, message):
+        """List the held connections"""
+        return {'hosts': [
+            {'hostname': hostname, 'username': username,
+             'connected': engine.ssh_client.is_connected()}
+            for (hostname, username), engine in self.engines.items()
+        ]}
+
+    def shutdown(self):
+        """Close every relayed channel and held connection"""
+        for relay in list(self._relays):
+            relay.cancel()
+        for engine in self.engines.values():
+            engine.shutdown()
+        self.engines = {}
@@ -0,0 +1,353 @@
+import logging
+import socket
+from PySide6.QtCore import QCoreApplication
+from PySide6.QtNetwork import QLocalSocket
+from core.ipc.framing import (
+    FRAME_DATA, FRAME_EOF, FRAME_JSON, FRAME_STDERR, MAX_FRAME, PROTOCOL_MAGIC, SERVER_NAME,
+    FrameError, FrameReader, decode_json, encode_frame, encode_json
+)
+
+logger = logging.getLogger('GOSync')
+
+CONNECT_TIMEOUT = 0.5  # Seconds to reach the running instance before connecting directly
+WAIT_SLICE = 200  # Milliseconds per blocking socket wait
+RECV_SIZE = 64 * 1024
+
+_app = None  # Qt sockets need an application object; CLI runs have none of their own
+
+
+class BrokerUnavailable(ConnectionError):
+    """No running GOSync instance answered, or it went away mid-channel"""
+
+
+def _connect(timeout=CONNECT_TIMEOUT):
+    """Open a framed connection to the running instance's local server"""
+    global _app
+    if QCoreApplication.instance() is None:
+        _app = QCoreApplication([])
+    sock = QLocalSocket()
+    sock.connectToServer(SERVER_NAME)
+    if not sock.waitForConnected(int(timeout * 1000)):
+        raise BrokerUnavailable(f"GOSync is not running: {sock.errorString()}")
+    return _Link(sock)
+
+
+class _Link:
+    """Blocking frame exchange over one local socket"""
+
+    def __init__(self, sock):
+        self.socket = sock
+        self.reader = FrameReader()
+        self.frames = []
+        self.connected = True
+        self.write(PROTOCOL_MAGIC)
+
+    def write(self, data):
+        """Write bytes, collecting incoming frames while the server is slow to read"""
+        if not self.connected:
+            raise BrokerUnavailable("Connection to GOSync closed")
+        self.socket.write(data)
+        while self.socket.bytesToWrite() > 0:
+            if self.socket.state() != QLocalSocket.LocalSocketState.ConnectedState:
+                self.connected = False
+                raise BrokerUnavailable("Connection to GOSync closed")
+            self.socket.waitForBytesWritten(WAIT_SLICE)
+            self.absorb()
+
+    def send(self, kind, payload=b''):
+        for start in range(0, max(len(payload), 1), MAX_FRAME):
+            self.write(encode_frame(kind, payload[start:start + MAX_FRAME]))
+
+    def send_json(self, message):
+        self.write(encode_json(message))
+
+    def absorb(self):
+        """Take whatever has arrived without blocking"""
+        if self.socket.bytesAvailable():
+            try:
+                self.frames.extend(self.reader.feed(bytes(self.socket.readAll().data())))
+            except FrameError as e:
+                self.close()
+                raise BrokerUnavailable(str(e))
+
+    def wait(self, timeout=None):
+        """Block until at least one frame is queued; raises socket.timeout"""
+        waited = 0
+        while not self.frames:
+            self.absorb()
+            if self.frames:
+                break
+            if self.socket.state() != QLocalSocket.LocalSocketState.ConnectedState:
+                self.connected = False
+                return False
+            if timeout is not None and waited >= timeout * 1000:
+                raise socket.timeout("Timed out waiting for GOSync")
+            self.socket.waitForReadyRead(WAIT_SLICE)
+            waited += WAIT_SLICE
+        return True
+
+    def reply(self, timeout=None):
+        """Wait for the next JSON frame"""
+        while True:
+            if not self.wait(timeout):
+                raise BrokerUnavailable("GOSync closed the connection")
+            kind, payload = self.frames.pop(0)
+            if kind == FRAME_JSON:
+                return decode_json(payload)
+
+    def close(self):
+        if self.connected:
+            self.connected = False
+            self.socket.disconnectFromServer()
+            if self.socket.state() != QLocalSocket.LocalSocketState.UnconnectedState:
+                self.socket.waitForDisconnected(WAIT_SLICE)
+
+
+def request(message, timeout=5.0):
+    """Send one JSON request to the running instance and return its reply"""
+    link = _connect()
+    try:
+        link.send_json(message)
+        return link.reply(timeout)
+    finally:
+        link.close()
+
+
+class _ChannelFile:
+    """File object over a BrokerChannel stream, like paramiko's ChannelFile"""
+
+    def __init__(self, channel, recv=None):
+        self.channel = channel
+        self._recv = recv
+        self._buffer = bytearray()
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            data = self._recv(RECV_SIZE)
+            if not data:
+                break
+            self._buffer += data
+        if size < 0:
+            size = len(self._buffer)
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+    def readline(self):
+        while b'\n' not in self._buffer:
+            data = self._recv(RECV_SIZE)
+            if not data:
+                break
+            self._buffer += data
+        end = self._buffer.find(b'\n') + 1 or len(self._buffer)
+        line = bytes(self._buffer[:end])
+        del self._buffer[:end]
+        return line
+
+    def write(self, data):
+        self.channel.sendall(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class BrokerChannel:
+    """A command channel relayed by the running instance.
+
+    Implements the part of paramiko's Channel that GOSync uses, so code
+    written against a transport works unchanged through the broker.
+    """
+
+    def __init__(self, client, timeout=None):
+        self.client = client
+        self._link = _connect(timeout or CONNECT_TIMEOUT)
+        self._timeout = None
+        self._stdout = bytearray()
+        self._stderr = bytearray()
+        self._eof = False
+        self._status = None
+        self.closed = False
+
+    def settimeout(self, timeout):
+        self._timeout = timeout
+
+    def exec_command(self, command):
+        """Ask the broker to run `command` on its connection to our host"""
+        self._link.send_json({
+            'op': 'exec', 'hostname': self.client.hostname,
+            'username': self.client.username, 'command': command
+        })
+        try:
+            reply = self._link.reply(self._timeout)
+        except BrokerUnavailable:
+            self.client.active = False
+            raise
+        if not reply.get('ok'):
+            self.close()
+            raise IOError(f"Brokered command failed: {reply.get('error', '')}")
+
+    def _pump(self, block=True):
+        """Move arrived frames into the stdout/stderr buffers"""
+        if block:
+            if not self._link.wait(self._timeout) and self._status is None:
+                # The broker went away without reporting an exit status
+                self.client.active = False
+                self._eof = True
+                self._status = -1
+                self.closed = True
+                raise BrokerUnavailable("GOSync closed the channel")
+        else:
+            self._link.absorb()
+        while self._link.frames:
+            kind, payload = self._link.frames.pop(0)
+            if kind == FRAME_DATA:
+                self._stdout += payload
+            elif kind == FRAME_STDERR:
+                self._stderr += payload
+            elif kind == FRAME_EOF:
+                self._eof = True
+            elif kind == FRAME_JSON:
+                message = decode_json(payload)
+                self._eof = True
+                self._status = message.get('exit_status', -1)
+                if message.get('error'):
+                    self._stderr += message['error'].encode('utf-8')
+                self._link.close()
+
+    def recv(self, size):
+        while not self._stdout and not self._eof:
+            self._pump()
+        data = bytes(self._stdout[:size])
+        del self._stdout[:size]
+        return data
+
+    def recv_stderr(self, size):
+        while not self._stderr and self._status is None:
+            self._pump()
+        data = bytes(self._stderr[:size])
+        del self._stderr[:size]
+        return data
+
+    def recv_ready(self):
+        self._pump(block=False)
+        return bool(self._stdout)
+
+    def recv_stderr_ready(self):
+        self._pump(block=False)
+        return bool(self._stderr)
+
+    def send(self, data):
+        self.sendall(data)
+        return len(data)
+
+    def sendall(self, data):
+        if self._status is not None:
+            raise EOFError("Channel closed")
+        self._link.send(FRAME_DATA, bytes(data))
+
+    def shutdown_write(self):
+        if self._status is None:
+            self._link.send(FRAME_EOF)
+
+    def exit_status_ready(self):
+        if self._status is None and self._link.connected:
+            self._pump(block=False)
+        return self._status is not None
+
+    def recv_exit_status(self):
+        timeout, self._timeout = self._timeout, None
+        try:
+            while self._status is None:
+                self._pump()
+        finally:
+            self._timeout = timeout
+        return self._status
+
+    def makefile(self, mode='rb'):
+        return _ChannelFile(self, self.recv)
+
+    def makefile_stderr(self, mode='rb'):
+        return _ChannelFile(self, self.recv_stderr)
+
+    def makefile_stdin(self, mode='wb'):
+        return _ChannelFile(self)
+
+    def close(self):
+        self.closed = True
+        self._link.close()
+
+
+class BrokerTransport:
+    """Stand-in for a paramiko Transport whose channels go through the broker"""
+
+    def __init__(self, client):
+        self.client = client
+
+    def open_session(self, timeout=None):
+        return BrokerChannel(self.client, timeout)
+
+    def is_active(self):
+        return self.client.active
+
+    def set_keepalive(self, interval):
+        pass
+
+
+class BrokerClient:
+    """Stand-in for paramiko.SSHClient that borrows the running instance's connection.
+
+    Saves the TCP and SSH handshakes, key exchange and authentication on
+    every short-lived invocation. Raises BrokerUnavailable when no instance
+    is running or it does not hold this host, so callers can connect
+    directly instead.
+    """
+
+    def __init__(self, hostname, username):
+        self.hostname = hostname
+        self.username = username
+        self.active = False
+        self._transport = BrokerTransport(self)
+
+    def connect(self, timeout=CONNECT_TIMEOUT):
+        """Check that the running instance serves this host"""
+        try:
+            reply = request({'op': 'attach', 'hostname': self.hostname, 'username': self.username},
+                            timeout=max(timeout, 5.0))
+        except socket.timeout:
+            raise BrokerUnavailable("GOSync did not answer")
+        if not reply.get('ok'):
+            raise BrokerUnavailable(reply.get('error', 'Host not served'))
+        self.active = True
+
+    def get_transport(self):
+        return self._transport
+
+    def exec_command(self, command, timeout=None):
+        channel = self._transport.open_session()
+        channel.settimeout(timeout)
+        channel.exec_command(command)
+        return channel.makefile_stdin('wb'), channel.makefile('rb'), channel.makefile_stderr('rb')
+
+    def open_sftp(self):
+        raise IOError("SFTP is not available through the connection broker")
+
+    def close(self):
+        self.active = False
+
+
+def borrow_connection(hostname, username):
+    """BrokerClient for the host if the running instance serves it, else None.
+
+    Plugged into SSHClient.borrow_connection by command-line runs.
+    """
+    client = BrokerClient(hostname, username)
+    try:
+        client.connect()
+    except BrokerUnavailable as e:
+        logger.info(f"Connecting directly: {str(e)}")
+        return None
+    logger.info("Using the SSH connection held by the running GOSync instance")
+    return client
@@ -0,0 +1,133 @@
+import logging
+import time
+from PySide6.QtCore import QObject, QTimer
+
+logger = logging.getLogger('GOSync')
+
+WAIT_POLL = 250  # Milliseconds between checks for timed-out or disconnected waiters
+
+
+class _Waiter:
+    """A client blocked on `sync` (with wait) or `flush`"""
+
+    def __init__(self, connection, timeout, paths):
+        self.connection = connection
+        self.deadline = time.monotonic() + timeout if timeout else None
+        self.paths = paths  # Lowercase paths still outstanding
+        self.sent = 0
+        self.failed = []
+
+
+class SyncControl(QObject):
+    """Scriptable sync control over the local server.
+
+    Requests (JSON, see ControlServer):
+      {"op": "sync", "paths": [...], "wait": bool, "timeout": seconds}
+      {"op": "flush", "timeout": seconds}
+      {"op": "pause"}, {"op": "resume"}
+      {"op": "status"}
+      {"op": "profile", "seconds": N, "rate": Hz} or {"op": "profile", "stop": true}
+    `sync` uploads the given files now without a full comparison; with
+    `wait` the reply comes once they are uploaded or failed. `flush`
+    uploads everything pending and replies the same way once that batch
+    is done. A failed upload stays pending for later cycles.
+    `profile` starts (or stops) a SamplingProfiler run and replies with
+    the files it writes.
+    """
+
+    def __init__(self, sync_manager, profiler=None):
+        super().__init__()
+        self.sync_manager = sync_manager
+        self.profiler = profiler
+        self._waiters = []
+        self._timer = QTimer(self)
+        self._timer.setInterval(WAIT_POLL)
+        self._timer.timeout.connect(self._check)
+        sync_manager.uploads_finished.connect(self._on_uploads_finished)
+
+    def register(self, server):
+        """Serve control requests on a ControlServer"""
+        server.register('sync', self.handle_sync)
+        server.register('flush', self.handle_flush)
+        server.register('pause', self.handle_pause)
+        server.register('resume', self.handle_resume)
+        server.register('status', self.handle_status)
+        if self.profiler is not None:
+            server.register('profile', self.handle_profile)
+
+    def handle_sync(self, connection, message):
+        """Upload the given paths now"""
+        paths = message.get('paths')
+        if not isinstance(paths, list) or not all(isinstance(path, str) for path in paths):
+            raise ValueError("`paths` must be a list of strings")
+        rel_paths = self.sync_manager.request_sync(paths)
+        logger.info(f"Control request: sync {len(rel_paths)} files")
+        if not message.get('wait') or not rel_paths:
+            return {'queued': len(rel_paths)}
+        self._add(_Waiter(connection, message.get('timeout'),
+                          {rel_path.lower() for rel_path in rel_paths}))
+        return None
+
+    def handle_flush(self, connection, message):
+        """Upload everything pending and reply once that batch is done"""
+        queued = self.sync_manager.flush()
+        logger.info(f"Control request: flush ({len(queued)} pending files)")
+        if not queued:
+            return {'sent': 0, 'failed': []}
+        self._add(_Waiter(connection, message.get('timeout'), {rel_path.lower() for rel_path in queued}))
+        return None
+
+    def handle_pause(self, connection, message):
+        """Hold scheduled syncs"""
+        self.sync_manager.pause()
+        return {'state': self.sync_manager.status()['state']}
+
+    def handle_resume(self, connection, message):
+        """Resume scheduled syncs"""
+        self.sync_manager.resume()
+        return {'state': self.sync_manager.status()['state']}
+
+    def handle_status(self, connection, message):
+        """Queue depth, throughput and last cycle timings"""
+        return self.sync_manager.status()
+
+    def handle_profile(self, connection, message):
+        """Sample the sync threads for a while, or stop the running profile"""
+        if message.get('stop'):
+            self.profiler.stop()
+            return self.profiler.status()
+        paths = self.profiler.start(message.get('seconds'), message.get('rate'))
+        return {'running': True, 'paths': paths}
+
+    def _add(self, waiter):
+        self._waiters.append(waiter)
+        self._timer.start()
+
+    def _reply(self, waiter, reply):
+        self._waiters.remove(waiter)
+        waiter.connection.send_json(reply)
+        if not self._waiters:
+            self._timer.stop()
+
+    def _on_uploads_finished(self, sent, failed):
+        for waiter in list(self._waiters):
+            for rel_path in sent:
+                if rel_path.lower() in waiter.paths:
+                    waiter.paths.discard(rel_path.lower())
+                    waiter.sent += 1
+            for rel_path in failed:
+                if rel_path.lower() in waiter.paths:
+                    waiter.paths.discard(rel_path.lower())
+                    waiter.failed.append(rel_path)
+            if not waiter.paths:
+                self._reply(waiter, {'ok': not waiter.failed, 'sent': waiter.sent,
+                                     'failed': waiter.failed})
+
+    def _check(self):
+        now = time.monotonic()
+        for waiter in list(self._waiters):
+            if not waiter.connection.is_open():
+                self._reply(waiter, {})
+            elif waiter.deadline is not None and now >= waiter.deadline:
+                self._reply(waiter, {'ok': False, 'error': "Timed out", 'sent': waiter.sent,
+                                     'failed': waiter.failed, 'outstanding': len(waiter.paths)})
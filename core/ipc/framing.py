@@ -0,0 +1,60 @@
+import json
+import struct
+
+SERVER_NAME = 'GOSyncServer'
+PROTOCOL_MAGIC = b'GOSP\x01'  # Sent first by framed clients; anything else is a legacy `show`
+MAX_FRAME = 1024 * 1024
+
+# Each frame is a one-byte kind and a big-endian payload length, then the payload
+FRAME_HEADER = struct.Struct('>cI')
+FRAME_JSON = b'J'  # UTF-8 JSON object: requests, replies and exit status
+FRAME_DATA = b'D'  # Channel stdin (client to server) or stdout (server to client)
+FRAME_STDERR = b'E'  # Channel stderr
+FRAME_EOF = b'F'  # End of stdin or stdout
+
+
+class FrameError(Exception):
+    """The peer sent something that is not a valid frame"""
+
+
+def encode_frame(kind, payload=b''):
+    """Frame one payload"""
+    return FRAME_HEADER.pack(kind, len(payload)) + payload
+
+
+def encode_json(message):
+    """Frame one JSON message"""
+    return encode_frame(FRAME_JSON, json.dumps(message).encode('utf-8'))
+
+
+def decode_json(payload):
+    """Decode a JSON frame's payload into a dict"""
+    try:
+        message = json.loads(payload.decode('utf-8'))
+    except ValueError as e:
+        raise FrameError(f"Invalid JSON frame: {str(e)}")
+    if not isinstance(message, dict):
+        raise FrameError("JSON frame is not an object")
+    return message
+
+
+class FrameReader:
+    """Splits a byte stream into (kind, payload) frames as data arrives"""
+
+    def __init__(self):
+        self._buffer = bytearray()
+
+    def feed(self, data):
+        """Add received bytes, returning the frames completed by them"""
+        self._buffer += data
+        frames = []
+        while len(self._buffer) >= FRAME_HEADER.size:
+            kind, length = FRAME_HEADER.unpack_from(self._buffer)
+            if length > MAX_FRAME:
+                raise FrameError(f"Frame of {length} bytes exceeds the limit")
+            end = FRAME_HEADER.size + length
+            if len(self._buffer) < end:
+                break
+            frames.append((kind, bytes(self._buffer[FRAME_HEADER.size:end])))
+            del self._buffer[:end]
+        return frames
@@ -0,0 +1,165 @@
+import logging
+from PySide6.QtCore import QObject, QTimer, Signal
+from PySide6.QtNetwork import QLocalServer
+from core.ipc.framing import (
+    FRAME_JSON, PROTOCOL_MAGIC, FrameError, FrameReader, decode_json, encode_frame, encode_json
+)
+
+logger = logging.getLogger('GOSync')
+
+READ_BUFFER = 256 * 1024  # Bytes Qt buffers per client before the kernel applies backpressure
+
+
+class ControlConnection(QObject):
+    """One client of the local server, speaking the framed protocol.
+
+    JSON frames are dispatched to the handler registered for their `op`.
+    A handler may take the connection over (e.g. to relay a channel) by
+    setting `on_frame`, which then receives every later frame.
+    """
+    closed = Signal()
+
+    def __init__(self, socket, server):
+        super().__init__()
+        self.socket = socket
+        self.server = server
+        self.on_frame = None  # Callable(kind, payload) once a handler owns the connection
+        self._reader = FrameReader()
+        self._prefix = b''
+        self._framed = False
+        self._paused = False
+        self._closed = False
+        socket.setReadBufferSize(READ_BUFFER)
+        socket.readyRead.connect(self._read)
+        socket.disconnected.connect(self._disconnected)
+
+    def _read(self):
+        if self._paused or self._closed:
+            return
+        data = bytes(self.socket.readAll().data())
+        if not self._framed:
+            self._prefix += data
+            if PROTOCOL_MAGIC.startswith(self._prefix):
+                return  # Not enough bytes to tell yet
+            if not self._prefix.startswith(PROTOCOL_MAGIC):
+                # Legacy message from a second instance started by the user
+                self.server.show_requested.emit()
+                self.close()
+                return
+            self._framed = True
+            data = self._prefix[len(PROTOCOL_MAGIC):]
+            self._prefix = b''
+        try:
+            frames = self._reader.feed(data)
+        except FrameError as e:
+            logger.error(f"Closing local client: {str(e)}")
+            self.close()
+            return
+        for kind, payload in frames:
+            if self._closed:
+                return
+            if self.on_frame is not None:
+                self.on_frame(kind, payload)
+            elif kind == FRAME_JSON:
+                self.server.dispatch(self, payload)
+            else:
+                logger.warning(f"Ignoring unexpected {kind!r} frame from local client")
+
+    def pause(self):
+        """Stop reading; the client blocks once the buffers fill"""
+        self._paused = True
+
+    def resume(self):
+        """Read again after pause()"""
+        if self._paused:
+            self._paused = False
+            QTimer.singleShot(0, self._read)
+
+    def is_open(self):
+        """Check whether replies can still be sent"""
+        return not self._closed
+
+    def send(self, kind, payload=b''):
+        """Write one frame to the client"""
+        if not self._closed:
+            self.socket.write(encode_frame(kind, payload))
+
+    def send_json(self, message):
+        """Write one JSON frame to the client"""
+        if not self._closed:
+            self.socket.write(encode_json(message))
+
+    def close(self):
+        """Flush pending output, then disconnect"""
+        if not self._closed:
+            self._closed = True
+            self.on_frame = None
+            # Emits disconnected once the output is written; deleting the socket earlier drops it
+            self.socket.disconnectFromServer()
+
+    def _disconnected(self):
+        if self.socket is None:
+            return
+        self._closed = True
+        self.on_frame = None
+        self.closed.emit()
+        self.socket.deleteLater()
+        self.socket = None
+
+
+class ControlServer(QObject):
+    """The application's QLocalServer, shared by every local client.
+
+    A bare `show` (from a second instance) raises the window; framed
+    clients send JSON requests that are routed by their `op` field.
+    Handlers are called as `handler(connection, message)` and return a
+    reply dict, or None when they reply later themselves.
+    """
+    show_requested = Signal()
+
+    def __init__(self, name):
+        super().__init__()
+        self.server = QLocalServer()
+        # Only this user's processes may connect; the broker runs commands as them
+        self.server.setSocketOptions(QLocalServer.SocketOption.UserAccessOption)
+        self.handlers = {}
+        self.connections = set()
+        self.server.newConnection.connect(self._accept)
+        if not self.server.listen(name):
+            # A crashed instance can leave a stale socket file behind
+            QLocalServer.removeServer(name)
+            if not self.server.listen(name):
+                logger.error(f"Local server failed to listen: {self.server.errorString()}")
+
+    def register(self, op, handler):
+        """Route requests with this `op` to `handler`"""
+        self.handlers[op] = handler
+
+    def _accept(self):
+        while self.server.hasPendingConnections():
+            connection = ControlConnection(self.server.nextPendingConnection(), self)
+            self.connections.add(connection)
+            connection.closed.connect(lambda c=connection: self.connections.discard(c))
+
+    def dispatch(self, connection, payload):
+        """Run the handler for one JSON request and send its reply"""
+        try:
+            message = decode_json(payload)
+            op = message.get('op')
+            handler = self.handlers.get(op)
+            if handler is None:
+                raise ValueError(f"Unknown operation {op!r}")
+            reply = handler(connection, message)
+        except Exception as e:
+            logger.error(f"Local request failed: {str(e)}")
+            connection.send_json({'ok': False, 'error': str(e)})
+            return
+        if reply is not None:
+            reply.setdefault('ok', True)
+            connection.send_json(reply)
+
+    def close(self):
+        """Stop listening and drop every client"""
+        self.server.close()
+        for connection in list(self.connections):
+            connection.close()
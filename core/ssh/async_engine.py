@@ -0,0 +1,580 @@
+import asyncio
+import concurrent.futures
+import contextlib
+import logging
+import os
+import posixpath
+import queue
+import shlex
+import socket
+import stat
+from concurrent.futures import ThreadPoolExecutor
+from itertools import count
+from pathlib import Path
+import paramiko
+from PySide6.QtCore import QObject, QThread, Signal
+from core.ssh.cancellation import CancelToken, TransferCancelled
+from core.ssh.connection import DEFAULT_RECONNECT_ATTEMPTS, backoff_delays, is_connection_error
+from core.ssh.file_transfer import STAGING_SUFFIX, sanitize_filename
+from core.ssh.ssh_client import STAT_COMMAND, STAT_UNSUPPORTED, SSHClient, parse_stat_output
+from core.ssh.upload_reader import CHUNK_SIZE
+
+logger = logging.getLogger('GOSync')
+
+DEFAULT_CHANNELS = 8  # OpenSSH allows 10 sessions per connection (MaxSessions)
+IO_WORKERS = 4  # Threads for disk reads, encryption and blocking channel setup
+RECV_SIZE = 64 * 1024
+WRITE_SIZE = 1024 * 1024  # Downloaded bytes gathered before each disk write
+SEND_POLL = 0.005  # Seconds between checks of a full channel window
+STATUS_POLL = 0.1
+CALL_POLL = 0.1  # Seconds between cancellation checks of a blocking call()
+STREAM_CHUNKS = 16  # Output chunks a streaming consumer may fall behind before reading pauses
+STDERR_LIMIT = 64 * 1024
+
+
+class _LoopThread(QThread):
+    """Runs the engine's event loop until it is stopped"""
+
+    def __init__(self, loop):
+        super().__init__()
+        self.loop = loop
+
+    def run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+
+class _AsyncChannel:
+    """Non-blocking paramiko channel driven by the event loop.
+
+    Reads wait on the channel's notification pipe, which paramiko sets when
+    stdout or stderr data, EOF or close arrive. Writes go out whenever the
+    SSH window has room and otherwise yield to other channels.
+    """
+
+    def __init__(self, loop, channel):
+        self.loop = loop
+        self.channel = channel
+        channel.setblocking(False)
+        self._fd = channel.fileno()
+        self._buffer = bytearray()
+        self._stderr = bytearray()
+        self.stderr_sink = None  # Receives stderr chunks instead of errors() when set
+
+    async def _wait(self, timeout=None):
+        """Wait until the notification pipe is readable, or the timeout passes"""
+        future = self.loop.create_future()
+
+        def _ready():
+            if not future.done():
+                future.set_result(None)
+
+        self.loop.add_reader(self._fd, _ready)
+        try:
+            await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            self.loop.remove_reader(self._fd)
+
+    def _drain_stderr(self):
+        # Unread stderr keeps the pipe set, so it is collected whenever it shows up
+        while self.channel.recv_stderr_ready():
+            data = self.channel.recv_stderr(RECV_SIZE)
+            if self.stderr_sink is not None:
+                self.stderr_sink(data)
+            else:
+                self._stderr += data
+        del self._stderr[:-STDERR_LIMIT]
+
+    async def recv(self, size=RECV_SIZE):
+        """Receive up to `size` bytes of stdout, or b'' at EOF"""
+        if self._buffer:
+            data = bytes(self._buffer[:size])
+            del self._buffer[:size]
+            return data
+        while True:
+            self._drain_stderr()
+            if self.channel.recv_ready():
+                return self.channel.recv(size)
+            if self.channel.eof_received or self.channel.closed:
+                return b''
+            await self._wait()
+
+    async def readline(self):
+        """Receive up to and including the next newline"""
+        while b'\n' not in self._buffer:
+            data = await self.recv()
+            if not data:
+                break
+            self._buffer += data
+        end = self._buffer.find(b'\n') + 1 or len(self._buffer)
+        line = bytes(self._buffer[:end])
+        del self._buffer[:end]
+        return line
+
+    async def sendall(self, data):
+        """Send all of `data`, yielding while the channel window is full"""
+        view = memoryview(data)
+        while len(view):
+            if self.channel.closed:
+                raise EOFError("Channel closed")
+            sent = 0
+            if self.channel.send_ready():
+                try:
+                    sent = self.channel.send(view)
+                except socket.timeout:
+                    pass
+            if sent:
+                view = view[sent:]
+            else:
+                await asyncio.sleep(SEND_POLL)
+        # Let other channels run between chunks
+        await asyncio.sleep(0)
+
+    def shutdown_write(self):
+        """Send EOF to the remote command"""
+        self.channel.shutdown_write()
+
+    async def exit_status(self):
+        """Wait for the remote command to exit, returning its status (-1 if unknown)"""
+        while not self.channel.exit_status_ready():
+            if self.channel.closed:
+                return -1
+            self._drain_stderr()
+            while self.channel.recv_ready():
+                self.channel.recv(RECV_SIZE)
+            await self._wait(STATUS_POLL)
+        self._drain_stderr()
+        return self.channel.recv_exit_status()
+
+    def errors(self):
+        """Stderr received so far, decoded"""
+        self._drain_stderr()
+        return self._stderr.decode('utf-8', errors='replace').strip()
+
+
+async def _read_ack(channel):
+    """Read an SCP acknowledgement, raising on a remote error"""
+    code = await channel.recv(1)
+    if code == b'\0':
+        return
+    if not code:
+        errors = channel.errors()
+        # A remote command failing (e.g. mkdir) is not worth a reconnect
+        if errors:
+            raise IOError(f"Remote command failed: {errors}")
+        raise EOFError("SCP channel closed")
+    message = await channel.readline()
+    raise IOError(f"SCP error: {message.decode('utf-8', errors='replace').strip()}")
+
+
+def _open_content(local_file, cipher):
+    """Open a file for upload: (file, size, mode, chunk iterator), encrypted when a cipher is given"""
+    f = open(local_file, 'rb')
+    st = os.fstat(f.fileno())
+    if cipher is None:
+        # Never send more than the size announced up front, even if the file grows
+        remaining = [st.st_size]
+
+        def _read():
+            data = f.read(min(CHUNK_SIZE, remaining[0]))
+            remaining[0] -= len(data)
+            return data
+        return f, st.st_size, stat.S_IMODE(st.st_mode), iter(_read, b'')
+    return f, cipher.encrypted_size(st.st_size), stat.S_IMODE(st.st_mode), cipher.encrypt_chunks(f)
+
+
+def _finish_download(part_path, local_path, cipher):
+    """Move a received file into place, decrypting it first if it is encrypted"""
+    if cipher is not None and cipher.is_encrypted_file(part_path):
+        plain_path = local_path + '.gosync-plain'
+        try:
+            with open(part_path, 'rb') as source, open(plain_path, 'wb') as out:
+                cipher.decrypt_stream(source.read, out.write)
+            os.replace(plain_path, local_path)
+        finally:
+            for path in (plain_path, part_path):
+                if os.path.exists(path):
+                    os.remove(path)
+        return
+    os.replace(part_path, local_path)
+
+
+class TransferEngine(QObject):
+    """Runs remote operations as coroutines on one event loop and one SSH connection.
+
+    Listings, metadata lookups and concurrent transfers share a single
+    connection as separate channels, interleaved by one background thread
+    instead of one thread and connection per operation. Disk reads,
+    encryption and channel setup go to a small thread pool. Coroutines are
+    scheduled from any thread with submit(), waited for by worker threads
+    with call(), or run with request() to have the outcome reported through
+    the operation_finished signal.
+
+    The engine opens its own connection unless given an SSHClient to share,
+    as the sync worker does so its listings ride on its connection. File
+    contents are encrypted as the client's TransferHooks decide.
+    """
+    operation_finished = Signal(int, object, str)  # Request ID, result, error message
+
+    def __init__(self, config, max_channels=DEFAULT_CHANNELS, ssh_client=None, hooks=None):
+        super().__init__()
+        self.config = config
+        self.max_channels = max(1, int(max_channels))
+        self.cancel_token = CancelToken()  # Ends reconnect backoff on shutdown
+        self._owns_client = ssh_client is None
+        if self._owns_client:
+            ssh_client = SSHClient(config, hooks)
+            ssh_client.cancel_token = self.cancel_token
+        self.ssh_client = ssh_client
+        self._ids = count(1)
+        self._loop = None
+        self._thread = None
+        self._retired = None
+        self._io = None
+        self._slots = None
+        self._connect_lock = None
+
+    def start(self):
+        """Start the event loop thread on first use"""
+        if self._thread is not None:
+            return
+        # A restarted engine gets a fresh loop, so nothing may stay bound to the old one
+        self.cancel_token.reset()
+        self._connect_lock = None
+        self._slots = None
+        # Selector loops work everywhere paramiko's channel pipes do (sockets on Windows)
+        self._loop = asyncio.SelectorEventLoop()
+        self._io = ThreadPoolExecutor(max_workers=IO_WORKERS, thread_name_prefix='GOSyncEngine')
+        self._thread = _LoopThread(self._loop)
+        self._thread.start()
+
+    def submit(self, coroutine):
+        """Schedule a coroutine on the engine loop, returning a concurrent Future"""
+        self.start()
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop)
+
+    def request(self, coroutine):
+        """Schedule a coroutine and report its outcome through operation_finished"""
+        request_id = next(self._ids)
+
+        def _done(future):
+            if future.cancelled():
+                self.operation_finished.emit(request_id, None, "Cancelled")
+            elif future.exception() is not None:
+                self.operation_finished.emit(request_id, None, str(future.exception()))
+            else:
+                self.operation_finished.emit(request_id, future.result(), '')
+
+        self.submit(coroutine).add_done_callback(_done)
+        return request_id
+
+    def call(self, coroutine, cancel_token=None):
+        """Run a coroutine on the engine loop and wait for its result; not for use on the loop.
+
+        Once `cancel_token` fires the coroutine is cancelled and
+        TransferCancelled raised, as a chunked transfer would.
+        """
+        future = self.submit(coroutine)
+        while True:
+            try:
+                return future.result(CALL_POLL)
+            except concurrent.futures.TimeoutError:
+                if cancel_token is not None and cancel_token.cancelled:
+                    future.cancel()
+                    raise TransferCancelled()
+
+    def call_soon(self, callback, *args):
+        """Schedule a plain callback on the engine loop from any thread"""
+        self.start()
+        self._loop.call_soon_threadsafe(callback, *args)
+
+    def shutdown(self, timeout_ms=2000):
+        """Cancel running operations, stop the loop and close the connection"""
+        if self._thread is None:
+            return
+        self.cancel_token.cancel()
+        self._loop.call_soon_threadsafe(self._stop)
+        if not self._thread.wait(timeout_ms):
+            logger.warning(f"Transfer engine did not stop within {timeout_ms} ms")
+            # The thread must stay referenced until it exits
+            self._retired = self._thread
+        self._io.shutdown(wait=False)
+        if self._owns_client:
+            self.ssh_client.disconnect()
+        self._thread = None
+
+    def _stop(self):
+        tasks = list(asyncio.all_tasks(self._loop))
+        for task in tasks:
+            task.cancel()
+
+        async def _drain():
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self._loop.stop()
+
+        self._loop.create_task(_drain())
+
+    def _offload(self, func, *args):
+        """Run a blocking call on the I/O pool"""
+        return self._loop.run_in_executor(self._io, func, *args)
+
+    async def _transport(self):
+        """Connected transport, reconnecting (off the loop) when needed"""
+        if self._connect_lock is None:
+            # Created here so they belong to the engine loop
+            self._connect_lock = asyncio.Lock()
+            self._slots = asyncio.Semaphore(self.max_channels)
+        async with self._connect_lock:
+            await self._offload(self.ssh_client.ensure_connected)
+            return self.ssh_client.client.get_transport()
+
+    async def _run(self, operation):
+        """Run `operation(transport)`, replaying it after a reconnect with backoff"""
+        attempts = self.config.get_ssh_settings().get('reconnect_attempts', DEFAULT_RECONNECT_ATTEMPTS)
+        last_error = None
+        for delay in backoff_delays(attempts):
+            if delay:
+                await asyncio.sleep(delay)
+            try:
+                return await operation(await self._transport())
+            except Exception as e:
+                if not is_connection_error(e):
+                    raise
+                last_error = e
+                logger.warning(f"Connection lost during operation: {str(e)}")
+        raise last_error
+
+    @contextlib.asynccontextmanager
+    async def _channel(self, transport, command):
+        """Open a channel running `command`, within the channel limit"""
+        async with self._slots:
+            channel = await self._offload(self._exec, transport, command)
+            try:
+                yield _AsyncChannel(self._loop, channel)
+            finally:
+                channel.close()
+
+    @contextlib.asynccontextmanager
+    async def channel(self, command):
+        """Open a channel running `command` for a caller that drives it itself (no replay)"""
+        async with self._channel(await self._transport(), command) as channel:
+            yield channel
+
+    @staticmethod
+    def _exec(transport, command):
+        channel = transport.open_session()
+        try:
+            channel.exec_command(command)
+        except Exception:
+            channel.close()
+            raise
+        return channel
+
+    async def exec_command(self, command, data=None):
+        """Run a remote command, feeding it `data`, and return (status, stdout, stderr).
+
+        Stdin is written while stdout is read, so large inputs and outputs
+        cannot fill both channel windows and stall each other.
+        """
+        async def _call(transport):
+            async with self._channel(transport, command) as channel:
+                async def _feed():
+                    if data is not None:
+                        await channel.sendall(data)
+                    channel.shutdown_write()
+
+                # A command that exits without reading all its input just ends the feeder
+                feeder = asyncio.ensure_future(_feed())
+                try:
+                    output = bytearray()
+                    while True:
+                        chunk = await channel.recv()
+                        if not chunk:
+                            break
+                        output += chunk
+                    status = await channel.exit_status()
+                finally:
+                    feeder.cancel()
+                    await asyncio.gather(feeder, return_exceptions=True)
+                return status, bytes(output), channel.errors()
+        return await self._run(_call)
+
+    async def stat_many(self, remote_paths):
+        """Return {path: (size, mtime, mode) or None} for absolute remote paths"""
+        payload = b''.join(path.encode('utf-8') + b'\0' for path in remote_paths)
+        status, output, errors = await self.exec_command(STAT_COMMAND, payload)
+        if status == STAT_UNSUPPORTED:
+            raise IOError("Remote stat does not support --printf")
+        if not output and status not in (0, 123):
+            raise IOError(f"Remote stat failed ({status}): {errors}")
+        found = parse_stat_output(output)
+        return {path: found.get(path) for path in remote_paths}
+
+    async def list_tree(self, command, consume):
+        """Run a listing command and hand its output to `consume(chunks)` as it arrives.
+
+        `consume` runs on the I/O pool, iterating over the stdout chunks (the
+        sync layer passes its manifest decoder), so it may block; reading
+        pauses while STREAM_CHUNKS chunks wait for it. Output that may already
+        be consumed is not replayed after a reconnect. Returns (consume's
+        result, exit status, stderr).
+        """
+        transport = await self._transport()
+        if not isinstance(transport, paramiko.Transport):
+            # Brokered channels block and belong to the thread that opened them
+            async with self._slots:
+                return await self._offload(self._list_blocking, transport, command, consume)
+        chunks = queue.Queue()
+        async with self._channel(transport, command) as channel:
+            consumer = self._offload(consume, iter(chunks.get, None))
+            try:
+                while not consumer.done():
+                    if chunks.qsize() >= STREAM_CHUNKS:
+                        await asyncio.wait([consumer], timeout=SEND_POLL)
+                        continue
+                    data = await channel.recv()
+                    if not data:
+                        break
+                    chunks.put(data)
+                chunks.put(None)
+                result = await consumer
+                status = await channel.exit_status()
+                return result, status, channel.errors()
+            finally:
+                # Ends a consumer still waiting for output after a failure or cancellation
+                chunks.put(None)
+
+    @staticmethod
+    def _list_blocking(transport, command, consume):
+        channel = transport.open_session()
+        try:
+            channel.exec_command(command)
+            result = consume(iter(lambda: channel.recv(RECV_SIZE), b''))
+            while channel.recv_ready():
+                channel.recv(RECV_SIZE)
+            status = channel.recv_exit_status()
+            errors = channel.makefile_stderr('rb').read().decode('utf-8', errors='replace').strip()
+            return result, status, errors
+        finally:
+            channel.close()
+
+    async def upload(self, local_file, remote_path, progress=None):
+        """Upload a file over SCP, encrypted when file encryption is on.
+
+        The file is received under a staging name and moved into place by
+        the same remote command that creates its directory, so a file costs
+        one channel and a cancelled or failed upload never leaves a partial
+        file under the real name. `progress(bytes_sent, total)` is called per
+        chunk and may raise to abort.
+        """
+        local_file = str(local_file)
+        remote_dir = posixpath.dirname(remote_path)
+        name = sanitize_filename(posixpath.basename(remote_path))
+        if '\n' in name:
+            raise ValueError(f"Cannot send file name containing a newline: {name!r}")
+        remote_path = posixpath.join(remote_dir, name)
+        staging = remote_path + STAGING_SUFFIX
+        command = (f"mkdir -p -- {shlex.quote(remote_dir)} && scp -t {shlex.quote(staging)} && "
+                   f"mv -f -- {shlex.quote(staging)} {shlex.quote(remote_path)}")
+        cipher = self.ssh_client.hooks.cipher_for(self.config)
+
+        async def _send(transport):
+            f, size, mode, chunks = await self._offload(_open_content, local_file, cipher)
+            pending = None
+            try:
+                async with self._channel(transport, command) as channel:
+                    await _read_ack(channel)
+                    await channel.sendall(('C%04o %d %s\n' % (mode, size, name)).encode('utf-8'))
+                    await _read_ack(channel)
+                    sent = 0
+                    # The next chunk is read while the current one is sent
+                    pending = self._offload(next, chunks, b'')
+                    while True:
+                        chunk = await pending
+                        pending = None
+                        if not chunk:
+                            break
+                        pending = self._offload(next, chunks, b'')
+                        if sent + len(chunk) > size:
+                            raise IOError(f"{local_file} grew during upload")
+                        await channel.sendall(chunk)
+                        sent += len(chunk)
+                        if progress:
+                            progress(sent, size)
+                    if sent != size:
+                        raise IOError(f"{local_file} changed size during upload ({sent} of {size} bytes)")
+                    await channel.sendall(b'\0')
+                    await _read_ack(channel)
+                    channel.shutdown_write()
+                    status = await channel.exit_status()
+                    if status != 0:
+                        raise IOError(f"Upload of {remote_path} failed: {channel.errors()}")
+            finally:
+                if pending is not None:
+                    await asyncio.gather(pending, return_exceptions=True)
+                f.close()
+
+        try:
+            await self._run(_send)
+        except Exception:
+            await self._discard(staging)
+            raise
+        logger.info(f"Uploaded {local_file} to {remote_path}")
+
+    async def _discard(self, remote_path):
+        """Remove a partial remote file, logging rather than raising on failure"""
+        try:
+            await self.exec_command(f"rm -f -- {shlex.quote(remote_path)}")
+        except Exception as e:
+            logger.error(f"Failed to remove partial upload {remote_path}: {str(e)}")
+
+    async def download(self, remote_path, local_path, progress=None):
+        """Download a file over SCP, decrypting it when it is encrypted.
+
+        Data lands in a temporary file that replaces `local_path` only once
+        complete. `progress(bytes_received, total)` may raise to abort.
+        """
+        local_path = str(local_path)
+        part_path = local_path + '.gosync-part'
+        cipher = self.ssh_client.hooks.cipher_for(self.config)
+        await self._offload(lambda: Path(local_path).parent.mkdir(parents=True, exist_ok=True))
+
+        async def _receive(transport):
+            async with self._channel(transport, 'scp -f ' + shlex.quote(remote_path)) as channel:
+                await channel.sendall(b'\0')
+                header = await channel.readline()
+                if not header.startswith(b'C'):
+                    message = header[1:].decode('utf-8', errors='replace').strip()
+                    raise IOError(f"SCP error: {message or channel.errors() or 'no file header'}")
+                size = int(header.split(b' ', 2)[1])
+                await channel.sendall(b'\0')
+
+                out = await self._offload(open, part_path, 'wb')
+                try:
+                    received = 0
+                    buffered = bytearray()
+                    while received < size:
+                        data = await channel.recv(min(RECV_SIZE, size - received))
+                        if not data:
+                            raise EOFError("SCP channel closed")
+                        buffered += data
+                        received += len(data)
+                        if len(buffered) >= WRITE_SIZE or received == size:
+                            await self._offload(out.write, bytes(buffered))
+                            buffered.clear()
+                        if progress:
+                            progress(received, size)
+                finally:
+                    await self._offload(out.close)
+                await _read_ack(channel)
+                await channel.sendall(b'\0')
+
+        try:
+            await self._run(_receive)
+            await self._offload(_finish_download, part_path, local_path, cipher)
+        finally:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+        logger.info(f"Downloaded {remote_path} to {local_path}")
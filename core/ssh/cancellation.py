@@ -0,0 +1,47 @@
+import threading
+
+
+class TransferCancelled(Exception):
+    """Raised from a progress callback to abort a running transfer"""
+
+
+class CancelToken:
+    """Thread-safe stop flag checked by transfer loops and backoff sleeps.
+
+    Chunked transfers call check() (usually through progress()) once per
+    chunk and sleeps go through sleep(), so a stop request takes effect
+    within one chunk instead of after the current file.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        """Request cancellation"""
+        self._event.set()
+
+    def reset(self):
+        """Allow new work after a cancellation"""
+        self._event.clear()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def check(self):
+        """Raise TransferCancelled if cancellation was requested"""
+        if self._event.is_set():
+            raise TransferCancelled()
+
+    def sleep(self, seconds):
+        """Sleep, raising TransferCancelled as soon as cancellation is requested"""
+        if self._event.wait(seconds):
+            raise TransferCancelled()
+
+    def progress(self, callback=None):
+        """Progress callback that checks for cancellation before forwarding"""
+        def _progress(*args):
+            self.check()
+            if callback:
+                callback(*args)
+        return _progress
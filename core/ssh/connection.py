@@ -0,0 +1,114 @@
+import io
+import socket
+import time
+import logging
+import paramiko
+
+logger = logging.getLogger('GOSync')
+
+# Defaults for the connection layer, overridable from the ssh settings
+DEFAULT_KEEPALIVE_INTERVAL = 15  # seconds between transport keepalives
+DEFAULT_PROBE_INTERVAL = 30  # seconds of idleness before a liveness probe
+DEFAULT_PROBE_TIMEOUT = 5  # seconds to wait for a probe channel
+DEFAULT_CONNECT_TIMEOUT = 10
+DEFAULT_RECONNECT_ATTEMPTS = 5
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 8.0
+
+_CONNECTION_MESSAGES = (
+    'socket is closed',
+    'connection reset',
+    'broken pipe',
+    'connection lost',
+    'not connected',
+    'transport is not active',
+    'timed out',
+)
+
+
+def auth_kwargs(ssh_settings):
+    """Build paramiko authentication arguments from the ssh settings"""
+    if ssh_settings.get('password'):
+        return {'password': ssh_settings['password']}
+    key_file = io.StringIO(ssh_settings.get('ssh_key', ''))
+    return {'pkey': paramiko.RSAKey.from_private_key(key_file)}
+
+
+def is_connection_error(error):
+    """Check whether an exception means the SSH session is gone"""
+    if isinstance(error, paramiko.AuthenticationException):
+        return False
+    if isinstance(error, (EOFError, ConnectionError, socket.timeout, paramiko.SSHException)):
+        return True
+    message = str(error).lower()
+    return any(text in message for text in _CONNECTION_MESSAGES)
+
+
+def backoff_delays(attempts, base=BACKOFF_BASE, cap=BACKOFF_CAP):
+    """Yield bounded exponential delays: 0 first, then base, 2*base, ... cap"""
+    yield 0
+    delay = base
+    for _ in range(attempts - 1):
+        yield delay
+        delay = min(delay * 2, cap)
+
+
+def probe_transport(transport, timeout=DEFAULT_PROBE_TIMEOUT):
+    """Actively check a transport by opening and closing a channel.
+
+    A half-dead session (e.g. dropped by a NAT) still reports is_active(),
+    but cannot open a channel within the timeout.
+    """
+    if not transport or not transport.is_active():
+        return False
+    try:
+        channel = transport.open_session(timeout=timeout)
+        channel.close()
+        return True
+    except Exception as e:
+        logger.warning(f"SSH liveness probe failed: {str(e)}")
+        return False
+
+
+def apply_keepalive(transport, interval=DEFAULT_KEEPALIVE_INTERVAL):
+    """Enable transport-level and TCP keepalives"""
+    if not transport:
+        return
+    transport.set_keepalive(interval)
+    sock = transport.sock
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        if hasattr(socket, 'TCP_KEEPIDLE'):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, interval)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, interval)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, 3)
+    except (OSError, AttributeError) as e:
+        logger.debug(f"TCP keepalive not available: {str(e)}")
+
+
+def retry_on_disconnect(reconnect, operation, attempts=DEFAULT_RECONNECT_ATTEMPTS,
+                        sleep=time.sleep):
+    """Run an operation, reconnecting with backoff when the session drops.
+
+    `reconnect` is called before each retry and the operation is replayed,
+    so a network blip costs one reconnect instead of a failed operation.
+    `sleep` can be a cancellable sleep such as CancelToken.sleep.
+    """
+    last_error = None
+    for delay in backoff_delays(attempts):
+        if delay:
+            sleep(delay)
+            try:
+                reconnect()
+            except Exception as e:
+                last_error = e
+                logger.warning(f"Reconnect failed, retrying in backoff: {str(e)}")
+                continue
+        try:
+            return operation()
+        except Exception as e:
+            if not is_connection_error(e):
+                raise
+            last_error = e
+            logger.warning(f"Connection lost during operation: {str(e)}")
+    raise last_error
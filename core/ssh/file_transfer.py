@@ -1,12 +1,81 @@
 import logging
+import os
+import posixpath
+import shlex
 from pathlib import Path
 from PySide6.QtCore import QObject, Signal
-from scp import SCPClient
+from core.ssh.connection import retry_on_disconnect
+from core.ssh.cancellation import TransferCancelled
+from core.ssh.upload_reader import send_file
 import unicodedata
 import re
 
 logger = logging.getLogger('GOSync')
 
+STAGING_SUFFIX = '.gosync-part'  # Transfers land under this name and are renamed into place
+
+
+def sanitize_filename(filename):
+    """Sanitize filename to handle special characters"""
+    # Normalize Unicode characters
+    filename = unicodedata.normalize('NFKC', filename)
+    # Replace problematic characters with safe alternatives
+    filename = re.sub(r'[\\/:*?"<>|｜]', '_', filename)
+    return filename
+
+
+def send_staged(ssh_client, remote_path, upload):
+    """Run `upload(path)` against a staging name and rename the result over `remote_path`.
+
+    A cancelled or failed upload removes its staging file, so a truncated
+    copy never appears under the real name, where name-based comparison
+    would take it for complete.
+    """
+    staging = remote_path + STAGING_SUFFIX
+    try:
+        upload(staging)
+    except Exception:
+        try:
+            ssh_client.session_call(lambda session: session.call(f"rm -f -- {shlex.quote(staging)}"))
+        except Exception as e:
+            logger.error(f"Failed to remove partial upload {staging}: {str(e)}")
+        raise
+    request = ssh_client.session_call(
+        # A rename on a slow disk may take a while; no timeout, so it is not replayed
+        lambda session: session.wait(session.mv(staging, remote_path, timeout=None))
+    )
+    if not request.ok:
+        raise IOError(f"Failed to move {staging} into place: {request.text().strip()}")
+
+
+class TransferHooks:
+    """Content and placement strategies for SSH-layer transfers.
+
+    The defaults send contents unchanged. The sync layer passes
+    core.sync.snapshots.SyncTransferHooks instead, which encrypts contents
+    when configured, so this layer never imports sync modules.
+    """
+
+    def cipher_for(self, config):
+        """Cipher for file contents, or None to transfer them unchanged"""
+        return None
+
+    def send(self, ssh_client, transport, local_file, remote_path, cipher=None, progress=None):
+        """Upload a local file over SCP, staged and renamed to `remote_path`"""
+        send_staged(ssh_client, remote_path,
+                    lambda target: send_file(transport, local_file, target, progress=progress))
+
+    def receive(self, sftp, remote_path, local_path, cipher=None, callback=None):
+        """Download a remote file over SFTP, replacing `local_path` only once it is complete"""
+        local_path = Path(local_path)
+        part_path = local_path.with_name(local_path.name + STAGING_SUFFIX)
+        try:
+            sftp.get(remote_path, str(part_path), callback=callback)
+            os.replace(part_path, local_path)
+        finally:
+            part_path.unlink(missing_ok=True)
+
+
 class FileTransferManager(QObject):
     transfer_progress = Signal(str)  # Progress message
     transfer_complete = Signal(bool, str)  # Success, Message
@@ -19,9 +88,10 @@ class FileTransferManager(QObject):
     def ensure_sftp(self):
         """Ensure SFTP connection is active"""
         try:
-            if not self.sftp or not self.ssh_client.is_connected():
-                if not self.ssh_client.is_connected():
-                    self.ssh_client.connect()
+            self.ssh_client.ensure_connected()
+            transport = self.ssh_client.client.get_transport()
+            # Reopen the SFTP session if the client reconnected underneath us
+            if not self.sftp or self.sftp.get_channel().get_transport() is not transport:
                 self.sftp = self.ssh_client.client.open_sftp()
             return True
         except Exception as e:
@@ -30,20 +100,20 @@ class FileTransferManager(QObject):
 
     def sanitize_filename(self, filename):
         """Sanitize filename to handle special characters"""
-        # Normalize Unicode characters
-        filename = unicodedata.normalize('NFKC', filename)
-        # Replace problematic characters with safe alternatives
-        filename = re.sub(r'[\\/:*?"<>|｜]', '_', filename)
-        return filename
+        return sanitize_filename(filename)
     
-    def download_file(self, remote_file, local_path):
-        """Download a single file from remote server"""
+    def download_file(self, remote_file, local_path, callback=None):
+        """Download a single file from remote server.
+        
+        `callback(bytes_done, total)` is called per chunk and may raise
+        TransferCancelled to abort. Returns True on success.
+        """
         try:
             if not self.ensure_sftp():
                 error_msg = "Failed to establish SFTP connection"
                 logger.error(error_msg)
                 self.transfer_complete.emit(False, error_msg)
-                return
+                return False
             
             # Create local directory if it doesn't exist
             local_path = Path(local_path)
@@ -51,11 +121,21 @@ class FileTransferManager(QObject):
             
             self.transfer_progress.emit(f"Downloading {remote_file}...")
             
+            hooks = self.ssh_client.hooks
+            cipher = hooks.cipher_for(self.ssh_client.config)
+            
+            def _get():
+                # Received into a part file so an interrupted download keeps the existing copy
+                hooks.receive(self.sftp, remote_file, local_path, cipher, callback)
+            
             # Use existing SFTP connection
             try:
-                self.sftp.get(remote_file, str(local_path))
+                retry_on_disconnect(self.ensure_sftp, _get)
                 logger.info(f"Downloaded {remote_file} to {local_path}")
                 self.transfer_complete.emit(True, f"Downloaded {remote_file} successfully")
+                return True
+            except TransferCancelled:
+                self.transfer_complete.emit(False, f"Cancelled download of {remote_file}")
             except FileNotFoundError:
                 error_msg = f"File does not exist on the remote server: {remote_file}"
                 logger.error(error_msg)
@@ -69,38 +149,51 @@ class FileTransferManager(QObject):
             error_msg = f"Failed to download {remote_file}: {str(e)}"
             logger.error(error_msg.encode('utf-8', errors='replace').decode('utf-8'))
             self.transfer_complete.emit(False, error_msg)
+        return False
     
-    def upload_file(self, local_file, remote_path):
-        """Upload a single file to remote server"""
+    def upload_file(self, local_file, remote_path, callback=None):
+        """Upload a single file to remote server.
+        
+        `callback(bytes_done, total)` is called per chunk and may raise
+        TransferCancelled to abort. Returns True on success.
+        """
         try:
             if not self.ssh_client.is_connected():
                 self.transfer_progress.emit("Connecting to server...")
-                self.ssh_client.connect()
             
             local_file = Path(local_file)
             if not local_file.exists():
                 raise FileNotFoundError(f"Local file not found: {local_file}")
             
             # Sanitize remote path
-            remote_dir = Path(remote_path).parent
-            remote_name = self.sanitize_filename(Path(remote_path).name)
-            remote_path = str(remote_dir / remote_name)
-            
-            # Create remote directory if needed
-            self.ssh_client.client.exec_command(f'mkdir -p "{remote_dir}"')
+            remote_dir = posixpath.dirname(remote_path)
+            remote_name = self.sanitize_filename(posixpath.basename(remote_path))
+            remote_path = posixpath.join(remote_dir, remote_name)
             
             self.transfer_progress.emit(f"Uploading {local_file.name}...")
+            hooks = self.ssh_client.hooks
+            cipher = hooks.cipher_for(self.ssh_client.config)
+            
+            def _upload(client):
+                # Create remote directory if needed
+                self.ssh_client.remote_session().mkdir(remote_dir)
+                self.ssh_client.remote_session().flush()
+                hooks.send(self.ssh_client, client.get_transport(), local_file, remote_path,
+                           cipher=cipher, progress=callback)
             
-            with SCPClient(self.ssh_client.client.get_transport()) as scp:
-                scp.put(str(local_file), remote_path)
+            self.ssh_client.run(_upload)
             
             logger.info(f"Uploaded {local_file} to {remote_path}")
             self.transfer_complete.emit(True, f"Uploaded {local_file.name} successfully")
+            return True
             
+        except TransferCancelled:
+            self.transfer_complete.emit(False, f"Cancelled upload of {local_file}")
         except Exception as e:
             error_msg = f"Failed to upload {local_file}: {str(e)}"
             logger.error(error_msg.encode('utf-8', errors='replace').decode('utf-8'))
             self.transfer_complete.emit(False, error_msg)
+        return False
     
     def verify_file_exists(self, remote_path):
         """Check if file exists on remote server"""
@@ -124,15 +217,18 @@ class FileTransferManager(QObject):
     def get_file_size(self, remote_path):
         """Get size of remote file"""
         try:
-            if not self.ssh_client.is_connected():
-                self.ssh_client.connect()
-            
-            cmd = f'stat -f "%z" "{remote_path}" 2>/dev/null || stat -c "%s" "{remote_path}"'
-            stdin, stdout, stderr = self.ssh_client.client.exec_command(cmd)
-            size = stdout.read().decode().strip()
-            
-            return int(size) if size.isdigit() else 0
+            result = self.ssh_client.stat_many([remote_path]).get(remote_path)
+            return result[0] if result else 0
             
         except Exception as e:
             logger.error(f"Failed to get file size: {str(e)}")
-            return 0 
\ No newline at end of file
+            return 0
+    
+    def get_file_sizes(self, remote_paths):
+        """Get sizes of many remote files in one round trip"""
+        try:
+            results = self.ssh_client.stat_many(remote_paths)
+            return {path: (meta[0] if meta else 0) for path, meta in results.items()}
+        except Exception as e:
+            logger.error(f"Failed to get file sizes: {str(e)}")
+            return {path: 0 for path in remote_paths}
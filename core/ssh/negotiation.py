@@ -0,0 +1,169 @@
+import os
+import time
+import logging
+import paramiko
+from core.ssh.connection import auth_kwargs
+
+logger = logging.getLogger('GOSync')
+
+# Fast AEAD ciphers first; anything the installed paramiko does not
+# implement is skipped when the transport is built.
+DEFAULT_CIPHERS = [
+    'aes128-gcm@openssh.com',
+    'chacha20-poly1305@openssh.com',
+    'aes256-gcm@openssh.com',
+    'aes128-ctr',
+    'aes256-ctr',
+]
+DEFAULT_MACS = [
+    'hmac-sha2-256-etm@openssh.com',
+    'hmac-sha2-256',
+    'hmac-sha1',
+]
+DEFAULT_KEX = [
+    'curve25519-sha256@libssh.org',
+    'ecdh-sha2-nistp256',
+    'diffie-hellman-group14-sha256',
+]
+
+PROBE_PAYLOAD_MB = 16
+PROBE_CHUNK = 64 * 1024
+
+
+def _known(kind):
+    """Algorithms of one kind implemented by the installed paramiko"""
+    if kind == 'ciphers':
+        return paramiko.Transport._cipher_info
+    if kind == 'macs':
+        return paramiko.Transport._mac_info
+    return paramiko.Transport._kex_info
+
+
+def supported(kind, names):
+    """Filter a preference list down to algorithms paramiko implements"""
+    known = _known(kind)
+    result = [name for name in names if name in known]
+    skipped = [name for name in names if name not in known]
+    if skipped:
+        logger.debug(f"Skipping unsupported {kind}: {', '.join(skipped)}")
+    return result
+
+
+def resolve_preferences(transport_settings, hostname):
+    """Merge configured preferences with the stored probe result for a host"""
+    prefs = {
+        'ciphers': list(transport_settings.get('ciphers') or DEFAULT_CIPHERS),
+        'macs': list(transport_settings.get('macs') or DEFAULT_MACS),
+        'kex': list(transport_settings.get('kex') or DEFAULT_KEX),
+        'compress': bool(transport_settings.get('compression', False)),
+    }
+    best = transport_settings.get('hosts', {}).get(hostname)
+    if best:
+        # Move the measured winner to the front of each list
+        for kind, key in (('ciphers', 'cipher'), ('macs', 'mac')):
+            if best.get(key):
+                prefs[kind] = [best[key]] + [n for n in prefs[kind] if n != best[key]]
+        prefs['compress'] = bool(best.get('compress', prefs['compress']))
+    return prefs
+
+
+def make_transport_factory(prefs):
+    """Build a paramiko transport factory applying algorithm preferences"""
+    def factory(sock, **kwargs):
+        transport = paramiko.Transport(sock, **kwargs)
+        options = transport.get_security_options()
+        for kind in ('ciphers', 'macs', 'kex'):
+            names = supported(kind, prefs[kind])
+            if names:
+                # Keep paramiko's remaining algorithms as a fallback
+                rest = [n for n in getattr(options, kind) if n not in names]
+                setattr(options, kind, tuple(names + rest))
+        return transport
+    return factory
+
+
+def connect_kwargs(config, hostname=None):
+    """Extra paramiko connect() arguments for the configured preferences"""
+    transport_settings = config.get_transport_settings()
+    hostname = hostname or config.get_ssh_settings().get('hostname', '')
+    prefs = resolve_preferences(transport_settings, hostname)
+    return {
+        'compress': prefs['compress'],
+        'transport_factory': make_transport_factory(prefs),
+    }
+
+
+def _measure(ssh_settings, cipher, mac, kex, compress, payload_mb):
+    """Push payload_mb through one connection and return MB/s"""
+    prefs = {'ciphers': [cipher], 'macs': [mac], 'kex': kex, 'compress': compress}
+    client = paramiko.SSHClient()
+    client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+    try:
+        client.connect(
+            hostname=ssh_settings['hostname'],
+            username=ssh_settings['username'],
+            look_for_keys=False,
+            allow_agent=False,
+            compress=compress,
+            transport_factory=make_transport_factory(prefs),
+            **auth_kwargs(ssh_settings)
+        )
+        transport = client.get_transport()
+        if transport.remote_cipher != cipher and transport.local_cipher != cipher:
+            raise ValueError(f"server did not accept {cipher}")
+
+        # Half random, half zeros: roughly what a mixed tree compresses to
+        block = os.urandom(PROBE_CHUNK // 2) + bytes(PROBE_CHUNK // 2)
+        chunks = payload_mb * 1024 * 1024 // PROBE_CHUNK
+
+        channel = transport.open_session()
+        channel.exec_command('cat > /dev/null')
+        start = time.perf_counter()
+        for _ in range(chunks):
+            channel.sendall(block)
+        channel.shutdown_write()
+        channel.recv_exit_status()
+        elapsed = time.perf_counter() - start
+        channel.close()
+        return payload_mb / elapsed if elapsed > 0 else 0.0
+    finally:
+        client.close()
+
+
+def probe(config, payload_mb=PROBE_PAYLOAD_MB, progress=None):
+    """Measure every cipher/compression combination against the configured host.
+
+    The fastest choice is stored per host in the transport settings and
+    used for all later connections. Returns the results, fastest first.
+    """
+    ssh_settings = config.get_ssh_settings()
+    hostname = ssh_settings['hostname']
+    transport_settings = config.get_transport_settings()
+    prefs = resolve_preferences(transport_settings, None)
+
+    macs = supported('macs', prefs['macs']) or [paramiko.Transport._preferred_macs[0]]
+    kex = prefs['kex']
+
+    results = []
+    for cipher in supported('ciphers', prefs['ciphers']):
+        for compress in (False, True):
+            label = f"{cipher}, {macs[0]}, compression {'on' if compress else 'off'}"
+            try:
+                rate = _measure(ssh_settings, cipher, macs[0], kex, compress, payload_mb)
+                results.append({'cipher': cipher, 'mac': macs[0], 'compress': compress, 'mb_per_s': rate})
+                message = f"{label}: {rate:.1f} MB/s"
+            except Exception as e:
+                message = f"{label}: failed ({str(e)})"
+            logger.info(f"Transport probe {message}")
+            if progress:
+                progress(message)
+
+    results.sort(key=lambda r: r['mb_per_s'], reverse=True)
+    if results:
+        best = dict(results[0])
+        best['probed_at'] = time.time()
+        transport_settings.setdefault('hosts', {})[hostname] = best
+        config.save_transport_settings(transport_settings)
+        logger.info(f"Stored fastest transport for {hostname}: {best['cipher']}, "
+                    f"compression {'on' if best['compress'] else 'off'}")
+    return results
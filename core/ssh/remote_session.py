@@ -0,0 +1,215 @@
+import logging
+import secrets
+import shlex
+import socket
+import threading
+from core.ssh.connection import probe_transport
+
+logger = logging.getLogger('GOSync')
+
+DEFAULT_TIMEOUT = 30  # Seconds a request may take unless it passes its own timeout
+MAX_IN_FLIGHT = 64  # Requests written ahead of their replies before submit() reads some
+
+
+class RemoteSessionError(ConnectionError):
+    """Raised when the remote session channel breaks or the protocol is violated.
+
+    Subclasses ConnectionError so callers reconnect and replay the request.
+    """
+
+
+class RemoteSessionTimeout(IOError):
+    """A request did not finish within its timeout while the connection stayed alive.
+
+    Not a ConnectionError: replaying a slow command on a new connection
+    would only time out again.
+    """
+
+
+class RemoteRequest:
+    """Pending result of one request on a RemoteSession"""
+    __slots__ = ('request_id', 'command', 'timeout', 'status', 'output', 'done')
+
+    def __init__(self, request_id, command, timeout=DEFAULT_TIMEOUT):
+        self.request_id = request_id
+        self.command = command
+        self.timeout = timeout  # Seconds to wait for the reply, None for no limit
+        self.status = None
+        self.output = b''
+        self.done = False
+
+    @property
+    def ok(self):
+        return self.status == 0
+
+    def text(self):
+        """Output decoded as UTF-8"""
+        return self.output.decode('utf-8', errors='replace')
+
+
+class RemoteSession:
+    """Long-lived remote shell for small metadata operations.
+
+    One `sh` process runs behind a single channel. Each request is written
+    as a shell snippet whose reply is framed as
+
+        <token> <request id> <exit status> <byte length>\\n<output>
+
+    so many requests can be pipelined and their replies matched back,
+    turning hundreds of stat/mkdir/rm/mv/hash calls into one or two round
+    trips instead of one channel and process per call. At most
+    MAX_IN_FLIGHT requests are written ahead of their replies, so a large
+    batch cannot fill both channel windows and stall.
+
+    Each request carries its own timeout. A request that overruns it
+    closes the session (the shell is still busy with it) and raises
+    RemoteSessionTimeout, unless the connection itself no longer answers.
+    """
+
+    def __init__(self, transport):
+        self.transport = transport
+        self._token = secrets.token_hex(8)
+        self._lock = threading.RLock()
+        self._next_id = 1
+        self._pending = {}
+        self._buffer = b''
+        self._channel = transport.open_session()
+        # C locale makes ${#out} count bytes rather than characters
+        self._channel.exec_command('env LC_ALL=C sh -s')
+
+    def is_open(self):
+        """Check whether the channel is still usable"""
+        channel = self._channel
+        return bool(channel and not channel.closed and self.transport.is_active()
+                    and not channel.exit_status_ready())
+
+    def close(self):
+        """Close the remote shell"""
+        if self._channel:
+            try:
+                self._channel.sendall(b'exit\n')
+            except Exception:
+                pass
+            self._channel.close()
+            self._channel = None
+
+    def submit(self, command, timeout=DEFAULT_TIMEOUT):
+        """Send a request without waiting for its reply; `timeout` None waits indefinitely"""
+        with self._lock:
+            if not self.is_open():
+                raise RemoteSessionError("Remote session is closed")
+            while len(self._pending) >= MAX_IN_FLIGHT:
+                self._read_reply()
+            request = RemoteRequest(self._next_id, command, timeout)
+            self._next_id += 1
+            self._pending[request.request_id] = request
+            frame = (
+                f"out=$({{ {command}\n}} 2>&1); rc=$?; "
+                f"printf '%s %s %s %s\\n' {self._token} {request.request_id} \"$rc\" \"${{#out}}\"; "
+                f"printf '%s' \"$out\"\n"
+            )
+            self._channel.sendall(frame.encode('utf-8'))
+            return request
+
+    def wait(self, request):
+        """Read replies until the given request is complete"""
+        with self._lock:
+            while not request.done:
+                self._read_reply()
+            return request
+
+    def flush(self):
+        """Wait for every outstanding request"""
+        with self._lock:
+            while self._pending:
+                self._read_reply()
+
+    def call(self, command, timeout=DEFAULT_TIMEOUT):
+        """Run one request and wait for it"""
+        return self.wait(self.submit(command, timeout))
+
+    def run_many(self, commands):
+        """Pipeline a batch of requests and return them once all completed"""
+        with self._lock:
+            requests = [self.submit(command) for command in commands]
+            self.flush()
+            return requests
+
+    def _recv(self):
+        if self._channel is None or not self._pending:
+            # Closed after another request timed out
+            raise RemoteSessionError("Remote session is closed")
+        # Replies arrive in request order, so the oldest pending request's timeout applies
+        request = self._pending[min(self._pending)]
+        self._channel.settimeout(request.timeout)
+        try:
+            data = self._channel.recv(65536)
+        except socket.timeout:
+            self._timed_out(request)
+        except Exception as e:
+            raise RemoteSessionError(f"Remote session read failed: {str(e)}")
+        if not data:
+            raise RemoteSessionError("Remote session closed unexpectedly")
+        self._buffer += data
+
+    def _timed_out(self, request):
+        """Give up on a slow request, telling a lost connection apart from a busy server"""
+        self.close()
+        self._pending.clear()
+        if not probe_transport(self.transport):
+            raise RemoteSessionError("Remote session stopped answering")
+        # The command goes to the log only; its paths could read like a connection error
+        logger.warning(f"Remote session request overran its timeout: {request.command[:200]}")
+        raise RemoteSessionTimeout(f"Remote command exceeded its {request.timeout} s limit")
+
+    def _read_reply(self):
+        """Read exactly one framed reply"""
+        while b'\n' not in self._buffer:
+            self._recv()
+        header, _, self._buffer = self._buffer.partition(b'\n')
+        parts = header.decode('ascii', errors='replace').split(' ')
+        if len(parts) != 4 or parts[0] != self._token:
+            raise RemoteSessionError(f"Unexpected remote session output: {header[:80]!r}")
+        request_id, status, length = int(parts[1]), int(parts[2]), int(parts[3])
+        while len(self._buffer) < length:
+            self._recv()
+        output, self._buffer = self._buffer[:length], self._buffer[length:]
+
+        request = self._pending.pop(request_id, None)
+        if request is not None:
+            request.status = status
+            request.output = output
+            request.done = True
+
+    # Metadata helpers; each returns a RemoteRequest that can be pipelined
+
+    def stat(self, path):
+        """Request size, mtime and raw mode (hex) of a path"""
+        return self.submit(f"stat -c '%s %Y %f' -- {shlex.quote(path)}")
+
+    def mkdir(self, path):
+        """Request creation of a directory and its parents"""
+        return self.submit(f"mkdir -p -- {shlex.quote(path)}")
+
+    def rm(self, path):
+        """Request removal of a file"""
+        return self.submit(f"rm -f -- {shlex.quote(path)}")
+
+    def mv(self, source, target, timeout=DEFAULT_TIMEOUT):
+        """Request a rename on the server"""
+        return self.submit(f"mv -f -- {shlex.quote(source)} {shlex.quote(target)}", timeout)
+
+    def sha256(self, path, timeout=None):
+        """Request the sha256 of a file; hashing time grows with its size, so no limit by default"""
+        return self.submit(f"sha256sum -- {shlex.quote(path)} | cut -d' ' -f1", timeout)
+
+
+def parse_stat(request):
+    """Turn a completed stat request into (size, mtime, mode) or None"""
+    if not request.ok:
+        return None
+    try:
+        size, mtime, mode = request.text().split()
+        return int(size), float(mtime), int(mode, 16)
+    except ValueError:
+        return None
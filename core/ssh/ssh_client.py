@@ -1,12 +1,64 @@
 import paramiko
 import logging
+import posixpath
+import shlex
+import threading
+import time
 from pathlib import Path
 import io
 from PySide6.QtCore import QThread, Signal, QObject
 from scp import SCPClient
+from core.ssh.connection import (
+    DEFAULT_CONNECT_TIMEOUT, DEFAULT_KEEPALIVE_INTERVAL, DEFAULT_PROBE_INTERVAL,
+    DEFAULT_RECONNECT_ATTEMPTS, apply_keepalive, auth_kwargs, backoff_delays,
+    probe_transport, retry_on_disconnect
+)
+from core.ssh.file_transfer import TransferHooks
+from core.ssh.negotiation import connect_kwargs
+from core.ssh.remote_session import RemoteSession
 
 logger = logging.getLogger('GOSync')
 
+STAT_UNSUPPORTED = 90  # Exit status of STAT_COMMAND when the server's stat lacks --printf
+# Stats NUL-delimited paths read from stdin in one round trip. Missing paths make
+# xargs exit 123, so GNU stat is checked up front rather than inferred from the status.
+STAT_COMMAND = (
+    f"stat --printf '' -- / >/dev/null 2>&1 || exit {STAT_UNSUPPORTED}; "
+    "xargs -0 stat --printf '%n\\0%s %Y %f\\0' --"
+)
+# Path bytes per STAT_COMMAND run. Each batch and its output fit in the channel
+# windows, so writing a whole batch before reading cannot stall either side.
+STAT_BATCH_BYTES = 256 * 1024
+
+
+def stat_batches(paths):
+    """Split paths into NUL-terminated STAT_COMMAND inputs of at most STAT_BATCH_BYTES"""
+    batch = []
+    size = 0
+    for path in paths:
+        encoded = path.encode('utf-8') + b'\0'
+        if batch and size + len(encoded) > STAT_BATCH_BYTES:
+            yield b''.join(batch)
+            batch, size = [], 0
+        batch.append(encoded)
+        size += len(encoded)
+    if batch:
+        yield b''.join(batch)
+
+
+def parse_stat_output(output):
+    """Parse STAT_COMMAND output into {path: (size, mtime, mode)}"""
+    found = {}
+    fields = output.split(b'\0')
+    for name, meta in zip(fields[0::2], fields[1::2]):
+        try:
+            size, mtime, mode = meta.split()
+            found[name.decode('utf-8', errors='replace')] = (int(size), float(mtime), int(mode, 16))
+        except ValueError:
+            continue
+    return found
+
+
 class SSHWorker(QThread):
     connected = Signal(bool, str)  # Success, Message
     operation_complete = Signal(bool, str)  # Success, Message
@@ -20,26 +72,23 @@ class SSHWorker(QThread):
         self.sftp = None
         self.operation = None
         self.params = None
-        self._reconnect_attempts = 3
+        self._reconnect_attempts = DEFAULT_RECONNECT_ATTEMPTS
     
     def ensure_connected(self):
-        """Ensure SSH connection is active, reconnect if needed"""
+        """Ensure SSH connection is active, reconnect with backoff if needed"""
         try:
-            if self.is_connected():
+            if self.is_connected() and probe_transport(self.client.get_transport()):
                 return True
             
-            for attempt in range(self._reconnect_attempts):
+            for attempt, delay in enumerate(backoff_delays(self._reconnect_attempts)):
+                if delay:
+                    time.sleep(delay)
                 try:
+                    self.disconnect()
                     self._connect()
                     return True
                 except Exception as e:
                     logger.warning(f"Connection attempt {attempt + 1} failed: {str(e)}")
-                    if self.client:
-                        self.client.close()
-                    if self.sftp:
-                        self.sftp.close()
-                    self.client = None
-                    self.sftp = None
             
             raise Exception("Failed to establish SSH connection after multiple attempts")
             
@@ -66,10 +115,19 @@ class SSHWorker(QThread):
             
             # Connect to remote host
             self.operation_progress.emit(f"Connecting to {ssh_settings['hostname']}...")
+            timeout = ssh_settings.get('connect_timeout', DEFAULT_CONNECT_TIMEOUT)
             self.client.connect(
                 hostname=ssh_settings['hostname'],
                 username=ssh_settings['username'],
-                **auth
+                timeout=timeout,
+                banner_timeout=timeout,
+                auth_timeout=timeout,
+                **auth,
+                **connect_kwargs(self.config, ssh_settings['hostname'])
+            )
+            apply_keepalive(
+                self.client.get_transport(),
+                ssh_settings.get('keepalive_interval', DEFAULT_KEEPALIVE_INTERVAL)
             )
             
             # Open SFTP session
@@ -156,7 +214,11 @@ class SSHWorker(QThread):
             
             # Upload file
             self.operation_progress.emit(f"Uploading {local_file}...")
-            self.sftp.put(str(local_file), str(remote_path).replace('\\', '/'))
+            retry_on_disconnect(
+                self.ensure_connected,
+                lambda: self.sftp.put(str(local_file), str(remote_path).replace('\\', '/')),
+                self._reconnect_attempts
+            )
             
             logger.info(f"Uploaded {local_file} to {remote_path}")
             self.operation_complete.emit(True, f"Uploaded {local_file}")
@@ -172,21 +234,19 @@ class SSHWorker(QThread):
         
         for part in path.split('/'):
             current = current + '/' + part if current else '/' + part
-            try:
-                self.sftp.stat(current)
-            except FileNotFoundError:
-                try:
-                    self.sftp.mkdir(current)
-                    logger.info(f"Created remote directory: {current}")
-                except Exception as e:
-                    if "Socket is closed" in str(e):
-                        if self.ensure_connected():
-                            self.sftp.mkdir(current)
-                            logger.info(f"Created remote directory after reconnection: {current}")
-                        else:
-                            raise
-                    else:
-                        raise
+            retry_on_disconnect(
+                self.ensure_connected,
+                lambda: self._mkdir_if_missing(current),
+                self._reconnect_attempts
+            )
+    
+    def _mkdir_if_missing(self, path):
+        """Create a single remote directory if it does not exist"""
+        try:
+            self.sftp.stat(path)
+        except FileNotFoundError:
+            self.sftp.mkdir(path)
+            logger.info(f"Created remote directory: {path}")
 
     def _download_file(self):
         """Download file from remote server"""
@@ -205,7 +265,11 @@ class SSHWorker(QThread):
             
             # Download file
             self.operation_progress.emit(f"Downloading {remote_file}...")
-            self.sftp.get(str(remote_path).replace('\\', '/'), str(local_file))
+            retry_on_disconnect(
+                self.ensure_connected,
+                lambda: self.sftp.get(str(remote_path).replace('\\', '/'), str(local_file)),
+                self._reconnect_attempts
+            )
             
             logger.info(f"Downloaded {remote_path} to {local_file}")
             self.operation_complete.emit(True, f"Downloaded {remote_file}")
@@ -232,9 +296,9 @@ class SSHWorker(QThread):
             return False
         
         try:
-            self.client.get_transport().is_active()
-            return True
-        except:
+            transport = self.client.get_transport()
+            return bool(transport and transport.is_active())
+        except Exception:
             return False
     
     def _list_remote_files_recursive(self, remote_path, relative_path, files):
@@ -275,12 +339,19 @@ class SSHWorker(QThread):
             self.operation_complete.emit(False, str(e))
 
 class SSHClient(QObject):
-    def __init__(self, config):
+    def __init__(self, config, hooks=None):
         super().__init__()
         self.config = config
+        self.hooks = hooks or TransferHooks()  # Encryption and placement, supplied by the sync layer
         self.client = None
         self._setup_client()
         self.worker = None
+        self._last_activity = 0.0
+        self._session = None
+        self._stat_cache = {}  # Path -> (size, mtime, mode) or None, per sync cycle
+        self._connect_lock = threading.RLock()  # Parallel uploads share one connection
+        self.cancel_token = None  # Makes backoff sleeps cancellable when set
+        self.borrow_connection = None  # (hostname, username) -> connected stand-in client or None
     
     def _setup_client(self):
         """Initialize SSH client with default settings"""
@@ -289,37 +360,147 @@ class SSHClient(QObject):
     
     def connect(self):
         """Connect to remote server using either password or key-based auth"""
+        if self.borrow_connection and self._connect_borrowed():
+            return
         if not self.client:
             self._setup_client()
             
         try:
             ssh_settings = self.config.get_ssh_settings()
+            timeout = ssh_settings.get('connect_timeout', DEFAULT_CONNECT_TIMEOUT)
             
-            if ssh_settings.get('password'):
-                # Password authentication
-                self.client.connect(
-                    hostname=ssh_settings['hostname'],
-                    username=ssh_settings['username'],
-                    password=ssh_settings['password'],
-                    look_for_keys=False,
-                    allow_agent=False
-                )
-            else:
-                # Key-based authentication
-                self.client.connect(
-                    hostname=ssh_settings['hostname'],
-                    username=ssh_settings['username'],
-                    key_filename=ssh_settings['key_path'],
-                    look_for_keys=False,
-                    allow_agent=False
-                )
+            self.client.connect(
+                hostname=ssh_settings['hostname'],
+                username=ssh_settings['username'],
+                look_for_keys=False,
+                allow_agent=False,
+                timeout=timeout,
+                banner_timeout=timeout,
+                auth_timeout=timeout,
+                **auth_kwargs(ssh_settings),
+                **connect_kwargs(self.config, ssh_settings['hostname'])
+            )
+            apply_keepalive(
+                self.client.get_transport(),
+                ssh_settings.get('keepalive_interval', DEFAULT_KEEPALIVE_INTERVAL)
+            )
+            self._last_activity = time.monotonic()
             logger.info("SSH connection established successfully")
         except Exception as e:
             logger.error(f"SSH connection failed: {str(e)}")
             raise
     
+    def _connect_borrowed(self):
+        """Use a connection lent by borrow_connection (e.g. the running instance's), False if none"""
+        ssh_settings = self.config.get_ssh_settings()
+        client = self.borrow_connection(ssh_settings['hostname'], ssh_settings['username'])
+        if client is None:
+            return False
+        self.client = client
+        self._last_activity = time.monotonic()
+        logger.info("Using a borrowed SSH connection")
+        return True
+    
+    def reconnect(self):
+        """Drop the current session and connect again"""
+        if self.client:
+            try:
+                self.client.close()
+            except Exception:
+                pass
+        self.client = None
+        self.connect()
+    
+    def ensure_connected(self):
+        """Make sure the session is usable, probing it if it has been idle.
+        
+        Reconnects with bounded exponential backoff when the session is gone.
+        """
+        ssh_settings = self.config.get_ssh_settings()
+        probe_interval = ssh_settings.get('probe_interval', DEFAULT_PROBE_INTERVAL)
+        
+        with self._connect_lock:
+            if self.is_connected():
+                if time.monotonic() - self._last_activity < probe_interval:
+                    return
+                if probe_transport(self.client.get_transport()):
+                    self._last_activity = time.monotonic()
+                    return
+                logger.warning("SSH session failed liveness probe, reconnecting")
+            
+            attempts = ssh_settings.get('reconnect_attempts', DEFAULT_RECONNECT_ATTEMPTS)
+            last_error = None
+            for delay in backoff_delays(attempts):
+                if delay:
+                    self._sleep(delay)
+                try:
+                    self.reconnect()
+                    return
+                except paramiko.AuthenticationException:
+                    raise
+                except Exception as e:
+                    last_error = e
+                    logger.warning(f"Reconnect attempt failed: {str(e)}")
+            raise last_error
+    
+    def _sleep(self, seconds):
+        """Backoff sleep that ends early when the cancel token fires"""
+        if self.cancel_token:
+            self.cancel_token.sleep(seconds)
+        else:
+            time.sleep(seconds)
+    
+    def run(self, operation):
+        """Run `operation(client)` and replay it transparently after a reconnect"""
+        self.ensure_connected()
+        attempts = self.config.get_ssh_settings().get(
+            'reconnect_attempts', DEFAULT_RECONNECT_ATTEMPTS
+        )
+        used = []
+        
+        def _attempt():
+            used[:] = [self.client]
+            return operation(self.client)
+        
+        def _reconnect():
+            with self._connect_lock:
+                # Another thread may already have replaced the failed connection
+                if self.client is used[0] or not self.is_connected():
+                    self.reconnect()
+        
+        result = retry_on_disconnect(_reconnect, _attempt, attempts, sleep=self._sleep)
+        self._last_activity = time.monotonic()
+        return result
+    
+    def remote_session(self):
+        """Return the persistent remote command session, reopening it after reconnects"""
+        with self._connect_lock:
+            transport = self.client.get_transport()
+            session = self._session
+            if not session or session.transport is not transport or not session.is_open():
+                if session:
+                    session.close()
+                self._session = RemoteSession(transport)
+            return self._session
+    
+    def session_call(self, operation):
+        """Run `operation(session)` on the remote session, replayed after a reconnect"""
+        return self.run(lambda client: operation(self.remote_session()))
+    
+    def exec_wait(self, command):
+        """Run a remote command and wait for it, returning (status, stdout)"""
+        def _exec(client):
+            stdin, stdout, stderr = client.exec_command(command)
+            output = stdout.read()
+            return stdout.channel.recv_exit_status(), output
+        return self.run(_exec)
+    
     def disconnect(self):
         """Close SSH connection"""
+        if self._session:
+            self._session.close()
+            self._session = None
+        
         if self.client:
             self.client.close()
             self.client = None
@@ -330,26 +511,21 @@ class SSHClient(QObject):
     
     def is_connected(self):
         """Check if SSH connection is active"""
-        return (self.client and 
+        return bool(self.client and 
                 self.client.get_transport() and 
                 self.client.get_transport().is_active())
     
     def list_remote_files(self):
         """Get list of files in remote directory"""
         try:
-            if not self.is_connected():
-                self.connect()
-                
             ssh_settings = self.config.get_ssh_settings()
             remote_path = ssh_settings.get('remote_path', '')
             
             if not remote_path:
                 raise ValueError("Remote path not configured")
             
-            stdin, stdout, stderr = self.client.exec_command(
-                f'find "{remote_path}" -type f -printf "%P\\n"'
-            )
-            return [line.strip() for line in stdout if line.strip()]
+            status, output = self.exec_wait(f'find "{remote_path}" -type f -printf "%P\\n"')
+            return [line.strip() for line in output.decode().splitlines() if line.strip()]
         except Exception as e:
             logger.error(f"Failed to list remote files: {str(e)}")
             raise
@@ -357,22 +533,22 @@ class SSHClient(QObject):
     def upload_file(self, local_path, remote_path):
         """Upload a file using SCP"""
         try:
-            if not self.is_connected():
-                self.connect()
-                
             ssh_settings = self.config.get_ssh_settings()
             base_remote_path = ssh_settings.get('remote_path', '')
             
             if not base_remote_path:
                 raise ValueError("Remote path not configured")
                 
-            full_remote_path = str(Path(base_remote_path) / remote_path)
-            remote_dir = str(Path(full_remote_path).parent)
+            full_remote_path = str(Path(base_remote_path) / remote_path).replace('\\', '/')
+            remote_dir = posixpath.dirname(full_remote_path)
             
-            self.client.exec_command(f'mkdir -p "{remote_dir}"')
+            cipher = self.hooks.cipher_for(self.config)
             
-            with SCPClient(self.client.get_transport()) as scp:
-                scp.put(str(local_path), full_remote_path)
+            def _upload(client):
+                self.remote_session().call(f'mkdir -p -- {shlex.quote(remote_dir)}')
+                self.hooks.send(self, client.get_transport(), local_path, full_remote_path, cipher=cipher)
+            
+            self.run(_upload)
             logger.info(f"File uploaded successfully: {full_remote_path}")
         except Exception as e:
             logger.error(f"File upload failed: {str(e)}")
@@ -381,45 +557,115 @@ class SSHClient(QObject):
     def download_file(self, remote_path, local_path):
         """Download a file using SCP"""
         try:
-            if not self.is_connected():
-                self.connect()
-                
             ssh_settings = self.config.get_ssh_settings()
             base_remote_path = ssh_settings.get('remote_path', '')
             
             if not base_remote_path:
                 raise ValueError("Remote path not configured")
                 
-            full_remote_path = str(Path(base_remote_path) / remote_path)
+            full_remote_path = str(Path(base_remote_path) / remote_path).replace('\\', '/')
             local_dir = Path(local_path).parent
             local_dir.mkdir(parents=True, exist_ok=True)
             
-            with SCPClient(self.client.get_transport()) as scp:
-                scp.get(full_remote_path, str(local_path))
+            cipher = self.hooks.cipher_for(self.config)
+            
+            def _download(client):
+                if cipher:
+                    sftp = client.open_sftp()
+                    try:
+                        self.hooks.receive(sftp, full_remote_path, local_path, cipher)
+                    finally:
+                        sftp.close()
+                    return
+                with SCPClient(client.get_transport()) as scp:
+                    scp.get(full_remote_path, str(local_path))
+            
+            self.run(_download)
             logger.info(f"File downloaded successfully: {local_path}")
         except Exception as e:
             logger.error(f"File download failed: {str(e)}")
             raise
     
+    def stat_many(self, paths):
+        """Return {path: (size, mtime, mode) or None} for many remote paths.
+        
+        Paths are relative to the configured remote path (absolute paths are
+        used as-is). Everything missing from the per-cycle cache is fetched
+        with remote `stat --printf` runs fed NUL-delimited names on stdin, in
+        batches of at most STAT_BATCH_BYTES.
+        """
+        results = {}
+        missing = []
+        for path in paths:
+            if path in self._stat_cache:
+                results[path] = self._stat_cache[path]
+            else:
+                missing.append(path)
+        if not missing:
+            return results
+        
+        base = self.config.get_ssh_settings().get('remote_path', '').replace('\\', '/')
+        full_paths = {posixpath.join(base, path.replace('\\', '/')): path for path in missing}
+        found = {}
+        for payload in stat_batches(full_paths):
+            if not self._stat_batch(payload, found):
+                # No GNU stat on the server; fall back to SFTP
+                found = self._stat_sftp(full_paths)
+                break
+        
+        for full_path, path in full_paths.items():
+            value = found.get(full_path)
+            self._stat_cache[path] = value
+            results[path] = value
+        return results
+    
+    def _stat_batch(self, payload, found):
+        """Stat one batch of NUL-terminated paths into `found`; False if the server lacks stat --printf"""
+        def _stat(client):
+            stdin, stdout, stderr = client.exec_command(STAT_COMMAND)
+            try:
+                stdin.write(payload)
+                stdin.flush()
+                stdin.channel.shutdown_write()
+            except (OSError, EOFError):
+                # STAT_COMMAND exits without reading when stat is unsupported
+                if stdout.channel.recv_exit_status() != STAT_UNSUPPORTED:
+                    raise
+            output = stdout.read()
+            return stdout.channel.recv_exit_status(), output, stderr.read()
+        
+        status, output, errors = self.run(_stat)
+        if status == STAT_UNSUPPORTED:
+            return False
+        if not output and status not in (0, 123):
+            raise IOError(f"Remote stat failed ({status}): {errors.decode('utf-8', 'replace').strip()}")
+        found.update(parse_stat_output(output))
+        return True
+    
+    def _stat_sftp(self, full_paths):
+        """Stat paths one by one over SFTP when remote stat is unavailable"""
+        found = {}
+        sftp = self.client.open_sftp()
+        try:
+            for full_path in full_paths:
+                try:
+                    attr = sftp.stat(full_path)
+                    found[full_path] = (attr.st_size, float(attr.st_mtime), attr.st_mode)
+                except IOError:
+                    continue
+        finally:
+            sftp.close()
+        return found
+    
+    def clear_stat_cache(self):
+        """Forget cached remote metadata, called at the start of each sync cycle"""
+        self._stat_cache = {}
+    
     def get_remote_mtime(self, remote_path):
         """Get modification time of remote file"""
         try:
-            if not self.is_connected():
-                self.connect()
-                
-            ssh_settings = self.config.get_ssh_settings()
-            base_remote_path = ssh_settings.get('remote_path', '')
-            
-            if not base_remote_path:
-                raise ValueError("Remote path not configured")
-                
-            full_remote_path = str(Path(base_remote_path) / remote_path)
-            
-            stdin, stdout, stderr = self.client.exec_command(
-                f'stat -c %Y "{full_remote_path}"'
-            )
-            mtime = stdout.read().decode().strip()
-            return float(mtime) if mtime else 0
+            result = self.stat_many([remote_path]).get(remote_path)
+            return result[1] if result else 0
         except Exception as e:
             logger.error(f"Failed to get remote mtime: {str(e)}")
             return 0
@@ -470,17 +716,3 @@ class SSHClient(QObject):
             'local_file': local_file
         }
         self.worker.start()
-    
-    def get_remote_mtime(self, remote_file):
-        """Get remote file modification time"""
-        if not self.is_connected():
-            return 0
-        
-        try:
-            ssh_settings = self.config.get_ssh_settings()
-            remote_path = Path(ssh_settings['remote_path']) / remote_file
-            stat = self.client.exec_command(f'stat -c %Y "{remote_path}"')[1].read().decode().strip()
-            return float(stat) if stat else 0
-        except Exception as e:
-            logger.error(f"Failed to get mtime for {remote_file}: {str(e)}")
-            return 0 
\ No newline at end of file
@@ -0,0 +1,175 @@
+import asyncio
+import logging
+import threading
+from itertools import count
+from PySide6.QtCore import QObject, Signal
+from core.ssh.async_engine import DEFAULT_CHANNELS, TransferEngine
+from core.ssh.cancellation import TransferCancelled
+
+logger = logging.getLogger('GOSync')
+
+DEFAULT_CONCURRENCY = DEFAULT_CHANNELS
+
+# Item states
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+
+class TransferItem:
+    """One queued upload or download"""
+    __slots__ = ('item_id', 'direction', 'source', 'target', 'status', 'message',
+                 'bytes_done', 'total', 'cancelled')
+
+    def __init__(self, item_id, direction, source, target):
+        self.item_id = item_id
+        self.direction = direction  # 'upload' or 'download'
+        self.source = source
+        self.target = target
+        self.status = QUEUED
+        self.message = ''
+        self.bytes_done = 0
+        self.total = 0
+        self.cancelled = False
+
+
+class TransferQueue(QObject):
+    """Background upload/download queue with configurable concurrency.
+
+    Items run as coroutines on a TransferEngine, so selections transfer in
+    parallel over channels of one connection while the GUI stays
+    responsive. Completion is reported once per batch instead of once per file.
+    """
+    item_status = Signal(int, str, str)  # Item ID, status, message
+    item_progress = Signal(int, object, object)  # Item ID, bytes done, total bytes
+    queue_progress = Signal(int, int)  # Finished items, total items in the batch
+    batch_complete = Signal(list)  # Finished TransferItems of the batch
+
+    def __init__(self, config, concurrency=None, hooks=None):
+        super().__init__()
+        self.config = config
+        if concurrency is None:
+            concurrency = config.get_sync_settings().get('transfer_concurrency', DEFAULT_CONCURRENCY)
+        self.concurrency = max(1, int(concurrency))
+        self.engine = TransferEngine(config, max_channels=self.concurrency, hooks=hooks)
+        self._lock = threading.Lock()
+        self._ids = count(1)
+        self._items = {}
+        self._batch = []
+        self._finished = 0
+        self._slots = None  # Created on the engine loop
+
+    def enqueue(self, direction, source, target):
+        """Queue a transfer and return its item ID"""
+        item = TransferItem(next(self._ids), direction, source, target)
+        with self._lock:
+            self._items[item.item_id] = item
+            self._batch.append(item)
+            total = len(self._batch)
+            finished = self._finished
+        self.item_status.emit(item.item_id, QUEUED, str(source))
+        self.queue_progress.emit(finished, total)
+        self.engine.submit(self._run_item(item))
+        return item.item_id
+
+    def upload(self, local_file, remote_path):
+        """Queue an upload"""
+        return self.enqueue('upload', local_file, remote_path)
+
+    def download(self, remote_path, local_file):
+        """Queue a download"""
+        return self.enqueue('download', remote_path, local_file)
+
+    def cancel(self, item_id):
+        """Cancel a queued or running item"""
+        item = self._items.get(item_id)
+        if item and item.status in (QUEUED, RUNNING):
+            item.cancelled = True
+
+    def cancel_all(self):
+        """Cancel every unfinished item"""
+        for item_id in list(self._items):
+            self.cancel(item_id)
+
+    def status(self, item_id):
+        """Return the status of an item"""
+        item = self._items.get(item_id)
+        return item.status if item else None
+
+    def is_busy(self):
+        """Check whether the current batch still has unfinished items"""
+        with self._lock:
+            return self._finished < len(self._batch)
+
+    def shutdown(self, timeout_ms=2000):
+        """Cancel outstanding work and wait briefly for the engine to stop.
+
+        Running transfers abort at their next chunk, so this returns quickly
+        whatever the file sizes.
+        """
+        self.cancel_all()
+        self.engine.shutdown(timeout_ms)
+
+    async def _run_item(self, item):
+        """Execute one item on the engine loop once a slot is free"""
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.concurrency)
+        try:
+            async with self._slots:
+                await self._transfer(item)
+        except asyncio.CancelledError:
+            if item.status in (QUEUED, RUNNING):
+                self._finish(item, CANCELLED, "Cancelled")
+            raise
+
+    async def _transfer(self, item):
+        if item.cancelled:
+            self._finish(item, CANCELLED, "Cancelled")
+            return
+
+        item.status = RUNNING
+        self.item_status.emit(item.item_id, RUNNING, str(item.source))
+
+        def _progress(done, total):
+            if item.cancelled:
+                raise TransferCancelled()
+            item.bytes_done, item.total = done, total
+            self.item_progress.emit(item.item_id, done, total)
+
+        try:
+            if item.direction == 'upload':
+                await self.engine.upload(item.source, item.target, _progress)
+                message = f"Uploaded {item.source} successfully"
+            else:
+                await self.engine.download(item.source, item.target, _progress)
+                message = f"Downloaded {item.source} successfully"
+        except TransferCancelled:
+            self._finish(item, CANCELLED, f"Cancelled {item.direction} of {item.source}")
+        except Exception as e:
+            message = f"Failed to {item.direction} {item.source}: {str(e)}"
+            logger.error(message.encode('utf-8', errors='replace').decode('utf-8'))
+            self._finish(item, CANCELLED if item.cancelled else FAILED, message)
+        else:
+            self._finish(item, DONE, message)
+
+    def _finish(self, item, status, message):
+        """Record an item result and emit batch completion when all are done"""
+        item.status = status
+        item.message = message
+        self.item_status.emit(item.item_id, status, message)
+
+        with self._lock:
+            self._finished += 1
+            finished, total = self._finished, len(self._batch)
+            batch = None
+            if finished >= total:
+                batch = self._batch
+                for done in batch:
+                    self._items.pop(done.item_id, None)
+                self._batch = []
+                self._finished = 0
+        self.queue_progress.emit(finished, total)
+        if batch is not None:
+            self.batch_complete.emit(batch)
@@ -0,0 +1,213 @@
+import logging
+import mmap
+import os
+import posixpath
+import shlex
+import stat
+import tarfile
+import threading
+
+logger = logging.getLogger('GOSync')
+
+CHUNK_SIZE = 1024 * 1024  # Bytes handed to the channel per write
+MMAP_THRESHOLD = 64 * 1024 * 1024  # Regular files at least this big are memory-mapped
+POOL_SIZE = 8  # Buffers kept for reuse across transfers
+TAR_BLOCK = 512
+
+
+class BufferPool:
+    """Pool of reusable bytearrays so uploads do not allocate per chunk"""
+
+    def __init__(self, buffer_size=CHUNK_SIZE, max_buffers=POOL_SIZE):
+        self.buffer_size = buffer_size
+        self.max_buffers = max_buffers
+        self._free = []
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Take a buffer from the pool, allocating one if it is empty"""
+        with self._lock:
+            if self._free:
+                return self._free.pop()
+        return bytearray(self.buffer_size)
+
+    def release(self, buffer):
+        """Return a buffer to the pool"""
+        with self._lock:
+            if len(self._free) < self.max_buffers:
+                self._free.append(buffer)
+
+
+DEFAULT_POOL = BufferPool()
+
+
+def stream_file(path, consume, pool=DEFAULT_POOL, mmap_threshold=MMAP_THRESHOLD):
+    """Feed a file to `consume(view)` as memoryview chunks without copying.
+
+    Large regular files are memory-mapped; others are read with readinto
+    into a pooled buffer. At most the size seen at open time is streamed.
+    Views are only valid during the consume call and must not be kept.
+    Returns the number of bytes streamed.
+    """
+    with open(path, 'rb') as f:
+        st = os.fstat(f.fileno())
+        size = st.st_size
+        if size and size >= mmap_threshold and stat.S_ISREG(st.st_mode):
+            return _stream_mmap(f, size, consume, pool.buffer_size)
+        return _stream_readinto(f, size, consume, pool)
+
+
+def _stream_mmap(f, size, consume, chunk_size):
+    mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    view = memoryview(mapped)
+    size = min(size, len(view))
+    try:
+        offset = 0
+        while offset < size:
+            # Released even if consume raises; closing the map with a live slice raises BufferError
+            with view[offset:offset + chunk_size] as chunk:
+                consume(chunk)
+                offset += len(chunk)
+        return offset
+    finally:
+        view.release()
+        mapped.close()
+
+
+def _stream_readinto(f, size, consume, pool):
+    buffer = pool.acquire()
+    view = memoryview(buffer)
+    try:
+        total = 0
+        # Never send more than the size announced up front, even if the file grows
+        while total < size:
+            with view[:min(size - total, len(buffer))] as target:
+                count = f.readinto(target)
+            if not count:
+                break
+            with view[:count] as chunk:
+                consume(chunk)
+            total += count
+        return total
+    finally:
+        view.release()
+        pool.release(buffer)
+
+
+def _read_ack(channel):
+    """Read an SCP acknowledgement, raising on a remote error"""
+    code = channel.recv(1)
+    if code == b'\0':
+        return
+    message = b''
+    while not message.endswith(b'\n'):
+        data = channel.recv(1)
+        if not data:
+            break
+        message += data
+    if not code:
+        raise EOFError("SCP channel closed")
+    raise IOError(f"SCP error: {message.decode('utf-8', errors='replace').strip()}")
+
+
+def send_file(transport, local_file, remote_path, hasher=None, progress=None,
+              pool=DEFAULT_POOL):
+    """Upload a file over the SCP sink protocol, writing pooled buffers directly.
+
+    `hasher` (e.g. hashlib.sha256()) is updated with the exact bytes sent.
+    `progress(bytes_sent, total)` is called per chunk and may raise to abort.
+    """
+    local_file = str(local_file)
+    st = os.stat(local_file)
+    send_stream(transport, remote_path, st.st_size, stat.S_IMODE(st.st_mode),
+                lambda consume: stream_file(local_file, consume, pool),
+                hasher=hasher, progress=progress, label=local_file)
+
+
+def send_stream(transport, remote_path, size, mode, produce, hasher=None, progress=None,
+                label=None):
+    """Upload `size` bytes generated by `produce(consume)` over the SCP sink protocol.
+
+    Lets transformed content (e.g. encrypted files) go straight to the
+    channel without a temporary file, as long as its size is known up front.
+    """
+    name = posixpath.basename(remote_path)
+    if '\n' in name:
+        raise ValueError(f"Cannot send file name containing a newline: {name!r}")
+
+    channel = transport.open_session()
+    try:
+        channel.exec_command('scp -t ' + shlex.quote(remote_path))
+        _read_ack(channel)
+        header = 'C%04o %d %s\n' % (mode, size, name)
+        channel.sendall(header.encode('utf-8'))
+        _read_ack(channel)
+
+        sent = 0
+
+        def _consume(chunk):
+            nonlocal sent
+            if sent + len(chunk) > size:
+                raise IOError(f"{label or remote_path} grew during upload")
+            channel.sendall(chunk)
+            if hasher is not None:
+                hasher.update(chunk)
+            sent += len(chunk)
+            if progress:
+                progress(sent, size)
+
+        produce(_consume)
+        if sent != size:
+            raise IOError(f"{label or remote_path} changed size during upload ({sent} of {size} bytes)")
+        channel.sendall(b'\0')
+        _read_ack(channel)
+    finally:
+        channel.close()
+
+
+def send_tar(transport, remote_dir, entries, progress=None):
+    """Upload several files as one tar stream unpacked under `remote_dir`.
+
+    `entries` yields (relative name, size, mode, mtime, produce) where
+    `produce(consume)` streams exactly `size` bytes. The whole batch costs a
+    single channel and two round trips. `progress(name, sent, size)` is
+    called before each file and after each chunk, and may raise to abort.
+    """
+    quoted = shlex.quote(remote_dir)
+    channel = transport.open_session()
+    try:
+        channel.exec_command(f'mkdir -p -- {quoted} && tar -xf - -C {quoted}')
+        for name, size, mode, mtime, produce in entries:
+            info = tarfile.TarInfo(name)
+            info.size = size
+            info.mode = mode
+            info.mtime = int(mtime)
+            channel.sendall(info.tobuf(tarfile.PAX_FORMAT, 'utf-8', 'surrogateescape'))
+
+            sent = 0
+            if progress:
+                progress(name, sent, size)
+
+            def _consume(chunk):
+                nonlocal sent
+                if sent + len(chunk) > size:
+                    raise IOError(f"{name} grew during upload")
+                channel.sendall(chunk)
+                sent += len(chunk)
+                if progress:
+                    progress(name, sent, size)
+
+            produce(_consume)
+            if sent != size:
+                raise IOError(f"{name} changed size during upload ({sent} of {size} bytes)")
+            channel.sendall(bytes(-size % TAR_BLOCK))
+
+        # End-of-archive marker
+        channel.sendall(bytes(2 * TAR_BLOCK))
+        channel.shutdown_write()
+        errors = channel.makefile_stderr('rb').read()
+        status = channel.recv_exit_status()
+        if status != 0:
+            raise IOError(f"Remote tar failed: {errors.decode('utf-8', errors='replace').strip()}")
+    finally:
+        channel.close()
@@ -0,0 +1,268 @@
+import os
+import stat
+import struct
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from core.ssh.upload_reader import send_stream, stream_file
+
+logger = logging.getLogger('GOSync')
+
+MAGIC = b'GOSE'
+VERSION = 1
+CHUNK_SIZE = 1024 * 1024  # Plaintext bytes per AEAD chunk
+TAG_SIZE = 16
+PREFIX_SIZE = 8  # Random per-file nonce prefix; the chunk counter fills the rest
+
+# magic, version, chunk size, nonce prefix
+_HEADER = struct.Struct('>4sBI8s')
+HEADER_SIZE = _HEADER.size
+
+
+class DecryptionError(Exception):
+    """Raised when encrypted content is malformed or fails authentication"""
+
+
+def is_encrypted(head):
+    """Check whether the first bytes of a file carry the encryption header"""
+    return head[:len(MAGIC)] == MAGIC
+
+
+class FileCipher:
+    """Chunked AES-GCM encryption of whole files.
+
+    A file is a header followed by fixed-size chunks, each sealed with its
+    own nonce (file prefix + chunk counter). The chunk index and a final-chunk
+    flag are authenticated, so chunks cannot be reordered or truncated.
+    Because chunks are independent, they are encrypted and decrypted on a
+    thread pool (OpenSSL releases the GIL) and streamed out in order.
+    """
+
+    def __init__(self, key, chunk_size=CHUNK_SIZE, workers=None):
+        self._aead = AESGCM(key)
+        self.chunk_size = chunk_size
+        self.workers = workers or os.cpu_count() or 2
+        self._pool = ThreadPoolExecutor(max_workers=self.workers,
+                                        thread_name_prefix='GOSyncCipher')
+
+    def close(self):
+        """Shut down the worker pool"""
+        self._pool.shutdown(wait=False)
+
+    @staticmethod
+    def is_encrypted_file(path):
+        """Check whether a local file starts with the encryption header"""
+        with open(path, 'rb') as f:
+            return is_encrypted(f.read(len(MAGIC)))
+
+    def encrypted_size(self, plain_size):
+        """Size of the encrypted form of a file of `plain_size` bytes"""
+        chunks = max(1, -(-plain_size // self.chunk_size))
+        return HEADER_SIZE + plain_size + chunks * TAG_SIZE
+
+    @staticmethod
+    def _nonce(prefix, index):
+        return prefix + struct.pack('>I', index)
+
+    @staticmethod
+    def _aad(header, index, final):
+        return header + struct.pack('>IB', index, 1 if final else 0)
+
+    def _seal(self, header, prefix, index, data, final):
+        return self._aead.encrypt(self._nonce(prefix, index), data, self._aad(header, index, final))
+
+    def _open(self, header, prefix, index, data, final):
+        try:
+            return self._aead.decrypt(self._nonce(prefix, index), data, self._aad(header, index, final))
+        except Exception:
+            raise DecryptionError(f"Chunk {index} failed authentication")
+
+    def _ordered(self, jobs, consume):
+        """Submit (func, args) jobs with a bounded window and consume results in order"""
+        window = deque()
+        limit = self.workers * 2
+        for func, args in jobs:
+            window.append(self._pool.submit(func, *args))
+            if len(window) >= limit:
+                consume(window.popleft().result())
+        while window:
+            consume(window.popleft().result())
+
+    def encrypt_file(self, path, consume):
+        """Encrypt a file and feed the output to `consume(bytes)` in order.
+
+        Returns the number of bytes produced.
+        """
+        prefix = os.urandom(PREFIX_SIZE)
+        header = _HEADER.pack(MAGIC, VERSION, self.chunk_size, prefix)
+        produced = [len(header)]
+        consume(header)
+
+        def _emit(chunk):
+            produced[0] += len(chunk)
+            consume(chunk)
+
+        with open(path, 'rb') as f:
+            self._ordered(self._seal_jobs(f, header, prefix), _emit)
+        return produced[0]
+
+    def encrypt_chunks(self, f):
+        """Yield the encrypted form of an open file chunk by chunk.
+
+        Each chunk is sealed in the thread that asks for it, so callers that
+        pull (e.g. an event loop offloading reads) need no producer thread.
+        """
+        prefix = os.urandom(PREFIX_SIZE)
+        header = _HEADER.pack(MAGIC, VERSION, self.chunk_size, prefix)
+        yield header
+        for func, args in self._seal_jobs(f, header, prefix):
+            yield func(*args)
+
+    def _seal_jobs(self, f, header, prefix):
+        """(func, args) jobs sealing the chunks of an open file, the last one flagged final"""
+        index = 0
+        data = f.read(self.chunk_size)
+        while True:
+            following = f.read(self.chunk_size) if len(data) == self.chunk_size else b''
+            final = not following
+            yield self._seal, (header, prefix, index, data, final)
+            if final:
+                return
+            data = following
+            index += 1
+
+    def decrypt_stream(self, read, write):
+        """Decrypt data pulled with `read(n)` and push plaintext to `write(bytes)`"""
+        header = _read_exact(read, HEADER_SIZE)
+        magic, version, chunk_size, prefix = _HEADER.unpack(header)
+        if magic != MAGIC or version != VERSION:
+            raise DecryptionError("Not a GOSync encrypted file")
+        sealed_size = chunk_size + TAG_SIZE
+
+        def _jobs():
+            index = 0
+            data = _read_exact(read, sealed_size, allow_short=True)
+            while True:
+                following = _read_exact(read, sealed_size, allow_short=True) \
+                    if len(data) == sealed_size else b''
+                final = not following
+                if len(data) < TAG_SIZE:
+                    raise DecryptionError("Truncated encrypted file")
+                yield self._open, (header, prefix, index, data, final)
+                if final:
+                    return
+                data = following
+                index += 1
+
+        self._ordered(_jobs(), write)
+
+
+_ciphers = {}
+_ciphers_lock = threading.Lock()
+
+
+def cipher_for(config):
+    """Shared FileCipher for the configured key, or None if encryption is off"""
+    if not config.get_sync_settings().get('encrypt_files', False):
+        return None
+    key = config.get_file_key()
+    with _ciphers_lock:
+        cipher = _ciphers.get(key)
+        if cipher is None:
+            cipher = _ciphers[key] = FileCipher(key)
+        return cipher
+
+
+def content_source(local_file, cipher=None):
+    """Describe what uploading a file sends: (size, mode, mtime, produce).
+
+    `produce(consume)` streams the bytes, encrypted when a cipher is given.
+    """
+    local_file = str(local_file)
+    st = os.stat(local_file)
+    if cipher is None:
+        return (st.st_size, stat.S_IMODE(st.st_mode), st.st_mtime,
+                lambda consume: stream_file(local_file, consume))
+    return (cipher.encrypted_size(st.st_size), stat.S_IMODE(st.st_mode), st.st_mtime,
+            lambda consume: cipher.encrypt_file(local_file, consume))
+
+
+def send_contents(transport, local_file, remote_path, cipher=None, hasher=None, progress=None):
+    """Upload a file, encrypting it on the way out when a cipher is given"""
+    size, mode, _, produce = content_source(local_file, cipher)
+    send_stream(transport, remote_path, size, mode, produce,
+                hasher=hasher, progress=progress, label=str(local_file))
+
+
+def receive_contents(client, remote_path, local_path, cipher, callback=None):
+    """Download a file over a fresh SFTP session, decrypting it if needed"""
+    sftp = client.open_sftp()
+    try:
+        download_decrypted(sftp, remote_path, local_path, cipher, callback)
+    finally:
+        sftp.close()
+
+
+def _read_exact(read, size, allow_short=False):
+    """Read exactly `size` bytes unless the stream ends first"""
+    parts = []
+    remaining = size
+    while remaining:
+        data = read(remaining)
+        if not data:
+            break
+        parts.append(data)
+        remaining -= len(data)
+    result = b''.join(parts)
+    if remaining and not allow_short:
+        raise DecryptionError("Unexpected end of encrypted data")
+    return result
+
+
+def download_decrypted(sftp, remote_path, local_path, cipher, callback=None):
+    """Download a remote file, decrypting it on the fly if it is encrypted.
+
+    Plain remote files are copied unchanged. Output goes to a temporary file
+    that replaces `local_path` only after the whole file authenticated.
+    """
+    local_path = str(local_path)
+    temp_path = local_path + '.gosync-part'
+    total = sftp.stat(remote_path).st_size
+    received = [0]
+
+    with sftp.open(remote_path, 'rb') as remote:
+        remote.prefetch(total)
+
+        def _read(size):
+            data = remote.read(size)
+            received[0] += len(data)
+            if callback:
+                callback(received[0], total)
+            return data
+
+        try:
+            with open(temp_path, 'wb') as out:
+                head = _read(len(MAGIC))
+                if is_encrypted(head):
+                    pending = [head]
+
+                    def _read_with_head(size):
+                        if pending:
+                            data = pending.pop()
+                            return data + _read(size - len(data)) if size > len(data) else data
+                        return _read(size)
+                    cipher.decrypt_stream(_read_with_head, out.write)
+                else:
+                    out.write(head)
+                    while True:
+                        data = _read(CHUNK_SIZE)
+                        if not data:
+                            break
+                        out.write(data)
+            os.replace(temp_path, local_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
@@ -0,0 +1,80 @@
+import gzip
+import logging
+import time
+from collections import namedtuple
+from pathlib import Path
+
+logger = logging.getLogger('GOSync')
+
+TRACE_HEADER = 'GOSYNC-TRACE 1'
+FLUSH_EVERY = 256  # Events buffered before the trace file is flushed
+
+# Event kinds
+TRACE_DIRECTORY = 'D'  # Watcher reported a directory change
+TRACE_FILE = 'F'  # Watcher reported a file change
+TRACE_NEW_FILE = 'N'  # A directory rescan found a new file
+
+TraceEvent = namedtuple('TraceEvent', 'time kind rel_path size')
+
+
+class TraceRecorder:
+    """Appends watcher events to a gzip-compressed trace file.
+
+    Each line is `<ms since previous event>\\t<kind>\\t<size>\\t<relative path>`;
+    small deltas and repeated path prefixes keep storms cheap to store.
+    Size is -1 for directories and missing files.
+    """
+
+    def __init__(self, trace_path, local_base):
+        self.trace_path = str(trace_path)
+        self.local_base = Path(local_base)
+        self._file = gzip.open(self.trace_path, 'wt', encoding='utf-8')
+        self._file.write(TRACE_HEADER + '\n')
+        self._last = time.monotonic()
+        self._count = 0
+        logger.info(f"Recording watcher events to {self.trace_path}")
+
+    def record(self, kind, path, size=None):
+        """Record one event for an absolute local path"""
+        if self._file is None:
+            return
+        path = Path(path)
+        try:
+            rel_path = path.relative_to(self.local_base).as_posix()
+        except ValueError:
+            return
+        if size is None:
+            try:
+                size = path.stat().st_size if path.is_file() else -1
+            except OSError:
+                size = -1
+        now = time.monotonic()
+        delta_ms = int((now - self._last) * 1000)
+        self._last = now
+        self._file.write(f"{delta_ms}\t{kind}\t{size}\t{rel_path}\n")
+        self._count += 1
+        if self._count % FLUSH_EVERY == 0:
+            self._file.flush()
+
+    def close(self):
+        """Flush and close the trace file"""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            logger.info(f"Recorded {self._count} watcher events to {self.trace_path}")
+
+
+def read_trace(trace_path):
+    """Yield TraceEvents with times in seconds from the start of the trace"""
+    with gzip.open(str(trace_path), 'rt', encoding='utf-8') as f:
+        header = f.readline().rstrip('\n')
+        if header != TRACE_HEADER:
+            raise ValueError(f"Not a GOSync event trace: {trace_path}")
+        elapsed_ms = 0
+        for line in f:
+            line = line.rstrip('\n')
+            if not line:
+                continue
+            delta_ms, kind, size, rel_path = line.split('\t', 3)
+            elapsed_ms += int(delta_ms)
+            yield TraceEvent(elapsed_ms / 1000.0, kind, rel_path, int(size))
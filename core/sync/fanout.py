@@ -0,0 +1,138 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger('GOSync')
+
+FANOUT_BUFFER = 8  # Chunks (1 MiB each when streaming from disk) a target may lag behind
+STALL_TIMEOUT = 30.0  # Seconds the reader waits on a full buffer before dropping that target
+POLL_INTERVAL = 0.1
+
+
+class TargetStalled(IOError):
+    """A target fell further behind than its buffer allows"""
+
+
+class _Detached(Exception):
+    """Raised inside a target's sender once the reader has given up on it"""
+
+
+class _Lane:
+    """Bounded chunk queue feeding one target's sender"""
+
+    def __init__(self, name, capacity):
+        self.name = name
+        self.queue = queue.Queue(capacity)
+        self.capacity = capacity
+        self.detached = threading.Event()
+        self.error = None
+        self.sent = 0
+
+    @property
+    def live(self):
+        return self.error is None and not self.detached.is_set()
+
+    def produce(self, consume):
+        """Content producer for the sender: replays the chunks the reader queued"""
+        while True:
+            try:
+                chunk = self.queue.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                if self.detached.is_set():
+                    raise _Detached()
+                continue
+            if chunk is None:
+                return
+            if self.detached.is_set():
+                raise _Detached()
+            consume(chunk)
+            self.sent += len(chunk)
+
+    def fail(self, error):
+        if self.error is None:
+            self.error = error
+        self.detached.set()
+
+
+class Fanout:
+    """Streams each file once to several targets concurrently.
+
+    The reader copies every chunk once and queues it for each target's
+    sender thread. A target that falls `buffer_chunks` behind makes the
+    reader wait, at most `stall_timeout` seconds, before that target is
+    dropped for the file so the others can continue.
+    """
+
+    def __init__(self, max_targets, buffer_chunks=FANOUT_BUFFER, stall_timeout=STALL_TIMEOUT):
+        self.buffer_chunks = buffer_chunks
+        self.stall_timeout = stall_timeout
+        self._pool = ThreadPoolExecutor(max_workers=max(1, max_targets),
+                                        thread_name_prefix='GOSyncFanout')
+
+    def send(self, produce, senders, progress=None):
+        """Stream `produce(consume)` to every `senders[name](produce)` at once.
+
+        Returns {name: exception or None}. `progress(bytes_read)` is called
+        per chunk and may raise to abort all targets, which is re-raised.
+        """
+        lanes = {name: _Lane(name, self.buffer_chunks) for name in senders}
+        futures = [self._pool.submit(self._run, lanes[name], send) for name, send in senders.items()]
+        read = 0
+
+        def _consume(chunk):
+            nonlocal read
+            data = bytes(chunk)  # The one copy every target shares
+            for lane in lanes.values():
+                if lane.live:
+                    self._put(lane, data)
+            read += len(data)
+            if not any(lane.live for lane in lanes.values()):
+                raise _Detached()
+            if progress:
+                progress(read)
+
+        try:
+            produce(_consume)
+        except _Detached:
+            pass
+        except BaseException:
+            for lane in lanes.values():
+                lane.detached.set()
+            for future in futures:
+                future.result()
+            raise
+
+        for lane in lanes.values():
+            if lane.live:
+                self._put(lane, None)
+        for future in futures:
+            future.result()
+        return {name: lane.error for name, lane in lanes.items()}
+
+    def _put(self, lane, item):
+        deadline = time.monotonic() + self.stall_timeout
+        while lane.live:
+            try:
+                lane.queue.put(item, timeout=POLL_INTERVAL)
+                return
+            except queue.Full:
+                if time.monotonic() >= deadline:
+                    logger.warning(f"Target {lane.name} stalled, dropping it for this file")
+                    lane.fail(TargetStalled(
+                        f"{lane.name} fell more than {lane.capacity} chunks behind"
+                    ))
+
+    @staticmethod
+    def _run(lane, send):
+        try:
+            send(lane.produce)
+        except _Detached:
+            lane.fail(lane.error or TargetStalled(f"{lane.name} was detached"))
+        except Exception as e:
+            lane.fail(e)
+
+    def close(self):
+        """Stop the sender threads"""
+        self._pool.shutdown(wait=True)
@@ -0,0 +1,71 @@
+import logging
+
+logger = logging.getLogger('GOSync')
+
+VERIFY_BATCH = 256  # Uploaded files verified per remote sha256sum run
+MAX_RETRIES = 2  # Re-uploads of a file that failed verification
+
+
+def _unescape(name):
+    """Undo coreutils escaping of file names containing '\\' or newlines"""
+    out = []
+    i = 0
+    while i < len(name):
+        ch = name[i]
+        if ch == '\\' and i + 1 < len(name):
+            nxt = name[i + 1]
+            out.append('\n' if nxt == 'n' else nxt)
+            i += 2
+        else:
+            out.append(ch)
+            i += 1
+    return ''.join(out)
+
+
+def parse_sha256sum(output):
+    """Parse sha256sum output into {path: hexdigest}"""
+    digests = {}
+    for line in output.splitlines():
+        if not line:
+            continue
+        escaped = line.startswith('\\')
+        if escaped:
+            line = line[1:]
+        digest, sep, name = line.partition('  ')
+        if not sep:
+            digest, sep, name = line.partition(' *')
+        if not sep:
+            continue
+        digests[_unescape(name) if escaped else name] = digest.lower()
+    return digests
+
+
+def remote_digests(ssh_client, remote_paths):
+    """Hash a batch of remote files with a single sha256sum invocation"""
+    payload = b'\0'.join(path.encode('utf-8') for path in remote_paths) + b'\0'
+
+    def _hash(client):
+        stdin, stdout, stderr = client.exec_command('xargs -0 sha256sum --')
+        stdin.write(payload)
+        stdin.flush()
+        stdin.channel.shutdown_write()
+        output = stdout.read()
+        stdout.channel.recv_exit_status()
+        return output
+
+    output = ssh_client.run(_hash)
+    return parse_sha256sum(output.decode('utf-8', errors='replace'))
+
+
+def verify_batch(ssh_client, expected):
+    """Compare {remote_path: local digest} against the remote side.
+
+    Returns the remote paths whose remote digest is missing or different.
+    """
+    if not expected:
+        return []
+    actual = remote_digests(ssh_client, list(expected))
+    mismatched = [path for path, digest in expected.items() if actual.get(path) != digest]
+    for path in mismatched:
+        logger.warning(f"Integrity check failed for {path}")
+    return mismatched
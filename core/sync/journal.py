@@ -0,0 +1,176 @@
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger('GOSync')
+
+JOURNAL_FILE = 'journal.log'  # In the settings directory
+JOURNAL_HEADER = 'GOSYNC-JOURNAL 1'
+FSYNC_INTERVAL = 1.0  # Seconds between fsyncs; every record is flushed immediately
+COMPACT_MIN = 4096  # Records appended before compaction is considered
+COMPACT_FACTOR = 2  # Compact once the log holds this many records per live entry
+
+# Record kinds
+JOURNAL_PENDING = 'P'  # Changed locally, waiting to be uploaded
+JOURNAL_DONE = 'D'  # Uploaded, or found on the server, at the recorded size and mtime
+JOURNAL_FORGET = 'X'  # Deleted locally; no longer tracked
+
+
+class SyncJournal:
+    """Append-only log of pending uploads and their completion.
+
+    Each line is `<kind>\\t<size>\\t<mtime>\\t<relative path>`. Replaying
+    the log yields the latest state per path, so after a restart or crash
+    files already uploaded are not marked pending again and files still
+    pending are resumed. The log is rewritten with one record per live
+    entry once superseded records dominate it.
+    """
+
+    def __init__(self, journal_path):
+        self.journal_path = str(journal_path)
+        self.entries = {}  # Lowercase path -> (kind, size, mtime, path)
+        self._lock = threading.Lock()
+        self._file = None
+        self._records = 0
+        self._last_fsync = time.monotonic()
+        self.resumable = self._replay()
+        if self._records > COMPACT_FACTOR * len(self.entries) + COMPACT_MIN:
+            self.compact()
+        else:
+            self._file = self._open_append()
+
+    def _replay(self):
+        """Load the existing log, returning True if there was one to resume from"""
+        try:
+            f = open(self.journal_path, 'rb')
+        except FileNotFoundError:
+            return False
+        with f:
+            if f.readline().decode('utf-8', 'replace').rstrip('\r\n') != JOURNAL_HEADER:
+                logger.warning(f"Ignoring unrecognised sync journal {self.journal_path}")
+                return False
+            valid = f.tell()
+            for line in f:
+                # A crash can leave the last record half written
+                if not line.endswith(b'\n'):
+                    break
+                valid += len(line)
+                try:
+                    # Journals written before newline='\n' end lines in \r\n on Windows
+                    record = line.rstrip(b'\r\n').decode('utf-8', 'surrogateescape')
+                    kind, size, mtime, rel_path = record.split('\t', 3)
+                    self._apply(kind, int(size), float(mtime), rel_path)
+                except ValueError:
+                    continue
+                self._records += 1
+        if valid < os.path.getsize(self.journal_path):
+            # Drop the torn tail so new records start on a line of their own
+            os.truncate(self.journal_path, valid)
+        logger.info(f"Replayed sync journal: {len(self.entries)} entries, "
+                    f"{len(self.pending())} pending")
+        return True
+
+    def _apply(self, kind, size, mtime, rel_path):
+        key = rel_path.lower()
+        if kind == JOURNAL_FORGET:
+            self.entries.pop(key, None)
+        elif kind in (JOURNAL_PENDING, JOURNAL_DONE):
+            self.entries[key] = (kind, size, mtime, rel_path)
+        else:
+            raise ValueError(kind)
+
+    def _open_append(self):
+        exists = os.path.exists(self.journal_path)
+        f = open(self.journal_path, 'a', encoding='utf-8', errors='surrogateescape', newline='\n')
+        if not exists or os.path.getsize(self.journal_path) == 0:
+            f.write(JOURNAL_HEADER + '\n')
+            f.flush()
+        return f
+
+    def pending(self):
+        """Paths recorded as pending and not completed since"""
+        with self._lock:
+            return [entry[3] for entry in self.entries.values() if entry[0] == JOURNAL_PENDING]
+
+    def is_done(self, rel_path, size, mtime):
+        """Check whether a path was completed at exactly this size and mtime"""
+        entry = self.entries.get(rel_path.lower())
+        return bool(entry and entry[0] == JOURNAL_DONE and entry[1] == size and entry[2] == mtime)
+
+    def record_pending(self, rel_path, size=-1, mtime=0.0):
+        """Log that a path needs uploading"""
+        self._record(JOURNAL_PENDING, size, mtime, rel_path)
+
+    def record_done(self, rel_path, size, mtime):
+        """Log that a path is on the server at this size and mtime"""
+        self._record(JOURNAL_DONE, size, mtime, rel_path)
+
+    def forget(self, rel_path):
+        """Log that a path was deleted locally"""
+        if rel_path.lower() in self.entries:
+            self._record(JOURNAL_FORGET, -1, 0.0, rel_path)
+
+    def reconcile(self, synced, local_paths):
+        """Record the outcome of a full comparison.
+
+        `synced` yields (path, size, mtime) for files present on both sides;
+        entries for paths no longer in `local_paths` (lowercase) are dropped.
+        Only records that change the replayed state are written.
+        """
+        for rel_path, size, mtime in synced:
+            if not self.is_done(rel_path, size, mtime):
+                self.record_done(rel_path, size, mtime)
+        with self._lock:
+            gone = [entry[3] for key, entry in self.entries.items() if key not in local_paths]
+        for rel_path in gone:
+            self.forget(rel_path)
+
+    def _record(self, kind, size, mtime, rel_path):
+        if '\n' in rel_path:
+            return
+        with self._lock:
+            if self._file is None:
+                return
+            self._apply(kind, size, mtime, rel_path)
+            self._file.write(f"{kind}\t{size}\t{mtime!r}\t{rel_path}\n")
+            self._file.flush()
+            self._records += 1
+            now = time.monotonic()
+            if now - self._last_fsync >= FSYNC_INTERVAL:
+                os.fsync(self._file.fileno())
+                self._last_fsync = now
+            if self._records > COMPACT_FACTOR * len(self.entries) + COMPACT_MIN:
+                self._compact()
+
+    def compact(self):
+        """Rewrite the log with one record per live entry"""
+        with self._lock:
+            self._compact()
+
+    def _compact(self):
+        if self._file is not None:
+            self._file.close()
+        partial = self.journal_path + '.tmp'
+        try:
+            with open(partial, 'w', encoding='utf-8', errors='surrogateescape', newline='\n') as f:
+                f.write(JOURNAL_HEADER + '\n')
+                for kind, size, mtime, rel_path in self.entries.values():
+                    f.write(f"{kind}\t{size}\t{mtime!r}\t{rel_path}\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(partial, self.journal_path)
+            self._records = len(self.entries)
+            logger.info(f"Compacted sync journal to {self._records} entries")
+        except OSError as e:
+            logger.error(f"Failed to compact sync journal: {str(e)}")
+        self._file = self._open_append()
+
+    def close(self):
+        """Flush, fsync and close the log"""
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                self._file.close()
+                self._file = None
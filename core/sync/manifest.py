@@ -0,0 +1,240 @@
+import logging
+import shlex
+import zlib
+from core.sync.snapshots import SNAPSHOT_DIR, STAGING_SUFFIX, is_internal
+
+logger = logging.getLogger('GOSync')
+
+BINARY_MAGIC = b'GOSM\x01'  # Front-coded varint records from the python3 helper
+TEXT_MAGIC = b'GOSN\x01'  # NUL-terminated `find -printf` records
+GZIP_MAGIC = b'\x1f\x8b'
+
+# Binary records, in depth-first order so siblings share prefixes. Entries
+# come in case-insensitive path order (merge_join.path_key), so directories
+# whose names differ only in case are merged. Record layout:
+#   varint shared prefix length, varint suffix length, suffix bytes,
+#   varint size, zigzag varint mtime in milliseconds
+# A record with both lengths zero ends the manifest.
+HELPER_SCRIPT = r'''
+import os, sys, zlib
+root, snapdir, suffix, compress = (os.fsencode(arg) for arg in sys.argv[1:5])
+out = sys.stdout.buffer
+z = zlib.compressobj(1, zlib.DEFLATED, 31) if compress == b'1' else None
+buf = bytearray(b'GOSM\x01')
+prev = b''
+
+def varint(n):
+    while n >= 0x80:
+        buf.append((n & 0x7f) | 0x80)
+        n >>= 7
+    buf.append(n)
+
+def flush(final=False):
+    data = bytes(buf)
+    del buf[:]
+    if z:
+        data = z.compress(data) + (z.flush() if final else b'')
+    out.write(data)
+
+def emit(path, st):
+    global prev
+    shared = 0
+    limit = min(len(prev), len(path))
+    while shared < limit and prev[shared] == path[shared]:
+        shared += 1
+    varint(shared)
+    varint(len(path) - shared)
+    buf.extend(path[shared:])
+    varint(st.st_size)
+    mtime = st.st_mtime_ns // 1000000
+    varint(mtime * 2 if mtime >= 0 else -mtime * 2 - 1)
+    prev = path
+    if len(buf) >= 65536:
+        flush()
+
+def walk(rels):
+    # Directories whose names differ only in case are walked as one
+    entries = []
+    for rel in rels:
+        try:
+            entries.extend((rel, e) for e in os.scandir(os.path.join(root, rel) if rel else root))
+        except OSError:
+            continue
+    entries.sort(key=lambda item: (item[1].name.lower(), item[1].name))
+    i = 0
+    while i < len(entries):
+        lower = entries[i][1].name.lower()
+        dirs = []
+        while i < len(entries) and entries[i][1].name.lower() == lower:
+            rel, e = entries[i]
+            i += 1
+            name = e.name
+            if not rel and (name == snapdir or name == b'filelist.txt'):
+                continue
+            path = rel + b'/' + name if rel else name
+            try:
+                if e.is_dir(follow_symlinks=False):
+                    dirs.append(path)
+                elif e.is_file(follow_symlinks=False) and not name.endswith(suffix):
+                    emit(path, e.stat(follow_symlinks=False))
+            except OSError:
+                continue
+        if dirs:
+            walk(dirs)
+
+walk([b''])
+varint(0)
+varint(0)
+flush(True)
+'''
+
+# Uses the helper where python3 exists, otherwise GNU find with NUL separators
+LISTING_SCRIPT = '''if command -v python3 >/dev/null 2>&1; then
+python3 -c {script} {root} {snapdir} {suffix} {compress}
+else
+{{ printf 'GOSN\\001'; find {root} -path {snappath} -prune -o -type f -printf '%s\\t%T@\\t%P\\0'; printf '\\0'; }} | {compressor}
+fi'''
+
+
+class UnsortedManifest(Exception):
+    """The server sent a manifest without a defined order (the `find` fallback)"""
+
+
+def listing_command(remote_root, compress=True):
+    """Shell command that writes the manifest of a remote tree to stdout"""
+    return LISTING_SCRIPT.format(
+        script=shlex.quote(HELPER_SCRIPT),
+        root=shlex.quote(remote_root),
+        snapdir=shlex.quote(SNAPSHOT_DIR),
+        suffix=shlex.quote(STAGING_SUFFIX),
+        compress='1' if compress else '0',
+        snappath=shlex.quote(remote_root.rstrip('/') + '/' + SNAPSHOT_DIR),
+        compressor='gzip -1' if compress else 'cat',
+    )
+
+
+class _Reader:
+    """Pulls bytes, varints and separated fields from a stream of chunks"""
+
+    def __init__(self, chunks):
+        self._chunks = chunks
+        self._buf = b''
+        self._pos = 0
+
+    def _fill(self):
+        chunk = next(self._chunks, None)
+        if chunk is None:
+            raise EOFError("Manifest ended early")
+        self._buf = self._buf[self._pos:] + chunk
+        self._pos = 0
+
+    def take(self, count):
+        while len(self._buf) - self._pos < count:
+            self._fill()
+        data = self._buf[self._pos:self._pos + count]
+        self._pos += count
+        return data
+
+    def varint(self):
+        result = shift = 0
+        while True:
+            if self._pos >= len(self._buf):
+                self._fill()
+            byte = self._buf[self._pos]
+            self._pos += 1
+            result |= (byte & 0x7f) << shift
+            if byte < 0x80:
+                return result
+            shift += 7
+
+    def until(self, separator):
+        while True:
+            end = self._buf.find(separator, self._pos)
+            if end >= 0:
+                data = self._buf[self._pos:end]
+                self._pos = end + 1
+                return data
+            self._fill()
+
+
+def _decompressed(chunks):
+    """Transparently gunzip a chunk stream if it starts with the gzip magic"""
+    first = b''
+    for chunk in chunks:
+        first += chunk
+        if len(first) >= len(GZIP_MAGIC):
+            break
+    if not first.startswith(GZIP_MAGIC):
+        yield first
+        yield from chunks
+        return
+    inflater = zlib.decompressobj(31)
+    yield inflater.decompress(first)
+    for chunk in chunks:
+        yield inflater.decompress(chunk)
+    yield inflater.flush()
+
+
+def read_manifest(chunks, require_sorted=False):
+    """Yield (relative path, size, mtime) from manifest bytes as they arrive.
+
+    `chunks` iterates over raw (possibly gzipped) bytes. Entries are decoded
+    one by one, so nothing but the current chunk is held in memory. With
+    `require_sorted`, UnsortedManifest is raised before any entry unless the
+    manifest comes in path_key order.
+    """
+    reader = _Reader(_decompressed(iter(chunks)))
+    magic = reader.take(len(BINARY_MAGIC))
+    if require_sorted and magic != BINARY_MAGIC:
+        raise UnsortedManifest("Remote listing is not sorted")
+    if magic == BINARY_MAGIC:
+        prev = b''
+        while True:
+            shared = reader.varint()
+            length = reader.varint()
+            if not shared and not length:
+                return
+            path = prev[:shared] + reader.take(length)
+            size = reader.varint()
+            mtime = reader.varint()
+            mtime = (mtime >> 1) ^ -(mtime & 1)
+            prev = path
+            yield path.decode('utf-8', 'surrogateescape'), size, mtime / 1000.0
+    elif magic == TEXT_MAGIC:
+        while True:
+            record = reader.until(b'\0')
+            if not record:
+                return
+            size, mtime, path = record.split(b'\t', 2)
+            yield path.decode('utf-8', 'surrogateescape'), int(size), float(mtime)
+    else:
+        raise ValueError(f"Unrecognised remote manifest header {magic!r}")
+
+
+def fetch_manifest(engine, remote_root, consume, compress=True, require_sorted=False, cancel_token=None):
+    """Stream the remote tree's manifest, calling `consume(rel_path, size, mtime)` per file.
+
+    The listing runs as a channel of the transfer engine, decoded on its
+    I/O pool while output arrives. Bookkeeping paths are skipped. Returns
+    the number of files consumed.
+    """
+    def _consume(chunks):
+        count = 0
+        try:
+            for rel_path, size, mtime in read_manifest(chunks, require_sorted):
+                if rel_path and rel_path != 'filelist.txt' and not is_internal(rel_path):
+                    consume(rel_path, size, mtime)
+                    count += 1
+        except (EOFError, ValueError, zlib.error) as e:
+            return count, e
+        return count, None
+
+    (count, error), status, errors = engine.call(
+        engine.list_tree(listing_command(remote_root, compress), _consume), cancel_token
+    )
+    if error is not None:
+        raise IOError(f"Remote listing failed: {errors or str(error)}")
+    if status != 0:
+        # Complete manifest; e.g. find reports unreadable directories
+        logger.warning(f"Remote listing of {remote_root} reported errors")
+    return count
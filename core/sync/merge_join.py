@@ -0,0 +1,102 @@
+import logging
+import os
+
+logger = logging.getLogger('GOSync')
+
+
+def name_key(name):
+    """Sort key for one path component: case-insensitive, then exact bytes"""
+    encoded = name.encode('utf-8', 'surrogateescape')
+    return encoded.lower(), encoded
+
+
+def path_key(rel_path):
+    """Join key of a relative path, ordered like a depth-first walk in name_key order.
+
+    Separators become NUL so a directory's contents sort right after its
+    own name, before any sibling that extends that name. Paths differing
+    only in (ASCII) case share a key, matching the case-insensitive
+    comparison used everywhere else.
+    """
+    return rel_path.encode('utf-8', 'surrogateescape').lower().replace(b'/', b'\0')
+
+
+def scan_sorted(root):
+    """Yield (rel_path, size, mtime) for the files under `root` in path_key order.
+
+    Directories whose names differ only in case are walked as one, as the
+    remote manifest helper does. Only the sorted entries of the directories
+    on the current path are held, so memory follows the tree's depth and
+    width, not its size.
+    """
+    def _walk(directories):
+        entries = []
+        for directory, prefix in directories:
+            try:
+                with os.scandir(directory) as scanned:
+                    entries.extend((prefix, entry) for entry in scanned)
+            except OSError as e:
+                logger.error(f"Failed to scan {directory}: {str(e)}")
+        entries.sort(key=lambda item: name_key(item[1].name))
+        i = 0
+        while i < len(entries):
+            lower = name_key(entries[i][1].name)[0]
+            subdirectories = []
+            while i < len(entries) and name_key(entries[i][1].name)[0] == lower:
+                prefix, entry = entries[i]
+                i += 1
+                rel_path = prefix + entry.name
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirectories.append((entry.path, rel_path + '/'))
+                    elif entry.is_file():
+                        st = entry.stat()
+                        yield rel_path, st.st_size, st.st_mtime
+                except OSError as e:
+                    logger.error(f"Failed to scan {entry.path}: {str(e)}")
+            if subdirectories:
+                yield from _walk(subdirectories)
+
+    return _walk([(str(root), '')])
+
+
+class MergeJoin:
+    """Merge-joins a sorted local stream with sorted remote entries as they arrive.
+
+    Remote entries are pushed one at a time (e.g. straight from the manifest
+    reader); the local stream is advanced just far enough to match each of
+    them. `on_pair(local, remote)` receives every path once, with None for
+    the side it is missing from, as soon as that is known. Memory is
+    constant apart from the local stream's own state.
+    """
+
+    def __init__(self, local_entries, on_pair):
+        self._local = iter(local_entries)
+        self._on_pair = on_pair
+        self._last_key = None
+        self._advance()
+
+    def _advance(self):
+        self._next = next(self._local, None)
+        self._next_key = path_key(self._next[0]) if self._next is not None else None
+
+    def push(self, rel_path, size, mtime):
+        """Join one remote entry; entries must arrive in path_key order"""
+        key = path_key(rel_path)
+        if self._last_key is not None and key < self._last_key:
+            raise ValueError(f"Remote listing out of order at {rel_path!r}")
+        self._last_key = key
+        while self._next is not None and self._next_key < key:
+            self._on_pair(self._next, None)
+            self._advance()
+        if self._next is not None and self._next_key == key:
+            self._on_pair(self._next, (rel_path, size, mtime))
+            self._advance()
+        else:
+            self._on_pair(None, (rel_path, size, mtime))
+
+    def finish(self):
+        """Emit the local entries left after the last remote one"""
+        while self._next is not None:
+            self._on_pair(self._next, None)
+            self._advance()
@@ -0,0 +1,257 @@
+import hashlib
+import logging
+import shlex
+from core.sync.path_table import FLAG_REMOTE
+from core.sync.snapshots import SNAPSHOT_DIR, STAGING_SUFFIX
+
+logger = logging.getLogger('GOSync')
+
+QUERY_BATCH = 256  # Directories queried before their replies are read; keeps both pipes from filling
+LEGACY_CACHE = '.gosync-merkle'  # Where older versions kept the digest cache, inside the synced root
+
+# Runs on the server with python3. Prints the root digest, then answers
+# queries: each line on stdin names a directory (empty for the root) and is
+# answered with its files and non-empty subdirectories, ended by a "." line.
+# A directory's digest covers the names of its files and the names and
+# digests of its subdirectories. Unchanged directories (same mtime) are
+# taken from the cache without listing them. The cache is kept outside the
+# synced tree, under ~/.cache/gosync/<sha1 of the root's real path>.json.
+HELPER_SCRIPT = r'''
+import hashlib, json, os, sys, time
+root, SNAPDIR, SUFFIX, LEGACY = (os.fsencode(arg) for arg in sys.argv[1:5])
+cache_dir = os.path.join(os.fsencode(os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')),
+                         b'gosync')
+cache_path = os.path.join(cache_dir, hashlib.sha1(os.path.realpath(root)).hexdigest().encode() + b'.json')
+skip_top = {SNAPDIR, b'filelist.txt'}
+for name in (LEGACY, LEGACY + b'.tmp'):
+    try:
+        os.remove(os.path.join(root, name))
+    except OSError:
+        pass
+now = time.time()
+try:
+    with open(cache_path) as f:
+        old = json.load(f)
+except Exception:
+    old = {}
+new = {}
+digests = {}
+
+def join(rel, name):
+    return rel + b'/' + name if rel else name
+
+def entries(rel):
+    files, dirs = [], []
+    for e in os.scandir(os.path.join(root, rel) if rel else root):
+        name = e.name
+        if (not rel and name in skip_top) or b'\n' in name or b'\t' in name:
+            continue
+        if e.is_dir(follow_symlinks=False):
+            dirs.append(e)
+        elif e.is_file(follow_symlinks=False) and not name.endswith(SUFFIX):
+            files.append(e)
+    return files, dirs
+
+def walk(rel):
+    st = os.lstat(os.path.join(root, rel) if rel else root)
+    key = os.fsdecode(rel)
+    hit = old.get(key)
+    if hit and hit[0] == st.st_mtime_ns:
+        files_hash, subdirs = hit[1], [os.fsencode(n) for n in hit[2]]
+    else:
+        files, dirs = entries(rel)
+        h = hashlib.sha1()
+        for name in sorted(e.name for e in files):
+            h.update(b'f' + name + b'\0')
+        files_hash = h.hexdigest() if files else ''
+        subdirs = sorted(e.name for e in dirs)
+    if now - st.st_mtime > 2:
+        # Entries changed within the timestamp granularity are not trusted later
+        new[key] = [st.st_mtime_ns, files_hash, [os.fsdecode(n) for n in subdirs]]
+    h = hashlib.sha1(files_hash.encode())
+    empty = not files_hash
+    for name in subdirs:
+        try:
+            child = walk(join(rel, name))
+        except OSError:
+            child = None
+        if child:
+            h.update(b'd' + name + b'\0' + child.encode())
+            empty = False
+    digest = None if empty else h.hexdigest()
+    digests[rel] = digest
+    return digest
+
+out = sys.stdout.buffer
+out.write((walk(b'') or '-').encode() + b'\n')
+out.flush()
+try:
+    os.makedirs(cache_dir, exist_ok=True)
+    # Per process, as the primary and a target on one server may run at once
+    tmp_path = cache_path + b'.%d' % os.getpid()
+    with open(tmp_path, 'w') as f:
+        json.dump(new, f)
+    os.replace(tmp_path, cache_path)
+except Exception:
+    pass
+while True:
+    line = sys.stdin.buffer.readline()
+    if not line:
+        break
+    rel = line.rstrip(b'\n')
+    try:
+        files, dirs = entries(rel)
+    except OSError:
+        files, dirs = [], []
+    for e in dirs:
+        digest = digests.get(join(rel, e.name))
+        if digest:
+            out.write(b'd\t' + digest.encode() + b'\t' + e.name + b'\n')
+    for e in files:
+        st = e.stat(follow_symlinks=False)
+        out.write(('f\t%d\t%.6f\t' % (st.st_size, st.st_mtime)).encode() + e.name + b'\n')
+    out.write(b'.\n')
+    out.flush()
+'''
+
+
+class TreeDigestUnavailable(Exception):
+    """The server cannot run the digest helper (no python3)"""
+
+
+def _encode(name):
+    return name.encode('utf-8', 'surrogateescape')
+
+
+def _decode(name):
+    return name.decode('utf-8', 'surrogateescape')
+
+
+def _join(directory, name):
+    return directory + '/' + name if directory else name
+
+
+class LocalTree:
+    """Directory digests over the local files in a PathTable, matching the helper's"""
+
+    def __init__(self, table, file_ids):
+        self.files = {}  # Directory -> [(encoded name, file ID)]
+        self.children = {'': set()}  # Directory -> names of subdirectories holding files
+        for file_id in file_ids:
+            path = table.path(file_id)
+            directory, _, name = path.rpartition('/')
+            if ((not directory and name == 'filelist.txt')
+                    or path.split('/', 1)[0] == SNAPSHOT_DIR or name.endswith(STAGING_SUFFIX)
+                    or '\t' in path or '\n' in path):
+                continue
+            self.files.setdefault(directory, []).append((_encode(name), file_id))
+            while directory:
+                parent, _, name = directory.rpartition('/')
+                siblings = self.children.setdefault(parent, set())
+                if name in siblings:
+                    break
+                siblings.add(name)
+                directory = parent
+        self.digests = {}
+        for directory in sorted(self.children.keys() | self.files.keys(),
+                                key=lambda d: d.count('/') + bool(d), reverse=True):
+            self.digests[directory] = self._digest(directory)
+
+    def _digest(self, directory):
+        files = self.files.get(directory)
+        files_hash = ''
+        if files:
+            h = hashlib.sha1()
+            for name in sorted(name for name, _ in files):
+                h.update(b'f' + name + b'\0')
+            files_hash = h.hexdigest()
+        h = hashlib.sha1(files_hash.encode())
+        empty = not files_hash
+        for name in sorted(self.children.get(directory, ()), key=_encode):
+            child = self.digests.get(_join(directory, name))
+            if child:
+                h.update(b'd' + _encode(name) + b'\0' + child.encode())
+                empty = False
+        return None if empty else h.hexdigest()
+
+    def subtree_ids(self, directory):
+        """File IDs in a directory and everything below it"""
+        stack = [directory]
+        while stack:
+            directory = stack.pop()
+            for _, file_id in self.files.get(directory, ()):
+                yield file_id
+            stack.extend(_join(directory, name) for name in self.children.get(directory, ()))
+
+
+def compare_trees(ssh_client, remote_root, table, local_ids):
+    """Mark local files present on the server by comparing directory digests.
+
+    Only directories whose digests differ are listed; their remote files are
+    added to the table like a full listing would. Returns the number of
+    directories that had to be listed.
+    """
+    tree = LocalTree(table, local_ids)
+    command = 'python3 -c ' + ' '.join(shlex.quote(arg) for arg in (
+        HELPER_SCRIPT, remote_root, SNAPSHOT_DIR, STAGING_SUFFIX, LEGACY_CACHE
+    ))
+
+    def _mark(directory):
+        for file_id in tree.subtree_ids(directory):
+            table.set_flag(file_id, FLAG_REMOTE)
+
+    def _compare(client):
+        channel = client.get_transport().open_session()
+        try:
+            channel.exec_command(command)
+            stdin = channel.makefile_stdin('wb')
+            stdout = channel.makefile('rb')
+            root = stdout.readline().rstrip(b'\n').decode('ascii', 'replace')
+            if not root:
+                errors = channel.makefile_stderr('rb').read().decode('utf-8', 'replace').strip()
+                status = channel.recv_exit_status()
+                if status == 127:
+                    raise TreeDigestUnavailable(errors or "python3 not found")
+                raise IOError(f"Digest helper failed ({status}): {errors}")
+
+            listed = 0
+            if root == (tree.digests.get('') or '-'):
+                _mark('')
+                return listed
+
+            # One round trip per tree level, for the directories that differ
+            level = ['']
+            while level:
+                next_level = []
+                for index, directory in enumerate(level):
+                    if index % QUERY_BATCH == 0:
+                        # Write a bounded batch, then read its replies: writing a whole wide level
+                        # first deadlocks once the replies fill the channel window
+                        batch = level[index:index + QUERY_BATCH]
+                        stdin.write(b''.join(_encode(name) + b'\n' for name in batch))
+                        stdin.flush()
+                    listed += 1
+                    while True:
+                        line = stdout.readline()
+                        if not line:
+                            raise EOFError("Digest helper exited early")
+                        if line == b'.\n':
+                            break
+                        fields = line[:-1].split(b'\t')
+                        if fields[0] == b'f':
+                            path = _join(directory, _decode(b'\t'.join(fields[3:])))
+                            table.add_remote(path, int(fields[1]), float(fields[2]))
+                        elif fields[0] == b'd':
+                            path = _join(directory, _decode(b'\t'.join(fields[2:])))
+                            if tree.digests.get(path) == fields[1].decode('ascii'):
+                                _mark(path)
+                            else:
+                                next_level.append(path)
+                level = next_level
+            return listed
+        finally:
+            channel.close()
+
+    listed = ssh_client.run(_compare)
+    logger.info(f"Tree digest comparison listed {listed} remote directories")
+    return listed
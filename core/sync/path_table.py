@@ -0,0 +1,180 @@
+import threading
+from array import array
+
+# Entry flags
+FLAG_LOCAL = 0x01    # Present in the last local scan
+FLAG_REMOTE = 0x02   # Present in the last remote listing
+FLAG_PENDING = 0x04  # Waiting to be uploaded
+FLAG_SENT = 0x08     # Uploaded by this session
+
+
+class PathTable:
+    """Compact table of relative file paths and their metadata.
+
+    Directory prefixes are interned once and every file is addressed by an
+    integer ID. Size, mtime and flags live in array-backed columns so a few
+    million entries cost tens of MB instead of hundreds. Lookups are
+    case-insensitive to match the remote comparison rules.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+
+        # Directory table: dir ID -> display path, lowercase path -> dir ID
+        self._dirs = ['']
+        self._dir_index = {'': 0}
+        self._children = [{}]  # dir ID -> {lowercase name: file ID}
+
+        # File columns, indexed by file ID
+        self._dir_ids = array('l')
+        self._names = []
+        self.sizes = array('q')
+        self.mtimes = array('d')
+        self.remote_sizes = array('q')
+        self.remote_mtimes = array('d')
+        self.flags = array('B')
+
+    def __len__(self):
+        return len(self._names)
+
+    @staticmethod
+    def _split(rel_path):
+        """Split a relative path into (directory, name) using forward slashes"""
+        rel_path = rel_path.replace('\\', '/').strip('/')
+        head, _, name = rel_path.rpartition('/')
+        return head, name
+
+    def _intern_dir(self, directory):
+        """Return the ID of a directory prefix, interning it if needed"""
+        key = directory.lower()
+        dir_id = self._dir_index.get(key)
+        if dir_id is None:
+            dir_id = len(self._dirs)
+            self._dirs.append(directory)
+            self._dir_index[key] = dir_id
+            self._children.append({})
+        return dir_id
+
+    def intern(self, rel_path):
+        """Return the file ID for a relative path, adding it if needed"""
+        directory, name = self._split(rel_path)
+        with self._lock:
+            dir_id = self._intern_dir(directory)
+            children = self._children[dir_id]
+            key = name.lower()
+            file_id = children.get(key)
+            if file_id is None:
+                file_id = len(self._names)
+                children[key] = file_id
+                self._dir_ids.append(dir_id)
+                self._names.append(name)
+                self.sizes.append(0)
+                self.mtimes.append(0.0)
+                self.remote_sizes.append(-1)
+                self.remote_mtimes.append(0.0)
+                self.flags.append(0)
+            return file_id
+
+    def lookup(self, rel_path):
+        """Return the file ID for a relative path, or None if unknown"""
+        directory, name = self._split(rel_path)
+        dir_id = self._dir_index.get(directory.lower())
+        if dir_id is None:
+            return None
+        return self._children[dir_id].get(name.lower())
+
+    def path(self, file_id):
+        """Return the relative path (forward slashes) of a file ID"""
+        directory = self._dirs[self._dir_ids[file_id]]
+        name = self._names[file_id]
+        return f"{directory}/{name}" if directory else name
+
+    def paths(self, ids):
+        """Yield relative paths for a sequence of file IDs"""
+        for file_id in ids:
+            yield self.path(file_id)
+
+    def add_local(self, rel_path, size=0, mtime=0.0):
+        """Record a file seen in the local scan"""
+        file_id = self.intern(rel_path)
+        self.sizes[file_id] = size
+        self.mtimes[file_id] = mtime
+        self.flags[file_id] |= FLAG_LOCAL
+        return file_id
+
+    def add_remote(self, rel_path, size=-1, mtime=0.0):
+        """Record a file seen in the remote listing"""
+        file_id = self.intern(rel_path)
+        self.remote_sizes[file_id] = size
+        self.remote_mtimes[file_id] = mtime
+        self.flags[file_id] |= FLAG_REMOTE
+        return file_id
+
+    def set_flag(self, file_id, flag):
+        """Set a flag on a file ID"""
+        with self._lock:
+            self.flags[file_id] |= flag
+
+    def clear_flag(self, flag, ids=None):
+        """Clear a flag on the given IDs, or on every entry"""
+        mask = 0xFF ^ flag
+        with self._lock:
+            flags = self.flags
+            if ids is None:
+                ids = range(len(flags))
+            for file_id in ids:
+                flags[file_id] &= mask
+
+    def has_flag(self, file_id, flag):
+        """Check whether a file ID carries a flag"""
+        return bool(self.flags[file_id] & flag)
+
+    def ids_with_flag(self, flag):
+        """Return a sorted ID array of entries carrying a flag"""
+        with self._lock:
+            flags = self.flags
+            return array('l', (i for i in range(len(flags)) if flags[i] & flag))
+
+
+def sorted_ids(ids):
+    """Build a sorted, de-duplicated ID array from any iterable of IDs"""
+    return array('l', sorted(set(ids)))
+
+
+def difference(a, b):
+    """Return IDs in sorted array a that are not in sorted array b"""
+    out = array('l')
+    i = j = 0
+    len_a, len_b = len(a), len(b)
+    while i < len_a:
+        if j >= len_b:
+            out.extend(a[i:])
+            break
+        x, y = a[i], b[j]
+        if x < y:
+            out.append(x)
+            i += 1
+        elif x > y:
+            j += 1
+        else:
+            i += 1
+            j += 1
+    return out
+
+
+def intersection(a, b):
+    """Return IDs present in both sorted arrays"""
+    out = array('l')
+    i = j = 0
+    len_a, len_b = len(a), len(b)
+    while i < len_a and j < len_b:
+        x, y = a[i], b[j]
+        if x < y:
+            i += 1
+        elif x > y:
+            j += 1
+        else:
+            out.append(x)
+            i += 1
+            j += 1
+    return out
@@ -0,0 +1,144 @@
+import logging
+import posixpath
+import shlex
+import socket
+from PySide6.QtCore import QThread, Signal
+from core.ssh.ssh_client import SSHClient
+from core.ssh.connection import BACKOFF_CAP
+from core.ssh.cancellation import CancelToken, TransferCancelled
+from core.sync.snapshots import SNAPSHOT_DIR, is_internal
+
+logger = logging.getLogger('GOSync')
+
+# Files written by GOSync itself inside the remote tree
+IGNORED_NAMES = {'filelist.txt'}
+
+DEFAULT_POLL_INTERVAL = 5  # seconds between find -newer scans in fallback mode
+
+# Prefer inotifywait; otherwise stamp-file polling with find -newer. The new
+# stamp is touched before each scan so changes made during a scan are caught
+# by the next one.
+WATCH_SCRIPT = '''root={root}
+if command -v inotifywait >/dev/null 2>&1; then
+  echo "MODE inotify"
+  exec inotifywait -m -r -q -e close_write -e moved_to -e delete -e moved_from --format '%e %w%f' --exclude '/{snapdir_re}(/|$)' "$root"
+fi
+echo "MODE poll"
+stamp=$(mktemp)
+while :; do
+  sleep {interval}
+  touch "$stamp.next"
+  find "$root" -path "$root/{snapdir}" -prune -o -type f -newer "$stamp" -printf 'CLOSE_WRITE %p\\n'
+  mv "$stamp.next" "$stamp"
+done
+'''
+
+
+def parse_event(line, remote_root):
+    """Turn one watcher output line into (kind, relative path) or None.
+
+    kind is 'modified' or 'deleted'.
+    """
+    events, sep, path = line.partition(' ')
+    if not sep or events == 'MODE':
+        return None
+    if ',ISDIR' in events:
+        return None
+    rel_path = posixpath.relpath(path, remote_root)
+    if (rel_path.startswith('..') or posixpath.basename(rel_path) in IGNORED_NAMES
+            or is_internal(rel_path)):
+        return None
+    if 'DELETE' in events or 'MOVED_FROM' in events:
+        return 'deleted', rel_path
+    return 'modified', rel_path
+
+
+class RemoteWatcher(QThread):
+    """Streams change events from a watcher running on the server"""
+    remote_changed = Signal(str, str)  # kind ('modified'/'deleted'), relative path
+    watch_status = Signal(str)  # Status message
+
+    def __init__(self, config):
+        super().__init__()
+        self.config = config
+        self.ssh_client = SSHClient(config)
+        self.running = False
+        self._channel = None
+        self.cancel_token = CancelToken()  # Ends backoff sleeps as soon as stop() is called
+        self.ssh_client.cancel_token = self.cancel_token
+
+    def stop(self):
+        """Stop watching without waiting; closing the channel ends the read loop"""
+        self.running = False
+        self.cancel_token.cancel()
+        channel = self._channel
+        if channel:
+            channel.close()
+
+    def run(self):
+        """Keep a watch channel open, reopening it after disconnects"""
+        # stop() may already have been called before the thread started
+        self.running = not self.cancel_token.cancelled
+        delay = 1.0
+        while self.running:
+            try:
+                self._watch()
+                delay = 1.0
+            except Exception as e:
+                if not self.running:
+                    break
+                logger.warning(f"Remote watch interrupted, retrying in {delay:g}s: {str(e)}")
+                self.ssh_client.disconnect()
+            if self.running:
+                try:
+                    self.cancel_token.sleep(delay)
+                except TransferCancelled:
+                    break
+                delay = min(delay * 2, BACKOFF_CAP)
+        self.ssh_client.disconnect()
+
+    def _watch(self):
+        """Run the remote watcher and forward its events until it ends"""
+        ssh_settings = self.config.get_ssh_settings()
+        sync_settings = self.config.get_sync_settings()
+        remote_root = ssh_settings['remote_path'].replace('\\', '/').rstrip('/')
+        script = WATCH_SCRIPT.format(
+            root=shlex.quote(remote_root),
+            snapdir=SNAPSHOT_DIR,
+            snapdir_re=SNAPSHOT_DIR.replace('.', '\\.'),
+            interval=sync_settings.get('remote_poll_interval', DEFAULT_POLL_INTERVAL)
+        )
+
+        self.ssh_client.ensure_connected()
+        channel = self.ssh_client.client.get_transport().open_session()
+        self._channel = channel
+        try:
+            channel.settimeout(1.0)
+            channel.exec_command('sh -c ' + shlex.quote(script))
+
+            buffer = b''
+            while self.running:
+                try:
+                    data = channel.recv(32768)
+                except socket.timeout:
+                    continue
+                if not data:
+                    break
+                buffer += data
+                *lines, buffer = buffer.split(b'\n')
+                for raw in lines:
+                    self._handle_line(raw.decode('utf-8', errors='replace'), remote_root)
+        finally:
+            self._channel = None
+            channel.close()
+
+    def _handle_line(self, line, remote_root):
+        """Emit a change signal for one line of watcher output"""
+        if line.startswith('MODE '):
+            mode = line.split(' ', 1)[1]
+            logger.info(f"Remote watch started ({mode})")
+            self.watch_status.emit(f"Watching remote changes ({mode})")
+            return
+        event = parse_event(line, remote_root)
+        if event:
+            self.remote_changed.emit(*event)
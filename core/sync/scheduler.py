@@ -0,0 +1,94 @@
+import threading
+import time
+
+
+class SyncScheduler:
+    """Adaptive delay between automatic sync cycles.
+
+    Idle cycles double the delay up to the configured sync interval, and any
+    watcher activity snaps it back to the fast interval and wakes a waiting
+    worker immediately.
+    """
+
+    def __init__(self, min_interval=1.0, max_interval=300.0, backoff=2.0):
+        self.min_interval = float(min_interval)
+        self.max_interval = max(float(max_interval), self.min_interval)
+        self.backoff = backoff
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._interval = self.min_interval
+        self._idle_cycles = 0
+        self._last_cycle = None
+        self._last_activity = None
+        self._next_run = None
+
+    def record_cycle(self, work_done):
+        """Update the interval after a sync cycle transferred `work_done` files"""
+        with self._lock:
+            self._last_cycle = time.time()
+            if work_done:
+                self._idle_cycles = 0
+                self._interval = self.min_interval
+            else:
+                self._idle_cycles += 1
+                self._interval = min(self._interval * self.backoff, self.max_interval)
+            self._next_run = time.time() + self._interval
+
+    def notify_activity(self):
+        """Reset to fast cycles and wake any waiting worker"""
+        with self._lock:
+            self._last_activity = time.time()
+            self._idle_cycles = 0
+            self._interval = self.min_interval
+            self._next_run = time.time()
+        self._wakeup.set()
+
+    def wake(self):
+        """Wake a waiting worker for targeted work without forcing a full cycle"""
+        self._wakeup.set()
+
+    def wait_woken(self):
+        """Sleep until the worker is woken, ignoring the schedule (while paused)"""
+        self._wakeup.wait()
+        self._wakeup.clear()
+
+    def postpone(self, seconds):
+        """Push the next full cycle out; watcher activity still brings it forward"""
+        with self._lock:
+            self._next_run = time.time() + seconds
+
+    def due(self):
+        """Check whether a full sync cycle should run now"""
+        with self._lock:
+            return self._next_run is None or time.time() >= self._next_run
+
+    def wait(self):
+        """Sleep until the next cycle is due or the worker is woken.
+
+        Returns True if the wait was cut short.
+        """
+        with self._lock:
+            if self._next_run is None:
+                delay = self._interval
+            else:
+                delay = max(0.0, self._next_run - time.time())
+        woken = self._wakeup.wait(delay)
+        self._wakeup.clear()
+        return woken
+
+    def stop(self):
+        """Release a waiting worker so it can exit"""
+        self._wakeup.set()
+
+    def state(self):
+        """Return a snapshot of the scheduler state"""
+        with self._lock:
+            return {
+                'interval': self._interval,
+                'min_interval': self.min_interval,
+                'max_interval': self.max_interval,
+                'idle_cycles': self._idle_cycles,
+                'last_cycle': self._last_cycle,
+                'last_activity': self._last_activity,
+                'next_run': self._next_run,
+            }
@@ -0,0 +1,135 @@
+import logging
+import posixpath
+import shlex
+import time
+from core.ssh.file_transfer import STAGING_SUFFIX, TransferHooks, send_staged
+from core.ssh.upload_reader import send_stream
+from core.sync.encryption import cipher_for, download_decrypted, send_contents
+
+logger = logging.getLogger('GOSync')
+
+SNAPSHOT_DIR = '.gosync-snapshots'  # Under the remote root, one subdirectory per snapshot
+DEFAULT_KEEP = 30  # Snapshots kept; 0 keeps all
+DEFAULT_INTERVAL = 3600  # Seconds between snapshots of a remote that keeps changing
+STALE_PARTIAL_MINUTES = 60  # Unfinished snapshots older than this are left over from failures
+
+# Hard-link the live tree into a new snapshot. It is built under a hidden
+# name and renamed when complete, so a partial snapshot is never listed;
+# a failed one removes its partial copy.
+SNAPSHOT_SCRIPT = '''cd -- {root} || exit 1
+mkdir -p -- {partial} || exit 1
+find . -mindepth 1 -maxdepth 1 ! -name {snapdir} ! -name filelist.txt -exec cp -al -t {partial} -- {{}} + \\
+    && mv -T -- {partial} {target} || {{ rm -rf -- {partial}; exit 1; }}'''
+
+# Drop partial snapshots left by interrupted runs, then all but the newest `keep` (0 keeps all)
+PRUNE_SCRIPT = '''cd -- {snapdir} || exit 0
+find . -mindepth 1 -maxdepth 1 -name '.*.partial' -mmin +{stale} -exec rm -rf -- {{}} +
+[ {keep} -gt 0 ] || exit 0
+ls -1 | grep -v '^[.]' | sort | head -n -{keep} | while IFS= read -r d; do rm -rf -- "$d"; done'''
+
+
+def snapshots_enabled(config):
+    """Check whether versioned snapshots are turned on"""
+    return config.get_sync_settings().get('snapshots', False)
+
+
+def snapshot_name(when=None):
+    """Sortable UTC timestamp used as a snapshot directory name.
+
+    Microseconds keep back-to-back snapshots (or the primary and a target
+    sharing a server) from colliding within the same second.
+    """
+    when = time.time() if when is None else when
+    return time.strftime('%Y%m%d-%H%M%S', time.gmtime(when)) + f".{int(when % 1 * 1e6):06d}"
+
+
+def is_internal(rel_path):
+    """Check whether a remote relative path belongs to GOSync bookkeeping"""
+    top = rel_path.split('/', 1)[0]
+    return top == SNAPSHOT_DIR or rel_path.endswith(STAGING_SUFFIX)
+
+
+def create_snapshot(engine, remote_root, keep=DEFAULT_KEEP):
+    """Snapshot the remote tree with hard links and prune old snapshots.
+
+    Unchanged files share inodes with the live tree and earlier snapshots,
+    so a snapshot costs directory entries only, but linking takes time in
+    proportion to the tree. Both steps therefore run on their own exec
+    channels of the transfer engine, with no read timeout. Returns the
+    snapshot name.
+    """
+    name = snapshot_name()
+    snapdir = posixpath.join(remote_root, SNAPSHOT_DIR)
+    command = SNAPSHOT_SCRIPT.format(
+        root=shlex.quote(remote_root),
+        snapdir=shlex.quote(SNAPSHOT_DIR),
+        partial=shlex.quote(posixpath.join(SNAPSHOT_DIR, '.' + name + '.partial')),
+        target=shlex.quote(posixpath.join(SNAPSHOT_DIR, name)),
+    )
+
+    status, output, errors = engine.call(engine.exec_command(command))
+    if status != 0:
+        raise IOError(f"Snapshot {name} failed: {errors or output.decode('utf-8', 'replace').strip()}")
+    logger.info(f"Created remote snapshot {name}")
+    status, output, errors = engine.call(engine.exec_command(
+        PRUNE_SCRIPT.format(snapdir=shlex.quote(snapdir), keep=int(keep), stale=STALE_PARTIAL_MINUTES)
+    ))
+    if status != 0:
+        logger.warning(f"Pruning snapshots under {snapdir} failed: {errors}")
+    return name
+
+
+def list_snapshots(ssh_client, remote_root):
+    """Names of the complete snapshots, oldest first"""
+    snapdir = shlex.quote(posixpath.join(remote_root, SNAPSHOT_DIR))
+    request = ssh_client.session_call(
+        lambda session: session.call(f"ls -1 -- {snapdir} 2>/dev/null | grep -v '^[.]'")
+    )
+    return sorted(line for line in request.text().splitlines() if line)
+
+
+def send_versioned(ssh_client, transport, local_file, remote_path, config, **kwargs):
+    """Upload a file without modifying inodes shared with snapshots.
+
+    In snapshot mode the file is written to a staging name and renamed over
+    the target, so hard links in earlier snapshots keep the old contents.
+    Extra keyword arguments go to send_contents.
+    """
+    _place(ssh_client, remote_path, config,
+           lambda target: send_contents(transport, local_file, target, **kwargs))
+
+
+def stream_versioned(ssh_client, transport, remote_path, size, mode, produce, config, **kwargs):
+    """Like send_versioned, for `size` bytes produced by `produce(consume)`"""
+    _place(ssh_client, remote_path, config,
+           lambda target: send_stream(transport, target, size, mode, produce, **kwargs))
+
+
+def _place(ssh_client, remote_path, config, upload):
+    """Run `upload(path)` directly or via a staging name, depending on snapshot mode"""
+    if not snapshots_enabled(config):
+        upload(remote_path)
+        return
+    send_staged(ssh_client, remote_path, upload)
+
+
+class SyncTransferHooks(TransferHooks):
+    """TransferHooks that encrypt contents when configured.
+
+    Manual uploads are always staged and renamed into place, which also
+    leaves snapshot hard links intact.
+    """
+
+    def cipher_for(self, config):
+        return cipher_for(config)
+
+    def send(self, ssh_client, transport, local_file, remote_path, cipher=None, progress=None):
+        send_staged(ssh_client, remote_path,
+                    lambda target: send_contents(transport, local_file, target, cipher=cipher,
+                                                 progress=progress))
+
+    def receive(self, sftp, remote_path, local_path, cipher=None, callback=None):
+        if cipher is None:
+            super().receive(sftp, remote_path, local_path, cipher, callback)
+            return
+        download_decrypted(sftp, remote_path, local_path, cipher, callback)
@@ -0,0 +1,55 @@
+import threading
+import time
+
+
+class SyncStats:
+    """Upload counters and last-cycle timings, shared by a manager's workers.
+
+    Uploads are recorded from the transfer threads, so updates take a lock;
+    snapshot() returns plain values for status reports.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.files_sent = 0
+        self.bytes_sent = 0
+        self.last_cycle = None
+
+    def record_sent(self, size):
+        """Count one uploaded file"""
+        with self._lock:
+            self.files_sent += 1
+            self.bytes_sent += max(0, size)
+
+    def record_cycle(self, started, listed, transferring, bytes_before, files):
+        """Store the timings of a finished cycle.
+
+        Times are monotonic: the cycle start, the end of the comparison and
+        the start of the transfers (None if never reached). A streaming
+        comparison transfers while it lists, so the two may overlap.
+        `bytes_before` is bytes_sent when the cycle started.
+        """
+        finished = time.monotonic()
+        listed = listed if listed is not None else finished
+        transferring = transferring if transferring is not None else finished
+        with self._lock:
+            sent = self.bytes_sent - bytes_before
+        transfer = finished - transferring
+        self.last_cycle = {
+            'finished': time.time(),
+            'seconds': round(finished - started, 3),
+            'compare_seconds': round(listed - started, 3),
+            'transfer_seconds': round(transfer, 3),
+            'files': files,
+            'bytes': sent,
+            'bytes_per_second': round(sent / transfer) if transfer > 0 else 0,
+        }
+
+    def snapshot(self):
+        """Totals and the last cycle as a dict"""
+        with self._lock:
+            return {
+                'files_sent': self.files_sent,
+                'bytes_sent': self.bytes_sent,
+                'last_cycle': self.last_cycle,
+            }
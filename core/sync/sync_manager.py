@@ -1,170 +1,1082 @@
 import os
 import logging
-import tempfile
+import hashlib
+import posixpath
+import queue
+import shlex
+import threading
 import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from PySide6.QtCore import QThread, Signal, QFileSystemWatcher, QObject
+from core.ssh.async_engine import TransferEngine
 from core.ssh.ssh_client import SSHClient
+from core.sync.path_table import (
+    PathTable, FLAG_LOCAL, FLAG_REMOTE, FLAG_PENDING, FLAG_SENT, difference, sorted_ids
+)
+from core.sync.scheduler import SyncScheduler
+from core.sync.integrity import MAX_RETRIES, VERIFY_BATCH, verify_batch
+from core.sync.encryption import cipher_for, content_source, receive_contents
+from core.sync.snapshots import (
+    DEFAULT_INTERVAL, DEFAULT_KEEP, STAGING_SUFFIX, SyncTransferHooks, create_snapshot,
+    send_versioned, snapshots_enabled, stream_versioned
+)
+from core.sync.fanout import Fanout
+from core.sync.targets import PRIMARY_NAME, load_targets
+from core.sync.journal import JOURNAL_FILE, SyncJournal
+from core.sync.merkle import TreeDigestUnavailable, compare_trees
+from core.sync.manifest import UnsortedManifest, fetch_manifest
+from core.sync.merge_join import MergeJoin, scan_sorted
+from core.sync.remote_watch import RemoteWatcher
+from core.sync.stats import SyncStats
+from core.sync.sync_plan import (
+    BUNDLE_ROUND_TRIPS, MAX_PARALLEL, OP_BUNDLE, OP_MKDIR, UPLOAD_ROUND_TRIPS, CostModel, build_plan
+)
+from core.ssh.upload_reader import send_tar
+from core.ssh.cancellation import CancelToken, TransferCancelled
+from core.sync.event_trace import TraceRecorder, TRACE_DIRECTORY, TRACE_FILE, TRACE_NEW_FILE
+from core.ssh.transfer_queue import DONE
 from scp import SCPClient
 
 logger = logging.getLogger('GOSync')
 
+UPLOAD_ECHO_WINDOW = 60  # seconds during which remote events for our own uploads are ignored
+DOWNLOAD_ECHO_WINDOW = 60  # seconds during which local events matching a targeted download are ignored
+STREAM_QUEUE = 1024  # File IDs the streaming comparison may queue ahead of the uploads
+STREAM_BATCH = 256  # Most files handed to one sync plan while streaming
+STREAM_POLL = 0.1
+MTIME_SLACK = 2.0  # Seconds a local copy must be newer than the remote one to replace it
+
+
+def _hashed(produce, hasher):
+    """Wrap a content producer so every chunk also feeds `hasher`"""
+    def _produce(consume):
+        def _consume(chunk):
+            hasher.update(chunk)
+            consume(chunk)
+        return produce(_consume)
+    return _produce
+
 class SyncWorker(QThread):
     sync_complete = Signal(bool, str)  # Success, Message
     sync_progress = Signal(str)  # Progress message
-    files_updated = Signal(list, list)  # Local files, Remote files
+    files_updated = Signal(object, object, object)  # PathTable, local IDs, remote IDs
+    target_progress = Signal(str, int, int)  # Target name, files sent, files to send
+    uploads_finished = Signal(list, list)  # Requested paths uploaded, paths that failed
 
-    def __init__(self, config):
+    def __init__(self, config, path_table=None):
         super().__init__()
         self.config = config
-        self.ssh_client = SSHClient(config)
+        self.ssh_client = SSHClient(config, SyncTransferHooks())
+        self.engine = TransferEngine(config, ssh_client=self.ssh_client)  # Listings share the connection
         self.running = False
         self.auto_sync = False
-        self.sent_files = set()
-        self.check_interval = 10  # 10 seconds interval
+        self.path_table = path_table if path_table is not None else PathTable()
+        sync_settings = config.get_sync_settings()
+        self.scheduler = SyncScheduler(max_interval=sync_settings.get('sync_interval', 300))
+        self._downloads = deque()  # Relative paths changed remotely
+        self._uploads = deque()  # Relative paths requested for immediate upload
+        self.paused = False  # Skip scheduled cycles; requested uploads still run
+        self.busy = False  # In a sync cycle or uploading requested files
+        self.sync_stats = SyncStats()  # Shared with the manager's other workers
+        self._listed_at = None  # Monotonic end of this cycle's comparison
+        self._transferring_at = None  # Monotonic start of this cycle's transfers
+        self._recent_uploads = {}  # Lowercase relative path -> upload time
+        self._recent_downloads = {}  # Lowercase relative path -> (size, mtime, time) written, None while downloading
+        self.cost_model = CostModel.from_config(config)
+        self.cancel_token = CancelToken()  # Fired by stop() to abort transfers mid-chunk
+        self.ssh_client.cancel_token = self.cancel_token
+        self.journal = None  # SyncJournal shared with the manager, if enabled
+        self.resume_journal = False  # Start by resuming journaled uploads instead of comparing
+        self.tree_digests = sync_settings.get('tree_digests', True)  # Off once the server lacks python3
+        self.streaming_compare = sync_settings.get('streaming_compare', True)  # Off without sorted manifests
+        self._streamed = False
+        self.targets = load_targets(config)  # Additional remotes fed from the same reads
+        self._snapshot_at = {}  # Target (None for the primary) -> monotonic time of its last snapshot
+        self._unsnapshotted = set()  # Targets (None for the primary) changed since their last snapshot
+        for target in self.targets:
+            target.ssh_client.cancel_token = self.cancel_token
     
     def run(self):
         """Main worker thread"""
-        self.running = True
+        # stop() may already have been called before the thread started
+        self.running = not self.cancel_token.cancelled
+        if self.resume_journal and self.auto_sync and self.running:
+            self.resume_journal = False
+            if self._resume_pending():
+                # Reconcile in full only once the worker would otherwise be idle
+                self.scheduler.postpone(self.scheduler.max_interval)
         while self.running:
+            self._expire_echoes()
+            self._process_uploads()
+            if self.paused and self.auto_sync:
+                self.scheduler.wait_woken()
+                continue
+            self._process_downloads()
+            if self.scheduler.due():
+                try:
+                    sent = self.sync_now()
+                    if not self.auto_sync:
+                        break
+                    self.scheduler.record_cycle(sent)
+                except Exception as e:
+                    logger.error(f"Sync error: {str(e)}")
+                    self.sync_complete.emit(False, str(e))
+                    if not self.auto_sync:
+                        break
+                    # Even on error, back off and keep checking
+                    self.scheduler.record_cycle(0)
+            elif not self.auto_sync:
+                break  # One-shot worker started for requested uploads only
+            if self.running:
+                self.scheduler.wait()
+        self.engine.shutdown()
+        for target in self.targets:
+            target.engine.shutdown()
+            target.ssh_client.disconnect()
+    
+    def request_download(self, rel_path):
+        """Queue a targeted download of a remotely changed file"""
+        last_upload = self._recent_uploads.get(rel_path.lower())
+        if last_upload and time.time() - last_upload < UPLOAD_ECHO_WINDOW:
+            # Event caused by our own upload
+            return
+        self._downloads.append(rel_path)
+        self.scheduler.wake()
+    
+    def is_download_echo(self, rel_path, st):
+        """Check whether a local change to `rel_path` (with stat `st`) was made by a targeted download"""
+        key = rel_path.lower()
+        written = self._recent_downloads.get(key, False)
+        if written is False:
+            return False
+        if written is None or written[:2] == (st.st_size, st.st_mtime):
+            return True
+        # Changed again since the download, so it is a real edit
+        self._recent_downloads.pop(key, None)
+        return False
+    
+    def request_upload(self, rel_paths):
+        """Queue local files for upload without waiting for a full cycle"""
+        self._uploads.extend(rel_paths)
+        self.scheduler.wake()
+    
+    def _process_uploads(self):
+        """Upload the files queued by request_upload, skipping the comparison"""
+        if not self._uploads:
+            return
+        table = self.path_table
+        local_path = Path(self.config.get_sync_settings()['local_path'])
+        to_send = {}
+        failed = []
+        while self._uploads:
+            rel_path = self._uploads.popleft()
             try:
-                self.sync_now()
-                if not self.auto_sync:
-                    break
-                # Sleep for check_interval seconds
-                self.msleep(self.check_interval * 1000)
+                st = (local_path / rel_path).stat()
+            except OSError:
+                file_id = table.lookup(rel_path)
+                if file_id is not None:
+                    table.clear_flag(FLAG_PENDING, (file_id,))
+                if self.journal:
+                    self.journal.forget(rel_path)
+                failed.append(rel_path)
+                continue
+            file_id = table.add_local(rel_path, st.st_size, st.st_mtime)
+            table.clear_flag(FLAG_SENT, (file_id,))
+            to_send[file_id] = None
+        
+        if to_send:
+            self.busy = True
+            try:
+                self.sync_progress.emit(f"Uploading {len(to_send)} requested files")
+                self.ssh_client.ensure_connected()
+                self._sync_files(list(to_send), local_path)
+            except TransferCancelled:
+                pass
             except Exception as e:
-                logger.error(f"Sync error: {str(e)}")
-                self.sync_complete.emit(False, str(e))
-                if not self.auto_sync:
-                    break
-                # Even on error, continue checking after interval
-                self.msleep(self.check_interval * 1000)
+                logger.error(f"Requested uploads failed: {str(e)}")
+                self.sync_progress.emit(f"Requested uploads failed: {str(e)}")
+            finally:
+                self.busy = False
+        sent = [table.path(file_id) for file_id in to_send if table.has_flag(file_id, FLAG_SENT)]
+        failed.extend(table.path(file_id) for file_id in to_send if not table.has_flag(file_id, FLAG_SENT))
+        self.uploads_finished.emit(sent, failed)
+    
+    def backlog(self):
+        """Return (requested uploads, remote changes) waiting to be processed"""
+        return len(self._uploads), len(self._downloads)
+    
+    def take_requested(self):
+        """Remove and return requested uploads this worker did not get to"""
+        requested = list(self._uploads)
+        self._uploads.clear()
+        return requested
+    
+    def _process_downloads(self):
+        """Download files queued by the remote watcher"""
+        if not self._downloads:
+            return
+        ssh_settings = self.config.get_ssh_settings()
+        remote_base = ssh_settings['remote_path']
+        local_path = Path(self.config.get_sync_settings()['local_path'])
+        table = self.path_table
+        
+        while self._downloads and self.running:
+            rel_path = self._downloads.popleft()
+            remote_file = os.path.join(remote_base, rel_path).replace("\\", "/")
+            local_file = local_path / rel_path
+            part_file = local_file.with_name(local_file.name + '.gosync-part')
+            
+            cipher = cipher_for(self.config)
+            
+            def _download(client):
+                if cipher:
+                    receive_contents(client, remote_file, local_file, cipher,
+                                     callback=self.cancel_token.progress())
+                    return
+                # Received into a part file so an interrupted download keeps the existing copy
+                with SCPClient(client.get_transport(), progress=self.cancel_token.progress()) as scp:
+                    try:
+                        scp.get(remote_file, str(part_file))
+                    except TransferCancelled:
+                        # The remote scp never exits while blocked on a full window, so
+                        # close the channel rather than let SCPClient wait for its status
+                        scp.channel.close()
+                        raise
+                os.replace(part_file, local_file)
+            
+            # The local watcher fires while the file is written; is_download_echo tells it apart
+            self._recent_downloads[rel_path.lower()] = None
+            try:
+                local_file.parent.mkdir(parents=True, exist_ok=True)
+                self.sync_progress.emit(f"Downloading {rel_path}")
+                self.ssh_client.run(_download)
+                st = local_file.stat()
+                self._recent_downloads[rel_path.lower()] = (st.st_size, st.st_mtime, time.time())
+                file_id = table.add_local(rel_path, st.st_size, st.st_mtime)
+                # Already on the server, so the local watcher must not re-upload it
+                table.set_flag(file_id, FLAG_REMOTE | FLAG_SENT)
+                table.clear_flag(FLAG_PENDING, (file_id,))
+                logger.info(f"Downloaded remote change {rel_path}")
+            except TransferCancelled:
+                self._recent_downloads.pop(rel_path.lower(), None)
+                logger.info(f"Cancelled download of {rel_path}")
+                break
+            except Exception as e:
+                self._recent_downloads.pop(rel_path.lower(), None)
+                logger.error(f"Failed to download {rel_path}: {str(e)}")
+                self.sync_progress.emit(f"Error downloading {rel_path}: {str(e)}")
+            finally:
+                part_file.unlink(missing_ok=True)
     
     def stop(self):
-        """Stop the worker thread"""
+        """Ask the worker to stop without waiting for it.
+        
+        Running transfers abort at their next chunk and backoff sleeps end
+        immediately; use wait() or the finished signal to know when it exited.
+        """
         self.running = False
-        self.wait()
+        self.cancel_token.cancel()
+        self.scheduler.stop()
+    
+    def compare(self):
+        """Scan both sides and return the IDs of local files missing remotely"""
+        local_path = Path(self.config.get_sync_settings()['local_path'])
+        
+        self.sync_progress.emit("Connecting to SSH...")
+        self.ssh_client.ensure_connected()
+        self.ssh_client.clear_stat_cache()
+        
+        self.sync_progress.emit("Getting file lists...")
+        table = self.path_table
+        table.clear_flag(FLAG_LOCAL | FLAG_REMOTE)
+        self._scan_local_files(local_path)
+        self.fetch_remote_filelist()
+        local_ids = table.ids_with_flag(FLAG_LOCAL)
+        remote_ids = table.ids_with_flag(FLAG_REMOTE)
+        
+        self.files_updated.emit(table, local_ids, remote_ids)
+        if self.journal:
+            self._reconcile_journal(local_ids)
+        
+        self.sync_progress.emit("Comparing files...")
+        return difference(local_ids, remote_ids)
+    
+    def _reconcile_journal(self, local_ids):
+        """Record the comparison result so the next start can skip files already on the server"""
+        table = self.path_table
+        try:
+            synced = ((table.path(file_id), table.sizes[file_id], table.mtimes[file_id])
+                      for file_id in local_ids if table.has_flag(file_id, FLAG_REMOTE))
+            self.journal.reconcile(synced, {table.path(file_id).lower() for file_id in local_ids})
+        except Exception as e:
+            logger.error(f"Failed to update sync journal: {str(e)}")
+    
+    def _resume_pending(self):
+        """Upload the files left pending by the journal without a full comparison.
+        
+        Returns False if the resume failed and a full cycle should run now.
+        """
+        table = self.path_table
+        local_path = Path(self.config.get_sync_settings()['local_path'])
+        to_send = []
+        for file_id in table.ids_with_flag(FLAG_PENDING):
+            file = table.path(file_id)
+            try:
+                st = (local_path / file).stat()
+            except OSError:
+                table.clear_flag(FLAG_PENDING, (file_id,))
+                self.journal.forget(file)
+                continue
+            table.add_local(file, st.st_size, st.st_mtime)
+            to_send.append(file_id)
+        if not to_send:
+            return True
+        
+        try:
+            self.sync_progress.emit(f"Resuming {len(to_send)} pending files from the journal")
+            self.ssh_client.ensure_connected()
+            self._sync_files(to_send, local_path)
+            sent = sum(1 for file_id in to_send if table.has_flag(file_id, FLAG_SENT))
+            self.scheduler.record_cycle(sent)
+            self.sync_progress.emit(f"Resumed {sent} of {len(to_send)} pending files")
+            return True
+        except TransferCancelled:
+            return True
+        except Exception as e:
+            logger.error(f"Failed to resume pending uploads: {str(e)}")
+            self.sync_progress.emit(f"Resume failed, running a full sync: {str(e)}")
+            return False
+    
+    def _stamp_upload(self, file):
+        """Start or extend the window in which remote events for `file` are our own.
+        
+        Called as each file's transfer starts, since the server's watcher can
+        report it before the upload returns, and again once it completed.
+        """
+        self._recent_uploads[file.lower()] = time.time()
+    
+    def _expire_echoes(self):
+        """Forget uploads and downloads too old to still cause watcher events"""
+        now = time.time()
+        for key, stamped in list(self._recent_uploads.items()):
+            if now - stamped >= UPLOAD_ECHO_WINDOW:
+                self._recent_uploads.pop(key, None)
+        for key, written in list(self._recent_downloads.items()):
+            if written is not None and now - written[2] >= DOWNLOAD_ECHO_WINDOW:
+                self._recent_downloads.pop(key, None)
+    
+    def _mark_sent(self, file_id):
+        """Record a completed upload in the table, the echo filter and the journal"""
+        table = self.path_table
+        file = table.path(file_id)
+        table.set_flag(file_id, FLAG_SENT | FLAG_REMOTE)
+        table.clear_flag(FLAG_PENDING, (file_id,))
+        self._stamp_upload(file)
+        self.sync_stats.record_sent(table.sizes[file_id])
+        if self.journal:
+            self.journal.record_done(file, table.sizes[file_id], table.mtimes[file_id])
     
     def sync_now(self):
-        """Perform immediate synchronization"""
+        """Perform immediate synchronization, returning the number of files sent"""
+        started = time.monotonic()
+        bytes_before = self.sync_stats.bytes_sent
+        self._listed_at = self._transferring_at = None
+        self.busy = True
+        count = 0
+        try:
+            count = self._sync_cycle()
+            return count
+        finally:
+            self.busy = False
+            self.sync_stats.record_cycle(started, self._listed_at, self._transferring_at,
+                                         bytes_before, count)
+    
+    def _sync_cycle(self):
+        """One comparison and transfer cycle, returning the number of files sent"""
         try:
             sync_settings = self.config.get_sync_settings()
             local_path = Path(sync_settings['local_path'])
+            count = self._stream_sync(local_path) if self._should_stream() else None
+            if count is not None:
+                if not self.running:
+                    self.sync_complete.emit(False, "Sync cancelled")
+                    return 0
+                if count:
+                    self._unsnapshotted.add(None)
+                self._take_snapshots(sync_settings)
+                self.sync_complete.emit(True, f"Sync completed successfully. Sent {count} files."
+                                        if count else "No new files to sync")
+                return count
             
-            self.sync_progress.emit("Connecting to SSH...")
-            if not self.ssh_client.is_connected():
-                self.ssh_client.connect()
-            
-            self.sync_progress.emit("Getting file lists...")
-            local_files = self._get_local_files(local_path)
-            remote_files = self.fetch_remote_filelist()
+            to_send = self.compare()
+            replicas = self.compare_targets() if self.targets else {}
+            self._listed_at = self._transferring_at = time.monotonic()
             
-            self.files_updated.emit(local_files, list(remote_files))
-            
-            self.sync_progress.emit("Comparing files...")
-            to_send = []
-            for file in local_files:
-                file_lower = file.lower()
-                if file_lower not in remote_files:
-                    self.sync_progress.emit(f"Ready to send: {file}")
-                    to_send.append(file)
-                else:
-                    logger.debug(f"Skipping: {file} already exists on server")
-            
-            if to_send:
-                self.sync_progress.emit(f"{len(to_send)} files will be sent: {', '.join(to_send)}")
+            if to_send or replicas:
+                count = len(set(to_send).union(*replicas.values()))
+                self.sync_progress.emit(f"{count} files will be sent")
                 self.sync_progress.emit("Transferring files...")
-                self._sync_files(to_send, local_path)
-                self.sync_complete.emit(True, f"Sync completed successfully. Sent {len(to_send)} files.")
-            else:
-                logger.debug("No new files to send")
-                self.sync_complete.emit(True, "No new files to sync")
+                self._sync_files(to_send, local_path, replicas)
+                if not self.running:
+                    self.sync_complete.emit(False, "Sync cancelled")
+                    return 0
+                if to_send:
+                    self._unsnapshotted.add(None)
+                self._unsnapshotted.update(replicas)
+                self._take_snapshots(sync_settings)
+                self.sync_complete.emit(True, f"Sync completed successfully. Sent {count} files.")
+                return count
             
+            logger.debug("No new files to send")
+            self._take_snapshots(sync_settings)
+            self.sync_complete.emit(True, "No new files to sync")
+            return 0
+            
+        except TransferCancelled:
+            self.sync_complete.emit(False, "Sync cancelled")
+            return 0
         except Exception as e:
             logger.error(f"Sync failed: {str(e)}")
             self.sync_complete.emit(False, f"Sync failed: {str(e)}")
+            return 0
     
-    def _get_local_files(self, path):
-        """Get list of local files"""
-        files = []
-        for root, _, filenames in os.walk(path):
-            for filename in filenames:
-                full_path = Path(root) / filename
-                rel_path = str(full_path.relative_to(path))
-                files.append(rel_path)
-        return files
+    def _should_stream(self):
+        """Check whether this cycle should use the streaming comparison.
+        
+        The first cycle of a worker, where most transferring happens, streams
+        so uploads start while the trees are still being listed. Later cycles
+        prefer tree digests, which move less data when little has changed.
+        Targets need the full comparison before fan-out, so they never stream.
+        """
+        if not self.streaming_compare or self.targets:
+            return False
+        return not (self.tree_digests and self._streamed)
     
-    def fetch_remote_filelist(self):
-        """Get list of remote files using temporary file approach"""
+    def _stream_sync(self, local_path):
+        """Merge-join the sorted local scan with the streamed remote manifest, uploading as it goes.
+        
+        A listing thread queues each file that is missing remotely, or whose
+        local copy is newer and differs in size, as soon as the join reaches
+        it; this thread uploads them in batches meanwhile. Returns the number
+        of files to send, or None if the server cannot send a sorted manifest.
+        """
+        table = self.path_table
+        remote_path = self.config.get_ssh_settings()['remote_path']
+        compress = self.config.get_sync_settings().get('compress_listings', True)
+        cipher = cipher_for(self.config)
+        content_size = cipher.encrypted_size if cipher else (lambda size: size)
+        decisions = queue.Queue(STREAM_QUEUE)
+        abort = threading.Event()  # Set when the uploads fail, so the listing stops too
+        
+        self.sync_progress.emit("Connecting to SSH...")
+        self.ssh_client.ensure_connected()
+        self.ssh_client.clear_stat_cache()
+        table.clear_flag(FLAG_LOCAL | FLAG_REMOTE)
+        
+        def _check():
+            self.cancel_token.check()
+            if abort.is_set():
+                raise TransferCancelled()
+        
+        def _put(item):
+            while True:
+                _check()
+                try:
+                    decisions.put(item, timeout=STREAM_POLL)
+                    return
+                except queue.Full:
+                    continue
+        
+        def _pair(local, remote):
+            # Checked per entry too, so stop() ends the listing even when nothing is queued
+            _check()
+            if remote:
+                table.add_remote(*remote)
+            if local:
+                file_id = table.add_local(*local)
+                if remote is None or (content_size(local[1]) != remote[1]
+                                      and local[2] > remote[2] + MTIME_SLACK):
+                    _put(file_id)
+        
+        def _list():
+            try:
+                join = MergeJoin(scan_sorted(local_path), _pair)
+                fetch_manifest(self.engine, remote_path, join.push, compress, require_sorted=True,
+                               cancel_token=self.cancel_token)
+                join.finish()
+                self._listed_at = time.monotonic()
+            finally:
+                try:
+                    _put(None)
+                except TransferCancelled:
+                    pass
+        
+        count = 0
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix='GOSyncCompare') as pool:
+            listing = pool.submit(_list)
+            self.sync_progress.emit("Comparing and transferring files...")
+            done = False
+            try:
+                while not done and self.running:
+                    try:
+                        batch = [decisions.get(timeout=STREAM_POLL)]
+                    except queue.Empty:
+                        continue
+                    while batch[-1] is not None and len(batch) < STREAM_BATCH:
+                        try:
+                            batch.append(decisions.get_nowait())
+                        except queue.Empty:
+                            break
+                    if batch[-1] is None:
+                        batch.pop()
+                        done = True
+                    if batch:
+                        if self._transferring_at is None:
+                            self._transferring_at = time.monotonic()
+                        count += len(batch)
+                        self.sync_progress.emit(f"{count} files will be sent")
+                        self._sync_files(batch, local_path)
+            finally:
+                abort.set()
         try:
-            ssh_settings = self.config.get_ssh_settings()
-            remote_path = ssh_settings['remote_path']
-            
-            # Create temporary file on remote server
-            remote_txt = os.path.join(remote_path, "filelist.txt").replace("\\", "/")
-            self.ssh_client.client.exec_command(
-                f'find "{remote_path}" -type f -printf "%P\\n" > "{remote_txt}"'
-            )
-            
-            # Wait for file creation
-            time.sleep(1)
-            
-            # Download and read the file
-            local_txt = tempfile.mktemp(suffix=".txt")
+            listing.result()
+        except UnsortedManifest as e:
+            logger.info(f"Streaming comparison unavailable, comparing in full: {str(e)}")
+            self.streaming_compare = False
+            return None
+        
+        local_ids = table.ids_with_flag(FLAG_LOCAL)
+        self.files_updated.emit(table, local_ids, table.ids_with_flag(FLAG_REMOTE))
+        if self.journal:
+            self._reconcile_journal(local_ids)
+        self._streamed = True
+        return count
+    
+    def _take_snapshots(self, sync_settings):
+        """Snapshot each changed remote whose last snapshot is at least snapshot_interval old.
+
+        Changes sent sooner wait in _unsnapshotted for a later cycle, so a
+        busy folder gets one snapshot per interval instead of one per
+        cycle, and snapshot_keep covers a useful span of history.
+        """
+        if not snapshots_enabled(self.config):
+            self._unsnapshotted.clear()
+            return
+        interval = sync_settings.get('snapshot_interval', DEFAULT_INTERVAL)
+        for target in list(self._unsnapshotted):
+            last = self._snapshot_at.get(target)
+            if last is not None and time.monotonic() - last < interval:
+                continue
+            self._snapshot_at[target] = time.monotonic()
+            if self._create_snapshot(sync_settings, target):
+                self._unsnapshotted.discard(target)
+    
+    def _create_snapshot(self, sync_settings, target=None):
+        """Record the remote tree of the primary or a target as a new hard-linked snapshot"""
+        try:
+            self.sync_progress.emit("Creating remote snapshot...")
+            if target:
+                engine, remote_path = target.engine, target.remote_base
+            else:
+                engine, remote_path = self.engine, self.config.get_ssh_settings()['remote_path']
+            name = create_snapshot(engine, remote_path,
+                                   keep=sync_settings.get('snapshot_keep', DEFAULT_KEEP))
+            self.sync_progress.emit(f"Created snapshot {name}" + (f" on {target.name}" if target else ""))
+            return True
+        except Exception as e:
+            logger.error(f"Failed to create snapshot: {str(e)}")
+            self.sync_progress.emit(f"Error creating snapshot: {str(e)}")
+            return False
+    
+    def _scan_local_files(self, path):
+        """Record local files with their size and mtime in the path table"""
+        table = self.path_table
+        stack = [(str(path), '')]
+        while stack:
+            directory, prefix = stack.pop()
             try:
-                with SCPClient(self.ssh_client.client.get_transport()) as scp:
-                    scp.get(remote_txt, local_txt)
-                
-                with open(local_txt, "r", encoding="utf-8") as f:
-                    remote_files = set(line.strip().lower() for line in f if line.strip())
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        rel_path = prefix + entry.name
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append((entry.path, rel_path + '/'))
+                        elif entry.is_file():
+                            st = entry.stat()
+                            table.add_local(rel_path, st.st_size, st.st_mtime)
+            except OSError as e:
+                logger.error(f"Failed to scan {directory}: {str(e)}")
+    
+    def fetch_remote_filelist(self):
+        """Record the primary remote's files in the path table"""
+        remote_path = self.config.get_ssh_settings()['remote_path']
+        table = self.path_table
+        if self.tree_digests:
+            try:
+                # Needs the local scan first: only directories that differ are listed
+                compare_trees(self.ssh_client, remote_path, table, table.ids_with_flag(FLAG_LOCAL))
+                return
+            except TreeDigestUnavailable as e:
+                logger.info(f"Tree digests unavailable, using full listings: {str(e)}")
+                self.tree_digests = False
+            except TransferCancelled:
+                raise
+            except Exception as e:
+                logger.error(f"Tree digest comparison failed, using a full listing: {str(e)}")
+        self._read_remote_listing(self.engine, remote_path, table.add_remote)
+    
+    def compare_targets(self):
+        """List every additional target and return {target: IDs of local files it lacks}"""
+        table = self.path_table
+        local_ids = table.ids_with_flag(FLAG_LOCAL)
+        missing = {}
+        for target in self.targets:
+            try:
+                self.sync_progress.emit(f"Getting file list from {target.name}...")
+                target.ssh_client.ensure_connected()
+                present = set()
                 
-                return remote_files
-            finally:
-                if os.path.exists(local_txt):
-                    os.remove(local_txt)
-                # Clean up remote file
-                self.ssh_client.client.exec_command(f'rm -f "{remote_txt}"')
+                def _present(rel_path, size, mtime):
+                    file_id = table.lookup(rel_path)
+                    if file_id is not None:
+                        present.add(file_id)
                 
+                self._read_remote_listing(target.engine, target.remote_base, _present)
+                target.present = present
+                ids = difference(local_ids, sorted_ids(present))
+                if ids:
+                    missing[target] = ids
+            except Exception as e:
+                # One unreachable target must not hold up the others
+                logger.error(f"Failed to list target {target.name}: {str(e)}")
+                self.sync_progress.emit(f"Skipping target {target.name}: {str(e)}")
+        return missing
+    
+    def _read_remote_listing(self, engine, remote_path, consume):
+        """Stream every file under a remote root to `consume(rel_path, size, mtime)`"""
+        try:
+            compress = self.config.get_sync_settings().get('compress_listings', True)
+            count = fetch_manifest(engine, remote_path, consume, compress, cancel_token=self.cancel_token)
+            logger.debug(f"Remote listing of {remote_path}: {count} files")
         except Exception as e:
             logger.error(f"Failed to fetch remote file list: {str(e)}")
             raise
     
-    def _sync_files(self, to_send, local_path):
-        """Synchronize files between local and remote"""
-        ssh_settings = self.config.get_ssh_settings()
-        remote_base = ssh_settings['remote_path']
+    def build_sync_plan(self, to_send):
+        """Measure the round-trip time and choose how to transfer the given file IDs"""
+        sync_settings = self.config.get_sync_settings()
+        remote_base = self.config.get_ssh_settings()['remote_path'].replace("\\", "/")
+        try:
+            started = time.monotonic()
+            self.ssh_client.session_call(lambda session: session.call(':'))
+            self.cost_model.observe_rtt(time.monotonic() - started)
+        except Exception as e:
+            logger.error(f"Failed to measure round-trip time: {str(e)}")
         
-        for file in to_send:
-            if not self.running:
-                break
-                
-            try:
-                local_file = local_path / file
-                remote_dir = os.path.dirname(os.path.join(remote_base, file)).replace("\\", "/")
-                
-                # Ensure remote directory exists
-                self.ssh_client.client.exec_command(f'mkdir -p "{remote_dir}"')
-                
-                # Upload file
-                self.sync_progress.emit(f"Uploading {file}")
-                with SCPClient(self.ssh_client.client.get_transport()) as scp:
-                    scp.put(str(local_file), os.path.join(remote_base, file).replace("\\", "/"))
-                
-                self.sent_files.add(file.lower())
-                logger.info(f"Uploaded {file}")
+        cipher = cipher_for(self.config)
+        return build_plan(
+            self.path_table, to_send, remote_base, self.cost_model,
+            content_size=cipher.encrypted_size if cipher else None,
+            bundling=sync_settings.get('bundle_uploads', True),
+            max_parallel=sync_settings.get('upload_channels', MAX_PARALLEL)
+        )
+    
+    def _sync_files(self, to_send, local_path, replicas=None):
+        """Upload files to the primary remote according to a sync plan, and to targets by fan-out.
+        
+        `replicas` maps additional targets to the file IDs they lack. Those
+        files are read once and streamed to every remote that needs them;
+        files only the primary lacks go through the plan as usual.
+        """
+        remote_base = self.config.get_ssh_settings()['remote_path'].replace("\\", "/")
+        verify = self.config.get_sync_settings().get('verify_integrity', False)
+        replicas = replicas or {}
+        fanout_ids = sorted_ids(file_id for ids in replicas.values() for file_id in ids)
+        fanout_set = set(fanout_ids)
+        planned = [file_id for file_id in to_send if file_id not in fanout_set]
+        
+        expected = {}  # Remote path -> (file ID, local digest) awaiting verification
+        retries = {}
+        retry_ids = []
+        
+        def _record(results):
+            nonlocal expected
+            for file_id, uploaded in results:
+                if uploaded:
+                    remote_file, digest = uploaded
+                    expected[remote_file] = (file_id, digest)
+                # Verify in bulk; mismatches are re-sent at the end
+                if len(expected) >= VERIFY_BATCH and self.running:
+                    retry_ids.extend(self._verify_uploads(expected, retries))
+                    expected = {}
+        
+        if planned:
+            plan = self.build_sync_plan(planned)
+            logger.info(f"Sync plan: {plan.summary()}")
+            self.sync_progress.emit(f"Plan: {plan.summary()}")
+            
+            for op in plan.ops:
+                if not self.running:
+                    break
+                if op.kind == OP_MKDIR:
+                    self._make_remote_dirs(op.paths)
+                    continue
                 
-            except Exception as e:
-                logger.error(f"Failed to upload {file}: {str(e)}")
-                self.sync_progress.emit(f"Error uploading {file}: {str(e)}")
+                started = time.monotonic()
+                if op.kind == OP_BUNDLE:
+                    results = self._upload_bundle(op.file_ids, local_path, remote_base, verify)
+                    round_trips = BUNDLE_ROUND_TRIPS
+                else:
+                    results = self._upload_files(op.file_ids, local_path, remote_base, verify,
+                                                 plan.parallelism)
+                    round_trips = UPLOAD_ROUND_TRIPS * len(op.file_ids) / plan.parallelism
+                _record(results)
+                self.cost_model.observe_transfer(op.bytes, time.monotonic() - started, round_trips)
+        
+        if fanout_ids and self.running:
+            _record(self._fan_out(fanout_ids, set(to_send), replicas, local_path, remote_base, verify))
+        
+        while self.running and (expected or retry_ids):
+            if expected:
+                retry_ids.extend(self._verify_uploads(expected, retries))
+                expected = {}
+            batch, retry_ids = retry_ids, []
+            for file_id, uploaded in self._upload_files(batch, local_path, remote_base, verify, 1):
+                if uploaded:
+                    remote_file, digest = uploaded
+                    expected[remote_file] = (file_id, digest)
+    
+    def _fan_out(self, file_ids, primary_ids, replicas, local_path, remote_base, verify):
+        """Read each file once and stream it to the primary and every target lacking it.
+        
+        Yields (file ID, result) for the primary like _upload_files. Target
+        copies are verified at the end; failed ones are retried next cycle.
+        """
+        table = self.path_table
+        wanted = {target: set(ids) for target, ids in replicas.items()}
+        
+        def _dirs(base, ids):
+            return sorted({posixpath.dirname(posixpath.join(base, table.path(file_id))) for file_id in ids})
+        
+        primary_dirs = _dirs(remote_base, [file_id for file_id in file_ids if file_id in primary_ids])
+        if primary_dirs:
+            self._make_remote_dirs(primary_dirs)
+        for target, ids in wanted.items():
+            self._make_remote_dirs(_dirs(target.remote_base, ids), target.ssh_client)
+        
+        done = {target: 0 for target in wanted}
+        target_expected = {target: {} for target in wanted}
+        cipher = cipher_for(self.config)
+        fanout = Fanout(len(wanted) + 1)
+        try:
+            for file_id in file_ids:
+                if not self.running:
+                    break
+                targets = [target for target, ids in wanted.items() if file_id in ids]
+                yield file_id, self._fan_out_file(fanout, file_id, file_id in primary_ids, targets,
+                                                  local_path, remote_base, cipher, verify,
+                                                  target_expected)
+                for target in targets:
+                    done[target] += 1
+                    self.target_progress.emit(target.name, done[target], len(wanted[target]))
+        finally:
+            fanout.close()
+        
+        for target, expected in target_expected.items():
+            if expected and self.running:
+                self._verify_target(target, expected)
+    
+    def _fan_out_file(self, fanout, file_id, to_primary, targets, local_path, remote_base, cipher,
+                      verify, target_expected):
+        """Stream one file to several remotes, returning the primary's result"""
+        table = self.path_table
+        file = table.path(file_id)
+        destinations = {}  # Name -> (SSH client, config, remote path)
+        if to_primary:
+            destinations[PRIMARY_NAME] = (self.ssh_client, self.config, posixpath.join(remote_base, file))
+        for target in targets:
+            destinations[target.name] = (target.ssh_client, target.config,
+                                         posixpath.join(target.remote_base, file))
+        
+        try:
+            size, mode, _, produce = content_source(local_path / file, cipher)
+        except OSError as e:
+            logger.error(f"Failed to read {file}: {str(e)}")
+            return None
+        hasher = hashlib.sha256() if verify else None
+        if hasher:
+            produce = _hashed(produce, hasher)
+        
+        def _sender(ssh_client, config, remote_file):
+            def _send(lane_produce):
+                # Queued chunks cannot be replayed, so there is no reconnect-and-retry here
+                ssh_client.ensure_connected()
+                stream_versioned(ssh_client, ssh_client.client.get_transport(), remote_file,
+                                 size, mode, lane_produce, config, label=file)
+            return _send
+        
+        self.sync_progress.emit(f"Uploading {file} to {', '.join(destinations)}")
+        self._stamp_upload(file)
+        try:
+            errors = fanout.send(produce, {name: _sender(*destination)
+                                           for name, destination in destinations.items()},
+                                 self.cancel_token.progress())
+        except TransferCancelled:
+            logger.info(f"Cancelled upload of {file}")
+            for ssh_client, config, remote_file in destinations.values():
+                self._discard_partial(remote_file, ssh_client, config)
+            return None
+        except Exception as e:
+            logger.error(f"Failed to upload {file}: {str(e)}")
+            self.sync_progress.emit(f"Error uploading {file}: {str(e)}")
+            errors = {name: e for name in destinations}
+        
+        for name, error in errors.items():
+            if error is not None:
+                ssh_client, config, remote_file = destinations[name]
+                logger.error(f"Failed to upload {file} to {name}: {str(error)}")
+                self.sync_progress.emit(f"Error uploading {file} to {name}: {str(error)}")
+                self._discard_partial(remote_file, ssh_client, config)
+        
+        digest = hasher.hexdigest() if hasher else None
+        for target in targets:
+            if errors[target.name] is None:
+                target.present.add(file_id)
+                target.files_sent += 1
+                target.bytes_sent += size
+                if verify:
+                    target_expected[target][destinations[target.name][2]] = (file_id, digest)
+            else:
+                target.failures += 1
+        
+        if not to_primary or errors[PRIMARY_NAME] is not None:
+            return None
+        self._mark_sent(file_id)
+        logger.info(f"Uploaded {file} to {len(destinations)} remotes")
+        if verify:
+            return destinations[PRIMARY_NAME][2], digest
+        return None
+    
+    def _verify_target(self, target, expected):
+        """Check uploads to a target and remove mismatched copies so the next cycle re-sends them"""
+        self.sync_progress.emit(f"Verifying {len(expected)} files on {target.name}...")
+        try:
+            digests = {path: digest for path, (_, digest) in expected.items()}
+            mismatched = verify_batch(target.ssh_client, digests)
+        except Exception as e:
+            logger.error(f"Integrity verification on {target.name} failed: {str(e)}")
+            return
+        for remote_file in mismatched:
+            target.present.discard(expected[remote_file][0])
+            target.failures += 1
+            self._remove_remote(remote_file, target.ssh_client)
+            self.sync_progress.emit(f"Error: {remote_file} failed verification on {target.name}")
+    
+    def _make_remote_dirs(self, remote_dirs, ssh_client=None):
+        """Create remote directories in one pipelined batch"""
+        try:
+            self.sync_progress.emit(f"Creating {len(remote_dirs)} remote directories...")
+            (ssh_client or self.ssh_client).session_call(
+                lambda session: session.run_many(f"mkdir -p -- {shlex.quote(d)}" for d in remote_dirs)
+            )
+        except Exception as e:
+            logger.error(f"Failed to create remote directories: {str(e)}")
+    
+    def _upload_files(self, file_ids, local_path, remote_base, verify, channels):
+        """Upload files one per channel, yielding (file ID, result) in order"""
+        def _upload(file_id):
+            if not self.running:
+                return file_id, None
+            return file_id, self._upload_file(file_id, local_path, remote_base, verify)
+        
+        if channels <= 1:
+            for file_id in file_ids:
+                yield _upload(file_id)
+            return
+        with ThreadPoolExecutor(max_workers=channels) as pool:
+            yield from pool.map(_upload, file_ids)
+    
+    def _upload_bundle(self, file_ids, local_path, remote_base, verify):
+        """Upload small files as one tar stream, falling back to single uploads"""
+        table = self.path_table
+        cipher = cipher_for(self.config)
+        hashers = {}
+        current = []  # Name of the entry being streamed
+        
+        def _progress(name, sent, size):
+            current[:] = [name]
+            self.cancel_token.check()
+        
+        def _entries():
+            for file_id in file_ids:
+                file = table.path(file_id)
+                size, mode, mtime, produce = content_source(local_path / file, cipher)
+                self._stamp_upload(file)
+                if verify:
+                    hashers[file_id] = hashlib.sha256()
+                    produce = _hashed(produce, hashers[file_id])
+                yield file, size, mode, mtime, produce
+        
+        try:
+            self.sync_progress.emit(f"Uploading {len(file_ids)} files in one bundle")
+            self.ssh_client.run(
+                lambda client: send_tar(client.get_transport(), remote_base, _entries(), _progress)
+            )
+        except TransferCancelled:
+            # Earlier entries are complete and show up in the next listing; tar writes in place
+            if current:
+                self._remove_remote(posixpath.join(remote_base, current[0]))
+            return []
+        except Exception as e:
+            logger.error(f"Bundle upload failed, sending files individually: {str(e)}")
+            return list(self._upload_files(file_ids, local_path, remote_base, verify, 1))
+        
+        results = []
+        for file_id in file_ids:
+            self._mark_sent(file_id)
+            uploaded = None
+            if verify:
+                uploaded = posixpath.join(remote_base, table.path(file_id)), hashers[file_id].hexdigest()
+            results.append((file_id, uploaded))
+        logger.info(f"Uploaded bundle of {len(file_ids)} files")
+        return results
+    
+    def _upload_file(self, file_id, local_path, remote_base, verify):
+        """Upload one file, returning (remote path, digest) when verifying"""
+        table = self.path_table
+        file = table.path(file_id)
+        try:
+            local_file = local_path / file
+            remote_file = os.path.join(remote_base, file).replace("\\", "/")
+            hashers = []
+            cipher = cipher_for(self.config)
+            
+            def _upload(client):
+                # Hash the bytes as they stream out instead of re-reading
+                hasher = hashlib.sha256() if verify else None
+                hashers[:] = [hasher]
+                send_versioned(self.ssh_client, client.get_transport(), local_file, remote_file,
+                               self.config, cipher=cipher, hasher=hasher,
+                               progress=self.cancel_token.progress())
+            
+            # Upload file, replayed after a reconnect if the session drops
+            self.sync_progress.emit(f"Uploading {file}")
+            self._stamp_upload(file)
+            self.ssh_client.run(_upload)
+            
+            self._mark_sent(file_id)
+            logger.info(f"Uploaded {file}")
+            if verify:
+                return remote_file, hashers[0].hexdigest()
+            
+        except TransferCancelled:
+            logger.info(f"Cancelled upload of {file}")
+            self._discard_partial(remote_file)
+        except Exception as e:
+            logger.error(f"Failed to upload {file}: {str(e)}")
+            self.sync_progress.emit(f"Error uploading {file}: {str(e)}")
+        return None
+    
+    def _discard_partial(self, remote_file, ssh_client=None, config=None):
+        """Remove what a cancelled or failed upload left behind so it is not taken as complete.
+        
+        In snapshot mode uploads only write the staging name and the live copy
+        is intact, so only the staging file goes; otherwise the file itself is partial.
+        """
+        if snapshots_enabled(config or self.config):
+            remote_file += STAGING_SUFFIX
+        self._remove_remote(remote_file, ssh_client)
+    
+    def _remove_remote(self, remote_file, ssh_client=None):
+        """Delete a remote file, logging rather than raising on failure"""
+        try:
+            (ssh_client or self.ssh_client).session_call(
+                lambda session: session.call(f"rm -f -- {shlex.quote(remote_file)}")
+            )
+        except Exception as e:
+            logger.error(f"Failed to remove {remote_file}: {str(e)}")
+    
+    def _verify_uploads(self, expected, retries):
+        """Check a batch of uploads remotely and return the file IDs to retry"""
+        table = self.path_table
+        self.sync_progress.emit(f"Verifying {len(expected)} uploaded files...")
+        try:
+            digests = {path: digest for path, (_, digest) in expected.items()}
+            mismatched = verify_batch(self.ssh_client, digests)
+        except Exception as e:
+            logger.error(f"Integrity verification failed: {str(e)}")
+            return []
+        
+        retry_ids = []
+        for remote_file in mismatched:
+            file_id = expected[remote_file][0]
+            table.clear_flag(FLAG_SENT | FLAG_REMOTE, (file_id,))
+            retries[file_id] = retries.get(file_id, 0) + 1
+            if retries[file_id] <= MAX_RETRIES:
+                self.sync_progress.emit(f"Checksum mismatch, retrying {table.path(file_id)}")
+                retry_ids.append(file_id)
+            else:
+                # Remove the bad copy so the next comparison sees it missing, and leave it pending
+                self._remove_remote(remote_file)
+                table.set_flag(file_id, FLAG_PENDING)
+                if self.journal:
+                    self.journal.record_pending(table.path(file_id), table.sizes[file_id],
+                                                table.mtimes[file_id])
+                self.sync_progress.emit(f"Error: {table.path(file_id)} failed verification")
+        return retry_ids
+
+class ListingWorker(SyncWorker):
+    """Refreshes the local and remote listings without transferring anything"""
+    
+    def run(self):
+        """Scan both sides once and emit files_updated"""
+        self.running = not self.cancel_token.cancelled
+        try:
+            self.compare()
+            self.sync_progress.emit("File lists refreshed")
+        except Exception as e:
+            logger.error(f"Listing refresh failed: {str(e)}")
+            self.sync_progress.emit(f"Listing refresh failed: {str(e)}")
+        finally:
+            self.engine.shutdown()
+            self.ssh_client.disconnect()
 
 class SyncManager(QObject):
+    files_updated = Signal(object, object, object)  # PathTable, local IDs, remote IDs
+    listing_changed = Signal(str, list, list)  # 'local' or 'remote', added paths, removed paths
+    target_progress = Signal(str, int, int)  # Target name, files sent, files to send
+    uploads_finished = Signal(list, list)  # Requested paths uploaded, paths that failed
+    worker_class = SyncWorker  # Replaced by the trace replay harness
+    
     def __init__(self, config):
         super().__init__()
         self.config = config
         self.watcher = None
         self.sync_worker = None
-        self.pending_files = set()  # Track files pending upload
+        self.listing_worker = None
+        self.remote_watcher = None
+        self.trace_recorder = None
+        self._stopping = set()  # Threads asked to stop that have not exited yet
+        self._finishing = None  # One-shot worker that continuous sync is waiting for
+        self.paused = False  # Scheduled and watcher-triggered syncs are held
+        self.sync_stats = SyncStats()  # Totals across workers, for status reports
+        self.path_table = PathTable()  # Shared file table, pending files carry FLAG_PENDING
+        self.journal = self._open_journal()
+        self._resume_journal = bool(self.journal and self.journal.resumable)
+    
+    def _open_journal(self):
+        """Open the pending-upload journal and restore the files it left pending"""
+        if not self.config.get_sync_settings().get('journal', True):
+            return None
+        try:
+            journal = SyncJournal(os.path.join(self.config.config_dir, JOURNAL_FILE))
+        except Exception as e:
+            logger.error(f"Failed to open sync journal: {str(e)}")
+            return None
+        for rel_path in journal.pending():
+            self.path_table.set_flag(self.path_table.intern(rel_path), FLAG_PENDING)
+        return journal
         
     def start_sync(self):
         """Start automatic synchronization"""
@@ -178,51 +1090,328 @@ class SyncManager(QObject):
             self.watcher.directoryChanged.connect(self._on_directory_changed)
             self.watcher.fileChanged.connect(self._on_file_changed)
         
+        # Optionally record watcher events for offline replay
+        trace_path = sync_settings.get('event_trace')
+        if trace_path and not self.trace_recorder:
+            try:
+                self.trace_recorder = TraceRecorder(trace_path, local_path)
+            except Exception as e:
+                logger.error(f"Failed to start event trace: {str(e)}")
+        
         # Add local path and its subdirectories to watcher
         self._add_watch_paths(local_path)
         
+        # A one-shot worker (manual sync or requested uploads) skips the schedule and the
+        # journal resume and exits by itself; continuous sync starts once it has finished
+        worker = self.sync_worker
+        if worker and not worker.auto_sync and worker.isRunning():
+            self._finishing = worker
+            self.sync_worker = None
+        
         # Start sync worker
         if not self.sync_worker:
-            self.sync_worker = SyncWorker(self.config)
-            self.sync_worker.sync_complete.connect(self._on_sync_complete)
-            self.sync_worker.sync_progress.connect(self._on_sync_progress)
+            self.sync_worker = self._create_worker()
+            # Only the first continuous worker after startup resumes from the journal
+            self.sync_worker.resume_journal = self._resume_journal
+            self._resume_journal = False
         
         # Enable continuous sync
         self.sync_worker.auto_sync = True
-        self.sync_worker.start()
+        if self._finishing is None:
+            self.sync_worker.start()
+        
+        # Optionally stream remote changes for immediate downloads
+        if sync_settings.get('remote_watch') and not self.remote_watcher:
+            self.remote_watcher = RemoteWatcher(self.config)
+            self.remote_watcher.remote_changed.connect(self._on_remote_changed)
+            self.remote_watcher.watch_status.connect(self._on_sync_progress)
+            self.remote_watcher.start()
+        
+        state = self.sync_worker.scheduler.state()
+        logger.info(
+            f"Continuous sync started (adaptive interval "
+            f"{state['min_interval']:g}-{state['max_interval']:g}s)"
+        )
+    
+    def _create_worker(self):
+        """Create a sync worker wired to the manager's handlers and signals"""
+        worker = self.worker_class(self.config, self.path_table)
+        worker.journal = self.journal
+        worker.sync_stats = self.sync_stats
+        worker.paused = self.paused
+        worker.sync_complete.connect(self._on_sync_complete)
+        worker.sync_progress.connect(self._on_sync_progress)
+        worker.files_updated.connect(self.files_updated)
+        worker.target_progress.connect(self.target_progress)
+        worker.uploads_finished.connect(self.uploads_finished)
+        worker.finished.connect(self._on_worker_finished)
+        return worker
+    
+    def refresh_listing(self):
+        """Rescan both listings in the background; never starts transfers"""
+        if self.listing_worker and self.listing_worker.isRunning():
+            return
+        # A private table keeps the scan from disturbing a running sync
+        self.listing_worker = ListingWorker(self.config, PathTable())
+        self.listing_worker.sync_progress.connect(self._on_sync_progress)
+        self.listing_worker.files_updated.connect(self.files_updated)
+        self.listing_worker.start()
+    
+    def apply_transfer_results(self, items):
+        """Record finished manual transfers in the file table and emit what changed.
+        
+        The outcome of each transfer is known, so the listings are updated
+        in place instead of rescanning both sides.
+        """
+        local_base = Path(self.config.get_sync_settings()['local_path'])
+        remote_base = self.config.get_ssh_settings()['remote_path'].replace("\\", "/")
+        table = self.path_table
+        added = {'local': [], 'remote': []}
+        
+        for item in items:
+            if item.status != DONE:
+                continue
+            try:
+                if item.direction == 'upload':
+                    rel_path = posixpath.relpath(str(item.target), remote_base)
+                    if rel_path.startswith('..'):
+                        continue
+                    file_id = table.intern(rel_path)
+                    if not table.has_flag(file_id, FLAG_REMOTE):
+                        added['remote'].append(rel_path)
+                    table.add_remote(rel_path, item.total, time.time())
+                    table.set_flag(file_id, FLAG_SENT)
+                    st = Path(item.source).stat()
+                else:
+                    local_file = Path(item.target)
+                    rel_path = local_file.relative_to(local_base).as_posix()
+                    st = local_file.stat()
+                    file_id = table.intern(rel_path)
+                    if not table.has_flag(file_id, FLAG_LOCAL):
+                        added['local'].append(rel_path)
+                    table.add_local(rel_path, st.st_size, st.st_mtime)
+                    # Came from the server, so the watcher must not upload it back
+                    table.set_flag(file_id, FLAG_REMOTE | FLAG_SENT)
+                table.clear_flag(FLAG_PENDING, (file_id,))
+                if self.journal:
+                    self.journal.record_done(rel_path, st.st_size, st.st_mtime)
+            except (ValueError, OSError) as e:
+                logger.error(f"Failed to record transfer of {item.source}: {str(e)}")
         
-        logger.info("Continuous sync started with 10-second interval")
+        for side, paths in added.items():
+            if paths:
+                self.listing_changed.emit(side, paths, [])
+    
+    def _retire(self, thread):
+        """Ask a worker thread to stop and keep it referenced until it exits"""
+        thread.stop()
+        if thread.isRunning():
+            self._stopping.add(thread)
+            thread.finished.connect(lambda: self._stopping.discard(thread))
     
     def stop_sync(self):
-        """Stop automatic synchronization"""
+        """Stop automatic synchronization without blocking the caller"""
         if self.watcher:
             self.watcher.removePaths(self.watcher.directories())
             self.watcher.removePaths(self.watcher.files())
             self.watcher = None
         
+        if self.remote_watcher:
+            self._retire(self.remote_watcher)
+            self.remote_watcher = None
+        
+        if self.trace_recorder:
+            self.trace_recorder.close()
+            self.trace_recorder = None
+        
+        if self._finishing:
+            self._retire(self._finishing)
+            self._finishing = None
+        
         if self.sync_worker:
-            self.sync_worker.running = False
             self.sync_worker.auto_sync = False
-            self.sync_worker.wait()
+            self._retire(self.sync_worker)
             self.sync_worker = None
         
         logger.info("Sync stopped")
     
+    def shutdown(self, timeout_ms=2000):
+        """Stop everything and wait briefly for the threads to exit, for application quit"""
+        self.stop_sync()
+        if self.listing_worker:
+            self._retire(self.listing_worker)
+            self.listing_worker = None
+        deadline = time.monotonic() + timeout_ms / 1000.0
+        for thread in list(self._stopping):
+            remaining = int(max(0.0, deadline - time.monotonic()) * 1000)
+            if not thread.wait(remaining):
+                logger.warning(f"{type(thread).__name__} did not stop within {timeout_ms} ms")
+        if self.journal:
+            self.journal.close()
+    
     def sync_now(self):
         """Perform immediate synchronization"""
-        if self.sync_worker and self.sync_worker.isRunning():
+        if self._finishing is not None or (self.sync_worker and self.sync_worker.isRunning()):
             logger.info("Sync already running")
             return
             
-        self.sync_worker = SyncWorker(self.config)
-        self.sync_worker.sync_complete.connect(self._on_sync_complete)
-        self.sync_worker.sync_progress.connect(self._on_sync_progress)
+        self.sync_worker = self._create_worker()
         self.sync_worker.auto_sync = False
         self.sync_worker.start()
     
+    def _mark_pending(self, file_path, local_base):
+        """Flag a local file as pending upload unless it was already sent"""
+        try:
+            rel_path = Path(file_path).relative_to(local_base).as_posix()
+        except ValueError as e:
+            logger.error(f"Error converting path {file_path}: {str(e)}")
+            return False
+        
+        file_id = self.path_table.intern(rel_path)
+        if self.path_table.has_flag(file_id, FLAG_SENT):
+            return False
+        try:
+            st = os.stat(file_path)
+        except OSError:
+            return False
+        if self._is_download_echo(rel_path, st):
+            return False
+        if self.journal:
+            if self.journal.is_done(rel_path, st.st_size, st.st_mtime):
+                # Uploaded in an earlier session and unchanged since
+                self.path_table.set_flag(file_id, FLAG_SENT)
+                return False
+            if self.path_table.has_flag(file_id, FLAG_PENDING):
+                return True
+            self.journal.record_pending(rel_path, st.st_size, st.st_mtime)
+        self.path_table.set_flag(file_id, FLAG_PENDING)
+        return True
+    
+    def request_sync(self, paths):
+        """Upload local files or directories now, without a full comparison.
+        
+        Paths are absolute or relative to the sync folder. Requested uploads
+        run even while paused. Returns the relative paths queued.
+        """
+        local_base = Path(os.path.abspath(self.config.get_sync_settings()['local_path']))
+        rel_paths = []
+        for path in paths:
+            full = Path(os.path.abspath(local_base / path))
+            try:
+                rel = full.relative_to(local_base)
+            except ValueError:
+                raise ValueError(f"{path} is outside the sync folder")
+            if full.is_dir():
+                for root, dirs, files in os.walk(full):
+                    rel_paths.extend((Path(root) / name).relative_to(local_base).as_posix()
+                                     for name in files)
+            elif full.is_file():
+                rel_paths.append(rel.as_posix())
+            else:
+                raise FileNotFoundError(f"No such file: {path}")
+        
+        for rel_path in rel_paths:
+            file_id = self.path_table.intern(rel_path)
+            self.path_table.set_flag(file_id, FLAG_PENDING)
+            if self.journal:
+                try:
+                    st = (local_base / rel_path).stat()
+                    self.journal.record_pending(rel_path, st.st_size, st.st_mtime)
+                except OSError:
+                    pass
+        if rel_paths:
+            self._queue_uploads(rel_paths)
+        return rel_paths
+    
+    def flush(self):
+        """Upload every pending file now, returning the relative paths queued"""
+        table = self.path_table
+        pending = [table.path(file_id) for file_id in table.ids_with_flag(FLAG_PENDING)]
+        if pending:
+            self._queue_uploads(pending)
+        return pending
+    
+    def _queue_uploads(self, rel_paths):
+        """Hand requested uploads to the running worker, or start one just for them"""
+        if self.sync_worker and (self.sync_worker.isRunning() or self._finishing is not None):
+            self.sync_worker.request_upload(rel_paths)
+            return
+        self.sync_worker = self._create_worker()
+        self.sync_worker.auto_sync = False
+        # Not due, so the one-shot worker exits after the requested files
+        self.sync_worker.scheduler.postpone(self.sync_worker.scheduler.max_interval)
+        self.sync_worker.request_upload(rel_paths)
+        self.sync_worker.start()
+    
+    def _on_worker_finished(self):
+        """Pass on uploads requested after a worker's last check, and start deferred continuous sync"""
+        worker = self.sender()
+        requested = worker.take_requested() if isinstance(worker, SyncWorker) else []
+        if worker is self._finishing:
+            # Continuous sync was started while this one-shot worker ran
+            self._finishing = None
+            if self.sync_worker is not None:
+                self.sync_worker.request_upload(requested)
+                self.sync_worker.start()
+            return
+        if requested and self.sync_worker is not None:
+            self._queue_uploads(requested)
+    
+    def pause(self):
+        """Hold scheduled and watcher-triggered syncs; the cycle in progress finishes"""
+        self.paused = True
+        if self.sync_worker:
+            self.sync_worker.paused = True
+        logger.info("Sync paused")
+    
+    def resume(self):
+        """Undo pause() and catch up on files that changed meanwhile"""
+        self.paused = False
+        if self.sync_worker:
+            self.sync_worker.paused = False
+            self.sync_worker.scheduler.wake()
+        logger.info("Sync resumed")
+        self._sync_pending_files()
+    
+    def status(self):
+        """Snapshot of queue depth, throughput and the last cycle, for the control API"""
+        worker = self.sync_worker
+        running = bool(worker and worker.isRunning())
+        requested, downloads = worker.backlog() if running else (0, 0)
+        if self.paused:
+            state = 'paused'
+        elif running and worker.auto_sync:
+            state = 'running'
+        else:
+            state = 'stopped'
+        status = {
+            'state': state,
+            'busy': bool(running and worker.busy),
+            'queue': {
+                'pending': len(self.path_table.ids_with_flag(FLAG_PENDING)),
+                'requested': requested,
+                'downloads': downloads,
+            },
+            'link': {
+                'rtt': worker.cost_model.rtt,
+                'bandwidth': worker.cost_model.bandwidth,
+            } if worker else None,
+            'scheduler': self.get_scheduler_state(),
+        }
+        status.update(self.sync_stats.snapshot())
+        return status
+    
+    def get_scheduler_state(self):
+        """Return the adaptive scheduler state of the running worker"""
+        if self.sync_worker:
+            return self.sync_worker.scheduler.state()
+        return None
+    
     def _add_watch_paths(self, path):
         """Add directory and its subdirectories to watcher"""
         try:
+            local_base = Path(self.config.get_sync_settings()['local_path'])
+            
             # Add main directory
             self.watcher.addPath(str(path))
             logger.info(f"Watching directory: {path}")
@@ -241,8 +1430,7 @@ class SyncManager(QObject):
                     self.watcher.addPath(str(file_path))
                     logger.info(f"Watching file: {file_path}")
                     # Add to pending files if not already synced
-                    if not self.sync_worker or file_name.lower() not in self.sync_worker.sent_files:
-                        self.pending_files.add(str(file_path))
+                    self._mark_pending(file_path, local_base)
         except Exception as e:
             logger.error(f"Failed to add watch paths: {str(e)}")
     
@@ -251,24 +1439,26 @@ class SyncManager(QObject):
         try:
             path = Path(path)
             logger.info(f"Directory changed: {path}")
+            self._trace(TRACE_DIRECTORY, path, -1)
             
             # Get sync settings
             sync_settings = self.config.get_sync_settings()
             local_base = Path(sync_settings['local_path'])
             
             # Check for new files
+            found_pending = False
             for item in path.glob('*'):
                 if item.is_file():
-                    rel_path = item.relative_to(local_base)
-                    if not self.sync_worker or str(rel_path).lower() not in self.sync_worker.sent_files:
-                        self.pending_files.add(str(item))
+                    if self._mark_pending(item, local_base):
+                        found_pending = True
+                        self._trace(TRACE_NEW_FILE, item)
                         logger.info(f"New file detected: {item}")
                 elif item.is_dir():
                     # Add new directory to watcher
                     self._add_watch_paths(item)
             
             # Trigger sync if there are pending files
-            if self.pending_files:
+            if found_pending:
                 self._sync_pending_files()
             
         except Exception as e:
@@ -279,41 +1469,70 @@ class SyncManager(QObject):
         try:
             path = Path(path)
             logger.info(f"File changed: {path}")
+            self._trace(TRACE_FILE, path)
             
+            local_base = Path(self.config.get_sync_settings()['local_path'])
+            rel_path = path.relative_to(local_base).as_posix()
             if path.exists():  # File was modified
-                self.pending_files.add(str(path))
+                st = path.stat()
+                if self._is_download_echo(rel_path, st):
+                    return
+                file_id = self.path_table.intern(rel_path)
+                self.path_table.clear_flag(FLAG_SENT, (file_id,))
+                self.path_table.set_flag(file_id, FLAG_PENDING)
+                if self.journal:
+                    self.journal.record_pending(rel_path, st.st_size, st.st_mtime)
                 self._sync_pending_files()
+            elif self.journal:
+                self.journal.forget(rel_path)
             
         except Exception as e:
             logger.error(f"Error handling file change: {str(e)}")
     
+    def _is_download_echo(self, rel_path, st):
+        """Check whether a local change was written by the worker's own targeted download"""
+        worker = self.sync_worker
+        return worker is not None and worker.auto_sync and worker.is_download_echo(rel_path, st)
+    
+    def _trace(self, kind, path, size=None):
+        """Record a watcher event when tracing is enabled"""
+        if self.trace_recorder:
+            self.trace_recorder.record(kind, path, size)
+    
+    def _on_remote_changed(self, kind, rel_path):
+        """Handle a change event streamed from the server"""
+        if kind == 'deleted':
+            file_id = self.path_table.lookup(rel_path)
+            if file_id is not None:
+                self.path_table.clear_flag(FLAG_REMOTE | FLAG_SENT, (file_id,))
+                self.listing_changed.emit('remote', [], [rel_path])
+            return
+        
+        logger.info(f"Remote change detected: {rel_path}")
+        if self.sync_worker and self.sync_worker.isRunning() and self.sync_worker.auto_sync:
+            self.sync_worker.request_download(rel_path)
+    
     def _sync_pending_files(self):
         """Sync pending files to remote server"""
-        if not self.sync_worker or not self.sync_worker.isRunning():
-            sync_settings = self.config.get_sync_settings()
-            local_base = Path(sync_settings['local_path'])
-            
-            # Convert absolute paths to relative paths
-            relative_paths = []
-            for file_path in self.pending_files:
-                try:
-                    rel_path = str(Path(file_path).relative_to(local_base))
-                    relative_paths.append(rel_path)
-                except Exception as e:
-                    logger.error(f"Error converting path {file_path}: {str(e)}")
-            
-            if relative_paths:
-                logger.info(f"Syncing pending files: {relative_paths}")
-                self.sync_worker = SyncWorker(self.config)
-                self.sync_worker.sync_complete.connect(self._on_sync_complete)
-                self.sync_worker.sync_progress.connect(self._on_sync_progress)
-                self.sync_worker.auto_sync = False
-                self.sync_worker.start()
+        if self.paused:
+            return
+        if self.sync_worker and self.sync_worker.isRunning():
+            # Continuous worker picks the files up on its next, immediate cycle
+            if self.sync_worker.auto_sync:
+                self.sync_worker.scheduler.notify_activity()
+            return
+        
+        pending_ids = self.path_table.ids_with_flag(FLAG_PENDING)
+        if pending_ids:
+            logger.info(f"Syncing {len(pending_ids)} pending files")
+            self.sync_worker = self._create_worker()
+            self.sync_worker.auto_sync = False
+            self.sync_worker.start()
     
     def _on_sync_complete(self, success, message):
         """Handle sync completion"""
         if success:
-            self.pending_files.clear()
+            self.path_table.clear_flag(FLAG_PENDING)
         logger.info(f"Sync complete: {message}")
     
     def _on_sync_progress(self, message):
@@ -0,0 +1,196 @@
+import logging
+import math
+import posixpath
+
+logger = logging.getLogger('GOSync')
+
+# Operation kinds
+OP_MKDIR = 'mkdir'  # Create remote directories, pipelined on the remote session
+OP_BUNDLE = 'bundle'  # Many small files in one tar stream over a single channel
+OP_UPLOAD = 'upload'  # One SCP upload per file, possibly on parallel channels
+
+DEFAULT_RTT = 0.05  # seconds, until measured
+DEFAULT_BANDWIDTH = 10 * 1024 * 1024  # bytes/s, until probed or measured
+UPLOAD_ROUND_TRIPS = 4  # exec, scp ready, header ack, final ack
+BUNDLE_ROUND_TRIPS = 2  # exec, exit status
+TAR_BLOCK = 512
+BUNDLE_MAX_FILES = 500
+BUNDLE_MAX_BYTES = 64 * 1024 * 1024
+MAX_PARALLEL = 4  # Concurrent upload channels
+MIN_SAMPLE_BYTES = 1024 * 1024  # Smaller transfers say nothing about bandwidth
+SMOOTHING = 0.3  # Weight of a new measurement in the running estimates
+
+
+class CostModel:
+    """Estimates transfer time from round-trip time and bandwidth.
+
+    Both are running averages of measurements taken during sync; bandwidth
+    starts from the transport probe result for the host when there is one.
+    """
+
+    def __init__(self, rtt=DEFAULT_RTT, bandwidth=DEFAULT_BANDWIDTH):
+        self.rtt = rtt
+        self.bandwidth = bandwidth
+
+    @classmethod
+    def from_config(cls, config):
+        """Seed the model from the stored transport probe for the configured host"""
+        hostname = config.get_ssh_settings().get('hostname')
+        best = config.get_transport_settings().get('hosts', {}).get(hostname) or {}
+        rate = best.get('mb_per_s')
+        if rate:
+            return cls(bandwidth=rate * 1024 * 1024)
+        return cls()
+
+    def observe_rtt(self, seconds):
+        """Fold in a measured round trip"""
+        self.rtt += SMOOTHING * (seconds - self.rtt)
+
+    def observe_transfer(self, size, seconds, round_trips=0):
+        """Fold in a measured transfer, discounting its protocol round trips"""
+        seconds -= round_trips * self.rtt
+        if size < MIN_SAMPLE_BYTES or seconds <= 0:
+            return
+        self.bandwidth += SMOOTHING * (size / seconds - self.bandwidth)
+
+    def upload_seconds(self, size):
+        """Time for one per-file upload"""
+        return UPLOAD_ROUND_TRIPS * self.rtt + size / self.bandwidth
+
+    def bundle_seconds(self, sizes):
+        """Time for one tar bundle of the given file sizes"""
+        padded = sum(TAR_BLOCK + -(-size // TAR_BLOCK) * TAR_BLOCK for size in sizes)
+        return BUNDLE_ROUND_TRIPS * self.rtt + (padded + 2 * TAR_BLOCK) / self.bandwidth
+
+    def bundle_threshold(self):
+        """Size below which per-file round trips cost more than the data itself"""
+        return int(UPLOAD_ROUND_TRIPS * self.rtt * self.bandwidth)
+
+    def parallelism(self, sizes, limit=MAX_PARALLEL):
+        """Channels needed to keep the link busy while others wait on round trips"""
+        if not sizes:
+            return 1
+        latency = UPLOAD_ROUND_TRIPS * self.rtt
+        transfer = sum(sizes) / len(sizes) / self.bandwidth
+        wanted = math.ceil((latency + transfer) / transfer) if transfer > 0 else limit
+        return max(1, min(limit, len(sizes), wanted))
+
+    def parallel_seconds(self, sizes, channels):
+        """Time for per-file uploads spread over `channels` channels sharing the link"""
+        if not sizes:
+            return 0.0
+        latency = len(sizes) * UPLOAD_ROUND_TRIPS * self.rtt / channels
+        return max(latency, sum(sizes) / self.bandwidth) + UPLOAD_ROUND_TRIPS * self.rtt
+
+
+class PlanOp:
+    """One step of a SyncPlan"""
+    __slots__ = ('kind', 'file_ids', 'paths', 'bytes', 'seconds')
+
+    def __init__(self, kind, file_ids=(), paths=(), size=0, seconds=0.0):
+        self.kind = kind
+        self.file_ids = list(file_ids)
+        self.paths = list(paths)
+        self.bytes = size
+        self.seconds = seconds
+
+
+class SyncPlan:
+    """Ordered operations chosen for one sync cycle, with their estimated cost"""
+
+    def __init__(self, ops, parallelism, model):
+        self.ops = ops
+        self.parallelism = parallelism
+        self.rtt = model.rtt
+        self.bandwidth = model.bandwidth
+
+    @property
+    def total_bytes(self):
+        return sum(op.bytes for op in self.ops)
+
+    @property
+    def estimated_seconds(self):
+        return sum(op.seconds for op in self.ops)
+
+    def file_count(self):
+        return sum(len(op.file_ids) for op in self.ops)
+
+    def summary(self):
+        """One-line description for progress messages"""
+        bundles = [op for op in self.ops if op.kind == OP_BUNDLE]
+        uploads = sum(len(op.file_ids) for op in self.ops if op.kind == OP_UPLOAD)
+        return (f"{self.file_count()} files, {_format_bytes(self.total_bytes)}: "
+                f"{sum(len(op.file_ids) for op in bundles)} in {len(bundles)} bundles, "
+                f"{uploads} single uploads on {self.parallelism} channels, "
+                f"~{self.estimated_seconds:.1f}s")
+
+    def describe(self):
+        """Lines for --dry-run output"""
+        lines = [
+            f"RTT {self.rtt * 1000:.0f} ms, bandwidth {_format_bytes(self.bandwidth)}/s",
+            self.summary(),
+        ]
+        for op in self.ops:
+            if op.kind == OP_MKDIR:
+                lines.append(f"  mkdir   {len(op.paths)} directories (~{op.seconds:.2f}s)")
+                continue
+            lines.append(f"  {op.kind:<7} {len(op.file_ids)} files, {_format_bytes(op.bytes)} "
+                         f"(~{op.seconds:.2f}s)")
+            for path in op.paths:
+                lines.append(f"            {path}")
+        return lines
+
+
+def _format_bytes(size):
+    for unit in ('B', 'KiB', 'MiB', 'GiB'):
+        if size < 1024 or unit == 'GiB':
+            return f"{size:.0f} {unit}" if unit == 'B' else f"{size:.1f} {unit}"
+        size /= 1024.0
+
+
+def build_plan(table, file_ids, remote_base, model, content_size=None, bundling=True,
+               max_parallel=MAX_PARALLEL):
+    """Turn the files missing remotely into a SyncPlan.
+
+    Files small enough that round trips dominate are grouped into tar
+    bundles; the rest are uploaded one per channel with as many channels as
+    the model says keep the link busy. `content_size(size)` maps a local
+    size to the bytes actually sent (e.g. after encryption).
+    """
+    content_size = content_size or (lambda size: size)
+    sizes = {file_id: content_size(max(table.sizes[file_id], 0)) for file_id in file_ids}
+
+    remote_dirs = sorted({
+        posixpath.dirname(posixpath.join(remote_base, table.path(file_id))) for file_id in file_ids
+    })
+    ops = [PlanOp(OP_MKDIR, paths=remote_dirs, seconds=model.rtt)] if remote_dirs else []
+
+    threshold = model.bundle_threshold()
+    small = [file_id for file_id in file_ids if sizes[file_id] < threshold] if bundling else []
+    if len(small) < 2:
+        small = []
+    small_set = set(small)
+    large = [file_id for file_id in file_ids if file_id not in small_set]
+
+    batch, batch_bytes = [], 0
+    for file_id in small:
+        batch.append(file_id)
+        batch_bytes += sizes[file_id]
+        if len(batch) >= BUNDLE_MAX_FILES or batch_bytes >= BUNDLE_MAX_BYTES:
+            ops.append(_bundle_op(table, batch, sizes, model))
+            batch, batch_bytes = [], 0
+    if batch:
+        ops.append(_bundle_op(table, batch, sizes, model))
+
+    large_sizes = [sizes[file_id] for file_id in large]
+    parallelism = model.parallelism(large_sizes, max_parallel)
+    if large:
+        ops.append(PlanOp(OP_UPLOAD, large, [table.path(file_id) for file_id in large],
+                          sum(large_sizes), model.parallel_seconds(large_sizes, parallelism)))
+    return SyncPlan(ops, parallelism, model)
+
+
+def _bundle_op(table, file_ids, sizes, model):
+    batch_sizes = [sizes[file_id] for file_id in file_ids]
+    return PlanOp(OP_BUNDLE, file_ids, [table.path(file_id) for file_id in file_ids],
+                  sum(batch_sizes), model.bundle_seconds(batch_sizes))
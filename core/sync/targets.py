@@ -0,0 +1,59 @@
+import logging
+from core.ssh.async_engine import TransferEngine
+from core.ssh.ssh_client import SSHClient
+from core.sync.snapshots import SyncTransferHooks
+
+logger = logging.getLogger('GOSync')
+
+PRIMARY_NAME = 'primary'  # Name the `ssh` block's remote goes by in progress and logs
+
+
+class TargetConfig:
+    """ConfigManager view whose SSH settings point at one additional target"""
+
+    def __init__(self, config, ssh_settings):
+        self._config = config
+        self._ssh_settings = ssh_settings
+
+    def get_ssh_settings(self):
+        return self._ssh_settings
+
+    def __getattr__(self, name):
+        return getattr(self._config, name)
+
+
+class SyncTarget:
+    """A named remote that receives the same files as the primary one"""
+
+    def __init__(self, config, settings):
+        # Fields a target leaves out (port, key, reconnect attempts...) come from the primary
+        ssh_settings = dict(config.get_ssh_settings())
+        ssh_settings.update({key: value for key, value in settings.items() if value not in ('', None)})
+        self.name = settings.get('name') or ssh_settings['hostname']
+        self.config = TargetConfig(config, ssh_settings)
+        self.ssh_client = SSHClient(self.config, SyncTransferHooks())
+        self.engine = TransferEngine(self.config, ssh_client=self.ssh_client)
+        self.remote_base = ssh_settings['remote_path'].replace("\\", "/")
+        self.present = set()  # File IDs seen in the last listing
+        self.files_sent = 0
+        self.bytes_sent = 0
+        self.failures = 0
+
+
+def load_targets(config):
+    """Build a SyncTarget for every enabled entry in the `targets` config section"""
+    targets = []
+    names = {PRIMARY_NAME}
+    for settings in config.get_targets():
+        if not settings.get('enabled', True):
+            continue
+        if not (settings.get('hostname') and settings.get('remote_path')):
+            logger.warning(f"Skipping incomplete sync target {settings.get('name', '')!r}")
+            continue
+        target = SyncTarget(config, settings)
+        if target.name in names:
+            logger.warning(f"Skipping sync target with duplicate name {target.name!r}")
+            continue
+        names.add(target.name)
+        targets.append(target)
+    return targets
@@ -1,10 +1,16 @@
+import json
+import os
 import sys
 import logging
 from PySide6.QtWidgets import QApplication
 from PySide6.QtCore import QSharedMemory, Qt
-from PySide6.QtNetwork import QLocalServer, QLocalSocket
+from PySide6.QtNetwork import QLocalSocket
 from ui.windows.main_window import MainWindow
 from core.config.config_manager import ConfigManager
+from core.ipc.framing import SERVER_NAME
+from core.ipc.server import ControlServer
+
+CONTROL_COMMANDS = ('--sync', '--flush', '--pause', '--resume', '--status', '--profile')
 
 # Setup logging
 logging.basicConfig(
@@ -22,14 +28,13 @@ class SingleApplication(QApplication):
         if self.shared_memory.create(1):
             # First instance - set up server
             self.is_first = True
-            self.server = QLocalServer()
-            self.server.listen('GOSyncServer')
-            self.server.newConnection.connect(self.handle_connection)
+            self.server = ControlServer(SERVER_NAME)
+            self.server.show_requested.connect(self.handle_connection)
         else:
             # Second instance - connect to first
             self.is_first = False
             socket = QLocalSocket()
-            socket.connectToServer('GOSyncServer')
+            socket.connectToServer(SERVER_NAME)
             if socket.waitForConnected(500):
                 socket.write(b'show')
                 socket.waitForBytesWritten()
@@ -37,15 +42,142 @@ class SingleApplication(QApplication):
     
     def handle_connection(self):
         """Handle connection from second instance"""
-        socket = self.server.nextPendingConnection()
-        if socket.waitForReadyRead(500):
-            # Show and raise main window
-            if hasattr(self, 'main_window'):
-                self.main_window.show()
-                self.main_window.raise_()
-                self.main_window.activateWindow()
+        # Show and raise main window
+        if hasattr(self, 'main_window'):
+            self.main_window.show()
+            self.main_window.raise_()
+            self.main_window.activateWindow()
+
+def probe_transport():
+    """One-shot throughput probe of cipher/compression options for the configured host"""
+    from core.ssh.negotiation import probe
+    
+    config = ConfigManager()
+    if not config.get_ssh_settings().get('hostname'):
+        print("No SSH host configured")
+        return 1
+    
+    results = probe(config, progress=print)
+    if not results:
+        print("No transport option could be measured")
+        return 1
+    best = results[0]
+    print(f"Fastest: {best['cipher']}, compression {'on' if best['compress'] else 'off'} "
+          f"({best['mb_per_s']:.1f} MB/s)")
+    return 0
+
+def dry_run():
+    """Print the sync plan for the configured folders without transferring anything"""
+    from core.ipc.broker_client import borrow_connection
+    from core.sync.sync_manager import SyncWorker
+    
+    config = ConfigManager()
+    if not config.get_ssh_settings().get('hostname'):
+        print("No SSH host configured")
+        return 1
+    
+    worker = SyncWorker(config)
+    if config.get_sync_settings().get('connection_broker', True):
+        worker.ssh_client.borrow_connection = borrow_connection
+    try:
+        plan = worker.build_sync_plan(worker.compare())
+    except Exception as e:
+        print(f"Dry run failed: {str(e)}")
+        return 1
+    finally:
+        worker.engine.shutdown()
+        worker.ssh_client.disconnect()
+    
+    if not plan.ops:
+        print("Nothing to sync")
+        return 0
+    for line in plan.describe():
+        print(line)
+    return 0
+
+def remote_exec(command):
+    """Run a command on the configured host, over the running instance's connection if possible"""
+    from core.ipc.broker_client import borrow_connection
+    from core.ssh.ssh_client import SSHClient
+    
+    config = ConfigManager()
+    if not config.get_ssh_settings().get('hostname'):
+        print("No SSH host configured")
+        return 1
+    
+    client = SSHClient(config)
+    if config.get_sync_settings().get('connection_broker', True):
+        client.borrow_connection = borrow_connection
+    try:
+        def _exec(ssh):
+            stdin, stdout, stderr = ssh.exec_command(command)
+            stdin.channel.shutdown_write()
+            output = stdout.read()
+            return stdout.channel.recv_exit_status(), output, stderr.read()
+        status, output, errors = client.run(_exec)
+    except Exception as e:
+        print(f"Command failed: {str(e)}")
+        return 1
+    finally:
+        client.disconnect()
+    
+    sys.stdout.buffer.write(output)
+    sys.stderr.buffer.write(errors)
+    return status
+
+def control_command(argv):
+    """Send a control request to the running instance and print its reply"""
+    from core.ipc.broker_client import BrokerUnavailable, request
+    
+    timeout = None
+    if '--timeout' in argv:
+        index = argv.index('--timeout')
+        timeout = float(argv[index + 1])
+        del argv[index:index + 2]
+    if '--sync' in argv:
+        paths = [os.path.abspath(path) for path in argv[argv.index('--sync') + 1:] if path != '--wait']
+        if not paths:
+            print("Usage: main.py --sync PATH... [--wait] [--timeout SECONDS]")
+            return 1
+        message = {'op': 'sync', 'paths': paths, 'wait': '--wait' in argv}
+    elif '--profile' in argv:
+        message = {'op': 'profile'}
+        if '--rate' in argv:
+            message['rate'] = float(argv[argv.index('--rate') + 1])
+        args = argv[argv.index('--profile') + 1:]
+        if args and args[0] == 'stop':
+            message['stop'] = True
+        elif args and not args[0].startswith('--'):
+            message['seconds'] = float(args[0])
+    else:
+        op = next(arg for arg in argv if arg in CONTROL_COMMANDS)[2:]
+        message = {'op': op}
+    if timeout:
+        message['timeout'] = timeout
+    
+    try:
+        # The server enforces the timeout; a little slack covers the round trip
+        reply = request(message, timeout=timeout + 5 if timeout else None)
+    except BrokerUnavailable as e:
+        print(str(e))
+        return 1
+    print(json.dumps(reply, indent=2))
+    return 0 if reply.get('ok') else 1
 
 def main():
+    if any(arg in CONTROL_COMMANDS for arg in sys.argv):
+        return control_command(sys.argv[1:])
+    if '--probe-transport' in sys.argv:
+        return probe_transport()
+    if '--dry-run' in sys.argv:
+        return dry_run()
+    if '--exec' in sys.argv:
+        index = sys.argv.index('--exec')
+        if index + 1 >= len(sys.argv):
+            print("Usage: main.py --exec COMMAND")
+            return 1
+        return remote_exec(' '.join(sys.argv[index + 1:]))
+    
     # Create application
     app = SingleApplication(sys.argv)
     
@@ -58,6 +190,18 @@ def main():
     # Create main window
     main_window = MainWindow(config)
     app.main_window = main_window  # Store reference for handle_connection
+    
+    # Lend our SSH connections to CLI runs and other local processes
+    if config.get_sync_settings().get('connection_broker', True):
+        from core.ipc.broker import ConnectionBroker
+        app.broker = ConnectionBroker(config)
+        app.broker.register(app.server)
+        app.aboutToQuit.connect(app.broker.shutdown)
+    
+    # Scriptable sync control (main.py --sync/--flush/--pause/--resume/--status/--profile)
+    from core.ipc.control import SyncControl
+    app.control = SyncControl(main_window.sync_manager, main_window.profiler)
+    app.control.register(app.server)
     main_window.show()
     
     # Start application
@@ -34,6 +34,32 @@ class FileListWidget(QListWidget):
             item = QListWidgetItem(file)
             self.addItem(item)
     
+    def update_from_table(self, table, ids):
+        """Update the list from file IDs in a PathTable"""
+        self.setUpdatesEnabled(False)
+        try:
+            self.clear()
+            for path in table.paths(ids):
+                self.addItem(QListWidgetItem(path))
+        finally:
+            self.setUpdatesEnabled(True)
+    
+    def apply_diff(self, added, removed):
+        """Add and remove individual paths without rebuilding the list"""
+        self.setUpdatesEnabled(False)
+        try:
+            removed = set(removed)
+            for row in range(self.count() - 1, -1, -1):
+                if self.item(row).text() in removed:
+                    self.takeItem(row)
+            present = {self.item(row).text() for row in range(self.count())}
+            for path in added:
+                if path not in present:
+                    self.addItem(QListWidgetItem(path))
+                    present.add(path)
+        finally:
+            self.setUpdatesEnabled(True)
+    
     def dragEnterEvent(self, event):
         if event.mimeData().hasUrls():
             event.accept()
@@ -1,13 +1,14 @@
 from PySide6.QtWidgets import (
     QDialog, QVBoxLayout, QHBoxLayout, QLabel,
-    QLineEdit, QPushButton, QTextEdit, QFileDialog
+    QLineEdit, QPushButton, QTextEdit, QFileDialog, QCheckBox
 )
 from PySide6.QtCore import Qt, QFile
 
 class SettingsDialog(QDialog):
-    def __init__(self, config, parent=None):
+    def __init__(self, config, parent=None, profiler=None):
         super().__init__(parent)
         self.config = config
+        self.profiler = profiler
         self.setup_ui()
         self.load_stylesheet()
         self.load_settings()
@@ -67,6 +68,11 @@ class SettingsDialog(QDialog):
         password_layout.addWidget(self.password_input)
         layout.addLayout(password_layout)
         
+        # Profiling (samples the sync threads into the logs folder)
+        self.profile_checkbox = QCheckBox("Profile sync threads (writes a flame graph to the logs folder)")
+        self.profile_checkbox.setVisible(self.profiler is not None)
+        layout.addWidget(self.profile_checkbox)
+        
         # Buttons
         button_layout = QHBoxLayout()
         save_button = QPushButton("Save")
@@ -83,7 +89,7 @@ class SettingsDialog(QDialog):
             QDialog {
                 background-color: #1a1a1a;
             }
-            QLabel {
+            QLabel, QCheckBox {
                 color: #FFFFFF;
             }
             QLineEdit, QTextEdit {
@@ -126,6 +132,8 @@ class SettingsDialog(QDialog):
         self.remote_path_input.setText(ssh_settings.get('remote_path', ''))
         self.ssh_key_input.setText(ssh_settings.get('ssh_key', ''))
         self.password_input.setText(ssh_settings.get('password', ''))
+        if self.profiler is not None:
+            self.profile_checkbox.setChecked(self.profiler.is_running())
     
     def save_settings(self):
         """Save settings"""
@@ -137,15 +145,27 @@ class SettingsDialog(QDialog):
             'password': self.password_input.text()
         }
         
-        sync_settings = {
+        # Keep advanced sync options that have no widget here
+        sync_settings = dict(self.config.get_sync_settings())
+        sync_settings.update({
             'local_path': self.local_path_input.text(),
             'auto_sync': True,  # Default to auto-sync enabled
-            'sync_interval': 300  # 5 minutes default
-        }
+        })
+        sync_settings.setdefault('sync_interval', 300)  # Upper bound for the adaptive scheduler
         
         self.config.save_ssh_settings(ssh_settings)
         self.config.save_sync_settings(sync_settings)
+        self.apply_profiling()
         self.accept()
+    
+    def apply_profiling(self):
+        """Start or stop a profile to match the checkbox"""
+        if self.profiler is None:
+            return
+        if self.profile_checkbox.isChecked() and not self.profiler.is_running():
+            self.profiler.start()
+        elif not self.profile_checkbox.isChecked() and self.profiler.is_running():
+            self.profiler.stop()
 
     def load_stylesheet(self):
         """Load the application stylesheet"""
@@ -8,8 +8,10 @@ from PySide6.QtGui import QIcon
 from ui.widgets.file_list_widget import FileListWidget
 from ui.widgets.settings_dialog import SettingsDialog
 from ui.widgets.tray_icon import SystemTrayIcon
+from core.sync.snapshots import SyncTransferHooks
 from core.sync.sync_manager import SyncManager
-from core.ssh.file_transfer import FileTransferManager
+from core.ssh.transfer_queue import TransferQueue
+from utils.profiler import SamplingProfiler
 import logging
 import os
 import sys
@@ -31,11 +33,15 @@ class MainWindow(QMainWindow):
         super().__init__(parent)
         self.config = config
         self.sync_manager = SyncManager(config)
-        self.file_transfer = None  # Will be initialized when needed
+        self.profiler = SamplingProfiler(config)
+        self.transfer_queue = None  # Will be initialized when needed
         
         self.setWindowTitle("GOSync")
         self.load_stylesheet()
         self.setup_ui()
+        self.sync_manager.files_updated.connect(self.on_files_updated)
+        self.sync_manager.listing_changed.connect(self.on_listing_changed)
+        self.sync_manager.target_progress.connect(self.on_target_progress)
         self.setup_signals()
         self.setup_tray()
         
@@ -164,7 +170,6 @@ class MainWindow(QMainWindow):
         if self.sync_manager.sync_worker:
             self.sync_manager.sync_worker.sync_complete.connect(self.on_sync_complete)
             self.sync_manager.sync_worker.sync_progress.connect(self.on_sync_progress)
-            self.sync_manager.sync_worker.files_updated.connect(self.on_files_updated)
             
             if self.sync_manager.sync_worker.ssh_client and self.sync_manager.sync_worker.ssh_client.worker:
                 worker = self.sync_manager.sync_worker.ssh_client.worker
@@ -203,7 +208,7 @@ class MainWindow(QMainWindow):
     
     def show_settings(self):
         """Show settings dialog"""
-        dialog = SettingsDialog(self.config, self)
+        dialog = SettingsDialog(self.config, self, profiler=self.profiler)
         if dialog.exec():
             self.status_bar.showMessage("Settings saved")
             # Auto-start sync if it wasn't running
@@ -221,10 +226,19 @@ class MainWindow(QMainWindow):
         """Handle sync progress update"""
         self.status_bar.showMessage(message)
     
-    def on_files_updated(self, local_files, remote_files):
+    def on_target_progress(self, name, sent, total):
+        """Show fan-out progress for an additional target"""
+        self.status_bar.showMessage(f"{name}: {sent} of {total} files")
+    
+    def on_files_updated(self, table, local_ids, remote_ids):
         """Update file lists"""
-        self.local_files.update_files(local_files)
-        self.remote_files.update_files(remote_files)
+        self.local_files.update_from_table(table, local_ids)
+        self.remote_files.update_from_table(table, remote_ids)
+    
+    def on_listing_changed(self, side, added, removed):
+        """Apply an incremental change to one file list"""
+        file_list = self.local_files if side == 'local' else self.remote_files
+        file_list.apply_diff(added, removed)
     
     def on_ssh_connected(self, success, message):
         """Handle SSH connection status"""
@@ -252,12 +266,17 @@ class MainWindow(QMainWindow):
         menu = QMenu()
         upload_action = menu.addAction("Upload to Server")
         delete_action = menu.addAction("Delete")
+        cancel_action = None
+        if self.transfer_queue and self.transfer_queue.is_busy():
+            cancel_action = menu.addAction("Cancel Transfers")
         
         action = menu.exec_(self.local_files.mapToGlobal(position))
         if action == upload_action:
             self.upload_selected_files()
         elif action == delete_action:
             self.delete_local_files()
+        elif cancel_action is not None and action == cancel_action:
+            self.cancel_transfers()
     
     def show_remote_context_menu(self, position):
         """Show context menu for remote files"""
@@ -268,67 +287,57 @@ class MainWindow(QMainWindow):
         menu = QMenu()
         download_action = menu.addAction("Download to Local")
         refresh_action = menu.addAction("Refresh File List")
+        cancel_action = None
+        if self.transfer_queue and self.transfer_queue.is_busy():
+            cancel_action = menu.addAction("Cancel Transfers")
         
         action = menu.exec_(self.remote_files.mapToGlobal(position))
         if action == download_action:
             self.download_selected_files()
+        elif cancel_action is not None and action == cancel_action:
+            self.cancel_transfers()
         elif action == refresh_action:
-            self.sync_manager.sync_now()  # Refresh the file list
+            self.sync_manager.refresh_listing()
+    
+    def _get_transfer_queue(self):
+        """Create the background transfer queue on first use"""
+        if not self.transfer_queue:
+            self.transfer_queue = TransferQueue(self.config, hooks=SyncTransferHooks())
+            self.transfer_queue.item_status.connect(self.on_transfer_status)
+            self.transfer_queue.queue_progress.connect(self.on_transfer_queue_progress)
+            self.transfer_queue.batch_complete.connect(self.on_transfer_batch_complete)
+        return self.transfer_queue
     
     def download_selected_files(self):
-        """Download selected files from remote server"""
+        """Queue selected remote files for download"""
         selected_items = self.remote_files.selectedItems()
         if not selected_items:
             return
         
-        # Initialize file transfer manager if needed
-        if not self.file_transfer:
-            self.file_transfer = FileTransferManager(self.sync_manager.sync_worker.ssh_client)
-            self.file_transfer.transfer_progress.connect(self.on_transfer_progress)
-            self.file_transfer.transfer_complete.connect(self.on_transfer_complete)
-        
+        transfer_queue = self._get_transfer_queue()
         sync_settings = self.config.get_sync_settings()
         local_path = Path(sync_settings['local_path'])
         
         # Get remote base path
         ssh_settings = self.config.get_ssh_settings()
-        remote_base = Path(ssh_settings['remote_path'])
+        remote_base = ssh_settings['remote_path']
         
         for item in selected_items:
-            try:
-                remote_file = item.text()
-                local_file = local_path / remote_file
-                
-                # Construct full remote path
-                full_remote_path = str(remote_base / remote_file).replace('\\', '/')
-                logger.info(f"Attempting to download: {full_remote_path}")
-                
-                # Start download
-                self.progress_bar.setVisible(True)
-                self.progress_bar.setRange(0, 0)  # Indeterminate progress
-                self.file_transfer.download_file(full_remote_path, local_file)
-                
-            except Exception as e:
-                logger.error(f"Error downloading {remote_file}: {str(e)}")
-                QMessageBox.warning(
-                    self,
-                    "Download Error",
-                    f"Failed to download '{remote_file}': {str(e)}",
-                    QMessageBox.Ok
-                )
+            remote_file = item.text()
+            local_file = local_path / remote_file
+            
+            # Construct full remote path
+            full_remote_path = os.path.join(remote_base, remote_file).replace('\\', '/')
+            logger.info(f"Queueing download: {full_remote_path}")
+            transfer_queue.download(full_remote_path, local_file)
     
     def upload_selected_files(self):
-        """Upload selected files to server"""
+        """Queue selected local files for upload"""
         selected_items = self.local_files.selectedItems()
         if not selected_items:
             return
         
-        # Initialize file transfer manager if needed
-        if not self.file_transfer:
-            self.file_transfer = FileTransferManager(self.sync_manager.sync_worker.ssh_client)
-            self.file_transfer.transfer_progress.connect(self.on_transfer_progress)
-            self.file_transfer.transfer_complete.connect(self.on_transfer_complete)
-        
+        transfer_queue = self._get_transfer_queue()
         sync_settings = self.config.get_sync_settings()
         local_path = Path(sync_settings['local_path'])
         ssh_settings = self.config.get_ssh_settings()
@@ -337,24 +346,43 @@ class MainWindow(QMainWindow):
         for item in selected_items:
             local_file = local_path / item.text()
             remote_file = os.path.join(remote_base, item.text()).replace('\\', '/')
-            
-            # Start upload
-            self.progress_bar.setVisible(True)
-            self.progress_bar.setRange(0, 0)  # Indeterminate progress
-            self.file_transfer.upload_file(local_file, remote_file)
+            transfer_queue.upload(local_file, remote_file)
     
-    def on_transfer_progress(self, message):
-        """Handle file transfer progress"""
-        self.status_bar.showMessage(message)
+    def cancel_transfers(self):
+        """Cancel all queued and running transfers"""
+        if self.transfer_queue:
+            self.transfer_queue.cancel_all()
+            self.status_bar.showMessage("Cancelling transfers...")
+    
+    def on_transfer_status(self, item_id, status, message):
+        """Handle per-item transfer status"""
+        if status == 'failed':
+            self.status_bar.showMessage(message, 10000)
+        elif status == 'running':
+            self.status_bar.showMessage(f"Transferring {message}...")
     
-    def on_transfer_complete(self, success, message):
-        """Handle file transfer completion"""
+    def on_transfer_queue_progress(self, finished, total):
+        """Show batch progress"""
+        self.progress_bar.setVisible(True)
+        self.progress_bar.setRange(0, total)
+        self.progress_bar.setValue(finished)
+    
+    def on_transfer_batch_complete(self, items):
+        """Handle completion of a whole transfer batch"""
         self.progress_bar.setVisible(False)
-        self.status_bar.showMessage(message, 5000 if success else 10000)
-        
-        if success:
-            # Refresh file lists
-            self.sync_manager.sync_now()
+        done = sum(1 for item in items if item.status == 'done')
+        failed = sum(1 for item in items if item.status == 'failed')
+        cancelled = len(items) - done - failed
+        message = f"Transferred {done} of {len(items)} files"
+        if failed:
+            message += f", {failed} failed"
+        if cancelled:
+            message += f", {cancelled} cancelled"
+        self.status_bar.showMessage(message, 5000 if not failed else 10000)
+        
+        if done:
+            # The outcome of each transfer is known; no need to rescan both sides
+            self.sync_manager.apply_transfer_results(items)
     
     def delete_local_files(self):
         """Delete selected local files"""
@@ -403,7 +431,9 @@ class MainWindow(QMainWindow):
     
     def quit_application(self):
         """Quit the application properly"""
-        self.sync_manager.stop_sync()
+        if self.transfer_queue:
+            self.transfer_queue.shutdown()
+        self.sync_manager.shutdown()
         self.tray_icon.hide()
         self.close()
         QApplication.quit() 
\ No newline at end of file
@@ -0,0 +1,170 @@
+import logging
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from pathlib import Path
+
+logger = logging.getLogger('GOSync')
+
+LOG_DIR = Path.home() / '.gosync' / 'logs'
+PROFILED_WORKERS = ('SyncWorker', 'SSHWorker')  # QThread classes whose run() roots a sampled stack
+PROFILED_POOL_PREFIX = 'GOSync'  # thread_name_prefix of the compare, cipher, fanout and engine pools
+MAX_RATE = 1000  # Samples per second
+TOP_ALLOCATORS = 30
+
+
+def _frame_label(code):
+    return f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """Samples the sync threads' stacks on demand, without restarting GOSync.
+
+    A daemon thread reads sys._current_frames() `rate` times a second for
+    `seconds` and counts the stacks of SyncWorker and SSHWorker threads and
+    of the sync thread pools. The counts are written to the logs directory
+    as collapsed stacks (`thread;frame;frame count`, the input format of
+    flamegraph.pl and speedscope), together with the tracemalloc lines that
+    allocated the most memory during the run.
+    """
+
+    def __init__(self, config=None, log_dir=LOG_DIR):
+        self.config = config
+        self.log_dir = Path(log_dir)
+        self.last_result = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._paths = None
+
+    def is_running(self):
+        """Check whether a profile is being recorded"""
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, seconds=None, rate=None):
+        """Record a profile in the background; returns the paths it will write"""
+        settings = self.config.get_sync_settings() if self.config else {}
+        seconds = float(seconds or settings.get('profile_seconds', 30))
+        rate = float(rate or settings.get('profile_rate', 100))
+        if seconds <= 0:
+            raise ValueError("Profile duration must be positive")
+        if not 0 < rate <= MAX_RATE:
+            raise ValueError(f"Sample rate must be between 0 and {MAX_RATE} per second")
+        with self._lock:
+            if self.is_running():
+                raise RuntimeError("A profile is already being recorded")
+            self.log_dir.mkdir(parents=True, exist_ok=True)
+            stamp = time.strftime('%Y%m%d-%H%M%S')
+            self._paths = {
+                'stacks': str(self.log_dir / f'profile-{stamp}.folded'),
+                'allocations': str(self.log_dir / f'profile-{stamp}.alloc.txt'),
+            }
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, args=(seconds, rate, dict(self._paths)),
+                                            name='Profiler', daemon=True)
+            self._thread.start()
+        logger.info(f"Profiling sync threads for {seconds:g}s at {rate:g} Hz")
+        return dict(self._paths)
+
+    def stop(self):
+        """End the current profile early; its files are still written"""
+        self._stop.set()
+
+    def status(self):
+        """Current state and the last finished profile as a dict"""
+        return {
+            'running': self.is_running(),
+            'paths': dict(self._paths) if self.is_running() else None,
+            'last': self.last_result,
+        }
+
+    def _run(self, seconds, rate, paths):
+        started_tracing = not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        try:
+            baseline = tracemalloc.take_snapshot()
+            started = time.monotonic()
+            stacks, samples = self._sample(started + seconds, 1.0 / rate)
+            elapsed = time.monotonic() - started
+            allocations = tracemalloc.take_snapshot()
+            self._write_stacks(paths['stacks'], stacks)
+            self._write_allocations(paths['allocations'], allocations, baseline, elapsed, samples)
+            self.last_result = dict(paths, samples=samples, seconds=round(elapsed, 3),
+                                    finished=time.time())
+            if not stacks:
+                logger.warning("Profile recorded no samples: no sync threads were running")
+            logger.info(f"Profile written to {paths['stacks']} ({samples} samples)")
+        except Exception as e:
+            logger.error(f"Profiler failed: {str(e)}")
+        finally:
+            if started_tracing:
+                tracemalloc.stop()
+
+    def _sample(self, deadline, interval):
+        own = threading.get_ident()
+        labels = {}  # Root code object -> thread label, None for threads not sampled
+        stacks = Counter()
+        samples = 0
+        tick = time.monotonic()
+        while not self._stop.is_set() and tick < deadline:
+            for label, codes in self._take_sample(own, labels):
+                stacks[';'.join([label] + [_frame_label(code) for code in reversed(codes)])] += 1
+            samples += 1
+            tick += interval
+            self._stop.wait(max(0.0, tick - time.monotonic()))
+        return stacks, samples
+
+    def _take_sample(self, own, labels):
+        """The code objects on each sampled thread's stack, innermost first.
+
+        Frame objects must not outlive this call: holding another thread's
+        frame while it returns crashes PySide, so only code objects are kept.
+        """
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        sample = []
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            codes = [frame.f_code]
+            while frame.f_back is not None:
+                frame = frame.f_back
+                codes.append(frame.f_code)
+            label = self._thread_label(frame, names.get(ident, ''), labels)
+            if label is not None:
+                sample.append((label, codes))
+        return sample
+
+    def _thread_label(self, root, name, labels):
+        """Name a thread worth sampling, or None to skip it"""
+        if name.startswith(PROFILED_POOL_PREFIX):
+            return name.rsplit('_', 1)[0]
+        if root.f_code in labels:
+            return labels[root.f_code]
+        label = None
+        if root.f_code.co_name == 'run':
+            # QThreads are unknown to the threading module; their Python stack starts in run()
+            worker = root.f_locals.get('self')
+            for cls in type(worker).__mro__:
+                if cls.__name__ in PROFILED_WORKERS:
+                    label = cls.__name__
+                    break
+        labels[root.f_code] = label
+        return label
+
+    def _write_stacks(self, path, stacks):
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in sorted(stacks.items()):
+                f.write(f"{stack} {count}\n")
+
+    def _write_allocations(self, path, snapshot, baseline, elapsed, samples):
+        ignore = (tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__))
+        snapshot = snapshot.filter_traces(ignore)
+        baseline = baseline.filter_traces(ignore)
+        stats = snapshot.compare_to(baseline, 'lineno')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(f"# Top {TOP_ALLOCATORS} allocating lines over {elapsed:.1f}s ({samples} stack samples)\n")
+            for stat in stats[:TOP_ALLOCATORS]:
+                f.write(f"{stat}\n")